@@ -0,0 +1,94 @@
+from typing import Type
+
+from sqlalchemy import case, update
+from sqlalchemy.orm import Session
+
+from models import Category, Post, Topic
+
+
+def _later_post(model, post: Type[Post]) -> dict:
+    """
+    SET values moving the last post forward to the post, unless a later one committed first
+    """
+    is_later = model.last_post_id.is_(None) | (model.last_post_id < post.id)
+    return\
+    {
+        model.last_post_id: case((is_later, post.id), else_=model.last_post_id),
+        model.last_post_at: case((is_later, post.created_at), else_=model.last_post_at)
+    }
+
+def count_new_post(post: Type[Post], db: Session) -> None:
+    """
+    Updates the activity summary of the post's topic and category after it was flushed, the caller commits.
+    The first post of a topic opens it, every other one is a reply
+    """
+    # In place and returning the new count, so concurrent posts can't both count as the opening one
+    post_count = db.execute\
+    (
+        update(Topic).where(Topic.id.__eq__(post.topic_id)).values
+        ({
+            Topic.post_count: Topic.post_count + 1,
+            Topic.reply_count: Topic.reply_count + case((Topic.post_count > 0, 1), else_=0),
+            **_later_post(Topic, post)
+        }).returning(Topic.post_count)
+    ).scalar()
+
+    db.execute\
+    (
+        update(Category).where(Category.id.__eq__(post.category_id)).values
+        ({
+            Category.post_count: Category.post_count + 1,
+            Category.reply_count: Category.reply_count + (1 if post_count > 1 else 0),
+            **_later_post(Category, post)
+        })
+    )
+
+def count_deleted_post(post: Type[Post], db: Session) -> None:
+    """
+    Updates the activity summaries after the post was deleted (and flushed), the caller commits.
+    When it was the last post, the previous one takes its place
+    """
+    topic = db.execute\
+    (
+        update(Topic).where(Topic.id.__eq__(post.topic_id)).values
+        ({
+            Topic.post_count: Topic.post_count - 1,
+            # With posts left the next one opens the topic, so one reply less
+            Topic.reply_count: Topic.reply_count - case((Topic.post_count > 1, 1), else_=0)
+        }).returning(Topic.post_count, Topic.last_post_id)
+    ).first()
+
+    category = db.execute\
+    (
+        update(Category).where(Category.id.__eq__(post.category_id)).values
+        ({
+            Category.post_count: Category.post_count - 1,
+            Category.reply_count: Category.reply_count - (1 if topic.post_count > 0 else 0)
+        }).returning(Category.last_post_id)
+    ).first()
+
+    if topic.last_post_id == post.id:
+        previous = db.query(Post.id, Post.created_at).filter(Post.topic_id.__eq__(post.topic_id))\
+            .order_by(Post.id.desc()).first()
+        db.query(Topic).filter(Topic.id.__eq__(post.topic_id)).update\
+        (
+            {
+                Topic.last_post_id: previous.id if previous else None,
+                Topic.last_post_at: previous.created_at if previous else None
+            },
+            synchronize_session=False
+        )
+
+    if category.last_post_id == post.id:
+        # The category's latest post is the latest of its topics' last posts
+        previous = db.query(Topic.last_post_id, Topic.last_post_at)\
+            .filter(Topic.category_id.__eq__(post.category_id), Topic.last_post_id.isnot(None))\
+            .order_by(Topic.last_post_id.desc()).first()
+        db.query(Category).filter(Category.id.__eq__(post.category_id)).update\
+        (
+            {
+                Category.last_post_id: previous.last_post_id if previous else None,
+                Category.last_post_at: previous.last_post_at if previous else None
+            },
+            synchronize_session=False
+        )
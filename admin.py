@@ -1,24 +1,84 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, File, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
 
+from db import get_db, db_route, engine, async_engine, pool_status
+from bulk_import import TABLES, DEFAULT_BATCH_SIZE, import_upload
 from models import Users
-from schemas import AdminResponse
-from utils import get_admin
+from replicas import replica_set
+from ratelimit import admission
+from schemas import AdminResponse, AdmissionStatsSchema, DatabasePoolsSchema, ImportReportSchema, StartupReportSchema
+from utils import CurrentUser, get_admin, not_found
+from versions import versions
+from warmup import startup_report
 
 router = APIRouter(
     tags=["admin"]
 )
 
 @router.get("/", response_model=AdminResponse)
-def admin_access_test(admin: Users = Depends(get_admin)) -> AdminResponse:
+@db_route
+def admin_access_test(admin: CurrentUser = Depends(get_admin),
+                      db: Session = Depends(get_db)
+) -> AdminResponse:
     """
     Initial admin page (probably wrong because it's more FE-focused)
     """
+    # The cached principal only holds id/username/admin, the profile is loaded on demand
+    profile = db.query(Users).filter(Users.id.__eq__(admin.id)).first()
+
     result = AdminResponse\
     (
-        username=admin.username,
-        email=admin.email,
-        age=admin.age,
-        nickname=admin.nickname,
-        admin=admin.admin
+        username=profile.username,
+        email=profile.email,
+        age=profile.age,
+        nickname=profile.nickname,
+        admin=profile.admin
+    )
+    return result
+
+@router.get("/pool", response_model=DatabasePoolsSchema)
+def get_pool_status(admin: CurrentUser = Depends(get_admin)) -> DatabasePoolsSchema:
+    """
+    Connection pool usage (primary and replicas with their health): checked-out connections, overflow, checkout waits/timeouts and time spent waiting
+    """
+    return DatabasePoolsSchema\
+    (
+        primary=pool_status(engine.pool),
+        primary_async=pool_status(async_engine.pool) if async_engine else None,
+        replicas=[replica.status() for replica in replica_set.replicas]
     )
-    return result
\ No newline at end of file
+
+@router.get("/limits", response_model=AdmissionStatsSchema)
+def get_admission_stats(admin: CurrentUser = Depends(get_admin)) -> dict:
+    """
+    Write requests in flight per route class and the requests this worker rejected, by route class and reason
+    """
+    return admission.stats()
+
+@router.get("/startup", response_model=StartupReportSchema)
+def get_startup_report(admin: CurrentUser = Depends(get_admin)) -> dict:
+    """
+    How long this worker took to start (warm-up steps included) and to serve its first request
+    """
+    return startup_report
+
+@router.post("/import/{table}", response_model=ImportReportSchema)
+async def bulk_import(table: str,
+                      file: UploadFile = File(...),
+                      file_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+                      batch_size: int = Query(DEFAULT_BATCH_SIZE, ge=1, le=50000),
+                      skip: int = Query(0, ge=0),
+                      admin: CurrentUser = Depends(get_admin)
+) -> dict:
+    """
+    Bulk imports an NDJSON/CSV file into users, categories, topics, posts or post_interactions.
+    Rows keep their ids, existing ids are skipped. To resume a failed import pass the processed count as skip
+    """
+    if table not in TABLES:
+        raise not_found
+
+    # Long running and CPU heavy, so always on the sync engine in a worker thread even in async mode
+    report = await run_in_threadpool(import_upload, table, file.file, file_format, batch_size, skip)
+    versions.bump_all()
+    return report
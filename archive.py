@@ -0,0 +1,206 @@
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Type
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Query, Session
+
+from cache import TTLCache
+from encoding import dumps
+from models import ArchivedPost, ArchivedTopic, Category, CategoryAccessPrivilege, Post, PostInteraction, Topic
+from search import search_backend
+from utils import CurrentUser, access_denied, is_category_visible, not_found
+
+ARCHIVE_CACHE_SIZE = int(os.getenv("ARCHIVE_CACHE_SIZE", "256"))  # decompressed archived topics kept per worker
+ARCHIVE_CACHE_TTL = float(os.getenv("ARCHIVE_CACHE_TTL", "600"))  # seconds, archived topics never change
+ARCHIVE_IDLE_DAYS = float(os.getenv("ARCHIVE_IDLE_DAYS", "365"))  # topics without a post for this long are cold
+ARCHIVE_FORMAT = 2  # 2 added the posts' created_at, format 1 topics load without it
+
+topic_archived = HTTPException\
+(
+        status_code=409,
+        detail="This topic is archived and read-only."
+)
+
+
+class ArchivedTopicData:
+    """
+    A decompressed archived topic: its posts in id order (the PostSchema fields), their creation times,
+    vote counters and votes
+    """
+
+    def __init__(self, data: dict):
+        # Format 1 topics were archived without the creation times
+        self.created_at: dict[int, datetime] = \
+        {
+            post["id"]: datetime.fromisoformat(post["created_at"]) for post in data["posts"] if "created_at" in post
+        }
+        self.posts: list[dict] = [{key: value for key, value in post.items() if key != "created_at"}
+                                  for post in data["posts"]]
+        self.counters: dict[int, tuple[int, int]] = {post_id: (up, down) for post_id, up, down in data["counters"]}
+        self.votes: dict[tuple[int, int], bool] = {(post_id, user_id): vote for post_id, user_id, vote in data["votes"]}
+        self._by_id = {post["id"]: post for post in self.posts}
+
+    def post(self, post_id: int) -> Type[Post] | None:
+        """
+        Returns the post as a transient Post (never added to a session), for the code serving live posts
+        """
+        post = self._by_id.get(post_id)
+        if post is None:
+            return None
+        upvotes, downvotes = self.counters[post_id]
+        return Post(**post, created_at=self.created_at.get(post_id),
+                    upvotes=upvotes, downvotes=downvotes, score=upvotes - downvotes)
+
+
+archive_cache = TTLCache(maxsize=ARCHIVE_CACHE_SIZE, ttl=ARCHIVE_CACHE_TTL)
+
+def load_archived_topic(topic_id: int, db: Session) -> ArchivedTopicData:
+    archived = archive_cache.get(topic_id)
+    if archived is None:
+        blob = db.query(ArchivedTopic.data).filter(ArchivedTopic.topic_id.__eq__(topic_id)).scalar()
+        if blob is None:
+            raise not_found
+        archived = ArchivedTopicData(orjson.loads(zlib.decompress(blob)))
+        archive_cache.set(topic_id, archived)
+    return archived
+
+def archived_posts_query(user: CurrentUser, db: Session) -> Query:
+    """
+    Archived posts with their topic, category and the user's privilege for it, see check_archived_access
+    """
+    return db.query\
+    (
+        ArchivedPost.post_id,
+        ArchivedPost.topic_id,
+        Topic.category_id.label("topic_category_id"),
+        Category.id.label("found_category_id"),
+        Category.visibility,
+        CategoryAccessPrivilege.permission_type
+    )\
+    .outerjoin(Topic, Topic.id.__eq__(ArchivedPost.topic_id))\
+    .outerjoin(Category, Category.id.__eq__(Topic.category_id))\
+    .outerjoin\
+    (
+        CategoryAccessPrivilege,
+        and_(CategoryAccessPrivilege.category_id.__eq__(Category.id), CategoryAccessPrivilege.user_id.__eq__(user.id))
+    )
+
+def load_archived_row(row: Row, user: CurrentUser, db: Session) -> tuple[Type[Post], int, bool | None]:
+    """
+    Checks the access to an archived_posts_query row with get_visible_post's rules and loads the post from its topic
+    """
+    if row.topic_category_id is None:
+        raise not_found
+    if row.found_category_id is None or not is_category_visible(user, row.visibility, row.permission_type):
+        raise access_denied
+
+    archived = load_archived_topic(row.topic_id, db)
+    post = archived.post(row.post_id)
+    if post is None:
+        raise not_found
+    return post, row.topic_category_id, archived.votes.get((row.post_id, user.id))
+
+def get_archived_post(post_id: int, user: CurrentUser, db: Session) -> tuple[Type[Post], int, bool | None]:
+    """
+    get_visible_post for archived posts: the post, its topic's category id and the user's vote,
+    or not_found/access_denied with the same rules
+    """
+    row = archived_posts_query(user, db).filter(ArchivedPost.post_id.__eq__(post_id)).first()
+    if not row:
+        raise not_found
+    return load_archived_row(row, user, db)
+
+def get_archived_posts(post_ids: list[int], user: CurrentUser, db: Session
+) -> dict[int, tuple[Type[Post], int, bool | None] | HTTPException]:
+    """
+    get_archived_post for many posts with one query, each topic decompressed once.
+    Maps every archived id to its result or the error it raised, ids that aren't archived are left out
+    """
+    results = {}
+    for row in archived_posts_query(user, db).filter(ArchivedPost.post_id.in_(post_ids)):
+        try:
+            results[row.post_id] = load_archived_row(row, user, db)
+        except HTTPException as error:
+            results[row.post_id] = error
+    return results
+
+def lock_unarchived_topic(topic_id: int, db: Session) -> None:
+    """
+    Share-locks the topic until the caller commits so archive_topic can't move its posts meanwhile,
+    raises topic_archived if it was archived already
+    """
+    archived = db.query(Topic.archived).filter(Topic.id.__eq__(topic_id)).with_for_update(read=True).scalar()
+    if archived:
+        raise topic_archived
+
+def archive_topic(topic_id: int, db: Session) -> int:
+    """
+    Moves the topic's posts and their votes into one compressed archived_topics row and marks the topic archived.
+    Returns the number of archived posts, 0 if the topic was archived already
+    """
+    # Locked so posts and votes can't be added while they're moved: add_post and synchronous votes share-lock the
+    # topic first, so they either commit before this lock is granted or wait for it and see the topic archived
+    topic = db.query(Topic).filter(Topic.id.__eq__(topic_id)).with_for_update().first()
+    if not topic:
+        raise not_found
+    if topic.archived:
+        return 0
+
+    # Post rows are locked too, a buffered vote flushing meanwhile then finds its post gone and is dropped
+    posts = db.query(Post.id, Post.content, Post.user_id, Post.topic_id, Post.category_id, Post.created_at,
+                     Post.upvotes, Post.downvotes)\
+        .filter(Post.topic_id.__eq__(topic_id)).order_by(Post.id).with_for_update().all()
+    votes = db.query(PostInteraction.post_id, PostInteraction.user_id, PostInteraction.vote)\
+        .join(Post, Post.id.__eq__(PostInteraction.post_id))\
+        .filter(Post.topic_id.__eq__(topic_id)).all()
+
+    data =\
+    {
+        "format": ARCHIVE_FORMAT,
+        "posts":
+        [
+            {"id": post.id, "content": post.content, "user_id": post.user_id,
+             "topic_id": post.topic_id, "category_id": post.category_id, "created_at": post.created_at.isoformat()}
+            for post in posts
+        ],
+        "counters": [[post.id, post.upvotes, post.downvotes] for post in posts],
+        "votes": [[vote.post_id, vote.user_id, vote.vote] for vote in votes]
+    }
+
+    archived = ArchivedTopic\
+    (
+        topic_id=topic_id,
+        post_count=len(posts),
+        archived_at=datetime.now(timezone.utc),
+        data=zlib.compress(dumps(data), 9)
+    )
+    db.add(archived)
+    topic_post_ids = select(Post.id).where(Post.topic_id.__eq__(topic_id))
+    db.execute(insert(ArchivedPost).from_select(["post_id", "topic_id"], select(Post.id, Post.topic_id)
+                                                .where(Post.topic_id.__eq__(topic_id))))
+    db.execute(delete(PostInteraction).where(PostInteraction.post_id.in_(topic_post_ids)))
+    db.execute(delete(Post).where(Post.topic_id.__eq__(topic_id)))
+    topic.archived = True
+    db.commit()
+    # Archived posts aren't searchable, with either backend
+    for post in posts:
+        search_backend.remove_post(post.id)
+    return len(posts)
+
+def find_cold_topics(db: Session, idle_days: float = ARCHIVE_IDLE_DAYS, limit: int = 100) -> list[int]:
+    """
+    Returns ids of topics with posts to archive, least recently active first: locked ones and those without
+    a post in idle_days. Reads the topics' last-activity summary, posts aren't scanned
+    """
+    idle_since = datetime.now(timezone.utc) - timedelta(days=idle_days)
+    rows = db.query(Topic.id)\
+        .filter(Topic.archived.is_(False), Topic.post_count > 0)\
+        .filter(or_(Topic.locked.is_(True), Topic.last_post_at < idle_since))\
+        .order_by(Topic.last_post_id)\
+        .limit(limit).all()
+    return [row.id for row in rows]
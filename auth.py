@@ -3,10 +3,12 @@ from datetime import date
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, APIRouter, Depends, Form
 
-from db import get_db
+from db import get_db, run_db
 from models import Users
+from ratelimit import limit, AUTH
+from passwords import hash_password_async, verify_password_async, needs_rehash
 from schemas import RegisterResponse, UserCreate, LoginResponse
-from utils import hash_password, create_access_token
+from utils import create_access_token, invalidate_user
 
 router = APIRouter(
     tags=["auth"]
@@ -26,20 +28,10 @@ def verify_unique(db: Session, user: UserCreate) -> None:
     if email_check:
         raise invalid_credentials
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def create_user(db: Session, user: UserCreate, hashed_password: str) -> None:
     """
-    Verifies if a hashed password matches with the provided non-hashed one
+    Stores a new user with an already hashed password
     """
-    return hash_password(plain_password) == hashed_password
-
-@router.post("/register", response_model=RegisterResponse)
-def register_user(user: UserCreate, db: Session = Depends(get_db)) -> RegisterResponse:
-    """
-    Creating a new user
-    """
-    verify_unique(db, user)
-    hashed_password = hash_password(user.password)
-
     new_user = Users\
     (
         username=user.username,
@@ -53,23 +45,58 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)) -> RegisterRe
 
     db.add(new_user)
     db.commit()
-    db.refresh(new_user)
+
+def upgrade_password_hash(db: Session, user_id: int, username: str, old_hash: str, new_hash: str) -> None:
+    """
+    Replaces a user's outdated password hash, unless it was changed in the meantime
+    """
+    db.query(Users).filter\
+    (
+        Users.id.__eq__(user_id),
+        Users.hashed_password.__eq__(old_hash)
+    ).update({Users.hashed_password: new_hash}, synchronize_session=False)
+    db.commit()
+    # A bulk update skips the ORM events that invalidate cached principals
+    invalidate_user(username)
+
+@router.post("/register", response_model=RegisterResponse, dependencies=[Depends(limit(AUTH, per_user=False))])
+async def register_user(user: UserCreate, db: Session = Depends(get_db)) -> RegisterResponse:
+    """
+    Creating a new user
+    """
+    await run_db(db, lambda session: verify_unique(session, user))
+    # Hashing runs in the process pool, the DB work stays off the event loop through run_db
+    hashed_password = await hash_password_async(user.password)
+    await run_db(db, lambda session: create_user(session, user, hashed_password))
 
     return RegisterResponse(message="User created successfully")
 
-@router.post("/login", response_model=LoginResponse)
-def login_user(username: str = Form(...),
-               password: str = Form(...),
-               db: Session = Depends(get_db)
+@router.post("/login", response_model=LoginResponse, dependencies=[Depends(limit(AUTH, per_user=False))])
+async def login_user(username: str = Form(...),
+                     password: str = Form(...),
+                     db: Session = Depends(get_db)
 ) -> LoginResponse:
     """
     Registered user authentication
     """
-    user = db.query(Users).filter(Users.username.__eq__(username)).first()
+    user = await run_db\
+    (
+        db,
+        lambda session: session.query(Users.id, Users.hashed_password).filter(Users.username.__eq__(username)).first()
+    )
 
-    if not user or not verify_password(password, user.hashed_password):
+    if not user or not await verify_password_async(password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
+    # Legacy SHA-256 (or outdated cost) hashes are rewritten now that the plain password is known
+    if needs_rehash(user.hashed_password):
+        new_hash = await hash_password_async(password)
+        await run_db\
+        (
+            db,
+            lambda session: upgrade_password_hash(session, user.id, username, user.hashed_password, new_hash)
+        )
+
     access_token = create_access_token(data={"sub": username})
     return LoginResponse(access_token=access_token, token_type="bearer")
 
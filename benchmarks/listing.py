@@ -0,0 +1,160 @@
+"""
+Listing encoding benchmark on GET /topics/{id}: compares the previous path (Post entities validated through
+PostPageSchema, encoded with the standard JSON encoder) with column tuples encoded by orjson, then measures
+the compressed sizes and the route itself over HTTP, on cache misses and hits, per Accept-Encoding.
+
+    DB_URL=sqlite:///bench.db python benchmarks/seed.py
+    DB_URL=sqlite:///bench.db python benchmarks/listing.py --limit 200 --iterations 300
+
+The topic with the most posts is used unless --topic is given.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if os.getenv("DB_URL", "").startswith("sqlite"):
+    os.environ.setdefault("SEARCH_BACKEND", "memory")
+os.environ.setdefault("RATE_LIMIT", "false")
+
+import httpx
+from pydantic import TypeAdapter
+from sqlalchemy import func
+
+from db import SessionLocal
+from encoding import SUPPORTED_ENCODINGS, compress, dumps
+from models import Post, Users
+from pagination import keyset_page
+from report import summarize
+from schemas import PostPageSchema
+from seed import BENCHMARK_PASSWORD
+from topics import POST_COLUMNS
+from versions import listing_cache
+
+
+def previous_path(db, topic_id: int, limit: int) -> tuple[float, float, bytes]:
+    """
+    The listing as it was built before: entities, schema validation, the standard JSON encoder
+    """
+    start = time.perf_counter()
+    posts, next_cursor, prev_cursor = keyset_page\
+    (
+        db.query(Post).filter(Post.topic_id.__eq__(topic_id)), [Post.id], f"topic:{topic_id}", None, limit
+    )
+    loaded = time.perf_counter()
+    page = TypeAdapter(PostPageSchema).validate_python\
+    (
+        {"items": posts, "next_cursor": next_cursor, "prev_cursor": prev_cursor}, from_attributes=True
+    )
+    body = json.dumps(page.model_dump(mode="json"), separators=(",", ":")).encode()
+    return loaded - start, time.perf_counter() - loaded, body
+
+
+def column_path(db, topic_id: int, limit: int) -> tuple[float, float, bytes]:
+    start = time.perf_counter()
+    posts, next_cursor, prev_cursor = keyset_page\
+    (
+        db.query(*POST_COLUMNS).filter(Post.topic_id.__eq__(topic_id)), [Post.id], f"topic:{topic_id}", None, limit
+    )
+    loaded = time.perf_counter()
+    body = dumps({"items": [post._asdict() for post in posts], "next_cursor": next_cursor, "prev_cursor": prev_cursor})
+    return loaded - start, time.perf_counter() - loaded, body
+
+
+def serialization(topic_id: int, limit: int, iterations: int) -> dict:
+    results = {}
+    for name, path in (("entities_pydantic_json", previous_path), ("columns_orjson", column_path)):
+        loads, encodes = [], []
+        for _ in range(iterations):
+            db = SessionLocal()
+            try:
+                load, encode, body = path(db, topic_id, limit)
+            finally:
+                db.close()
+            loads.append(load)
+            encodes.append(encode)
+        results[name] =\
+        {
+            "load": summarize(loads, sum(loads)),
+            "encode": summarize(encodes, sum(encodes)),
+            "bytes": len(body)
+        }
+
+    compression = {"identity": {"bytes": len(body)}}
+    for encoding in SUPPORTED_ENCODINGS:
+        start = time.perf_counter()
+        compressed = compress(body, encoding)
+        compression[encoding] = {"bytes": len(compressed), "ms": (time.perf_counter() - start) * 1000}
+    results["compression"] = compression
+    return results
+
+
+async def http(topic_id: int, limit: int, iterations: int) -> dict:
+    from main import app
+
+    db = SessionLocal()
+    try:
+        username = db.query(Users.username).filter(Users.admin.is_(False)).order_by(Users.id).limit(1).scalar()
+    finally:
+        db.close()
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/auth/login", data={"username": username, "password": BENCHMARK_PASSWORD})
+            response.raise_for_status()
+            token = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            for encoding in ("identity", *SUPPORTED_ENCODINGS):
+                headers = {**token, "Accept-Encoding": encoding}
+                for cached in (False, True):
+                    latencies = []
+                    for _ in range(iterations):
+                        if not cached:
+                            listing_cache.clear()
+                        start = time.perf_counter()
+                        response = await client.get(f"/topics/{topic_id}", params={"limit": limit}, headers=headers)
+                        latencies.append(time.perf_counter() - start)
+                        response.raise_for_status()
+                    results[f"{encoding}_{'hit' if cached else 'miss'}"] =\
+                    {
+                        **summarize(latencies, sum(latencies)),
+                        "bytes": int(response.headers.get("content-length", len(response.content)))
+                    }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topic", type=int, default=None)
+    parser.add_argument("--limit", type=int, default=200, help="Posts per page, at most MAX_PAGE_SIZE")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    topic_id = args.topic
+    if topic_id is None:
+        db = SessionLocal()
+        try:
+            topic_id = db.query(Post.topic_id).group_by(Post.topic_id).order_by(func.count().desc()).limit(1).scalar()
+        finally:
+            db.close()
+        if topic_id is None:
+            sys.exit("The database is empty, run benchmarks/seed.py first")
+
+    print(json.dumps(
+    {
+        "topic_id": topic_id,
+        "limit": args.limit,
+        "iterations": args.iterations,
+        "serialization": serialization(topic_id, args.limit, args.iterations),
+        "http": asyncio.run(http(topic_id, args.limit, args.iterations))
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
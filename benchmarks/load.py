@@ -0,0 +1,268 @@
+"""
+Concurrent load benchmark over every router of main.app, reports throughput and p50/p95/p99 latency per route as JSON.
+
+    DB_URL=sqlite:///bench.db python benchmarks/seed.py
+    DB_URL=sqlite:///bench.db python benchmarks/load.py --requests 5000 --concurrency 32 > before.json
+
+Requests go through the ASGI app in-process (no server or network involved) unless --url points at a running
+server using the same database. Targets follow the skew of the seeded data (hot topics, heavy voters) and
+the request mix, seed, database and commit are recorded in the output so runs can be compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Awaitable, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if os.getenv("DB_URL", "").startswith("sqlite"):
+    # Postgres full-text search isn't available on SQLite
+    os.environ.setdefault("SEARCH_BACKEND", "memory")
+# Every simulated user comes from this one address, the write limits would reject most of the load
+os.environ.setdefault("RATE_LIMIT", "false")
+
+import httpx
+from sqlalchemy import func
+
+from db import SessionLocal, engine
+from models import Users, Category, Conversation, Topic, Post
+from report import summarize
+from seed import BENCHMARK_PASSWORD, WORDS, Popularity, sentence
+
+
+class LoadContext:
+    """
+    Ids and tokens the scenarios draw from, picked with the same skew as the seeded data
+    """
+
+    def __init__(self, db, logins: int, skew: float, rng: random.Random):
+        users = db.query(Users.id, Users.username, Users.admin).order_by(Users.id).all()
+        if not users:
+            sys.exit("The database is empty, run benchmarks/seed.py first")
+        self.categories = [row.id for row in db.query(Category.id).order_by(Category.id)]
+        # Topics weighted by their real post counts, so the hot topics get the hot traffic
+        post_counts = dict(db.query(Post.topic_id, func.count(Post.id)).group_by(Post.topic_id).all())
+        self.topics = [row.id for row in db.query(Topic.id).order_by(Topic.id)]
+        self.topic_weights = [post_counts.get(topic_id, 0) + 1 for topic_id in self.topics]
+        self.posts = Popularity([row.id for row in db.query(Post.id).order_by(Post.id)], skew, rng)
+        members = [user for user in users if not user.admin][:logins]
+        self.usernames = [user.username for user in members]
+        self.user_ids = [user.id for user in members]
+        self.admins = [user.username for user in users if user.admin][:max(1, logins // 10)]
+        self.users = Popularity(list(range(len(self.usernames))), skew, rng)
+        # The conversations of each logged-in user, for reading their history
+        user_index = {user_id: index for index, user_id in enumerate(self.user_ids)}
+        self.conversations: dict[int, list[int]] = defaultdict(list)
+        for conversation in db.query(Conversation.id, Conversation.initiator_id, Conversation.receiver_id)\
+                .filter(Conversation.last_message_at.isnot(None)).order_by(Conversation.id):
+            for participant in (conversation.initiator_id, conversation.receiver_id):
+                if participant in user_index:
+                    self.conversations[user_index[participant]].append(conversation.id)
+        self.chatters = Popularity(sorted(self.conversations), skew, rng) if self.conversations else None
+        self.tokens: list[dict] = []
+        self.admin_tokens: list[dict] = []
+
+    async def login(self, client: httpx.AsyncClient) -> None:
+        async def token(username: str) -> dict:
+            response = await client.post("/auth/login", data={"username": username, "password": BENCHMARK_PASSWORD})
+            response.raise_for_status()
+            return {"Authorization": f"Bearer {response.json()['access_token']}"}
+        self.tokens = list(await asyncio.gather(*[token(username) for username in self.usernames]))
+        self.admin_tokens = list(await asyncio.gather(*[token(username) for username in self.admins]))
+
+    def user(self, rng: random.Random) -> dict:
+        return self.tokens[self.users.pick(rng)]
+
+    def conversation(self, rng: random.Random) -> tuple[dict, int] | None:
+        """
+        A user with conversations and one of them, None when the database has no messages
+        """
+        if self.chatters is None:
+            return None
+        index = self.chatters.pick(rng)
+        return self.tokens[index], rng.choice(self.conversations[index])
+
+    def admin(self, rng: random.Random) -> dict:
+        return rng.choice(self.admin_tokens)
+
+    def topic(self, rng: random.Random) -> int:
+        return rng.choices(self.topics, weights=self.topic_weights)[0]
+
+
+Scenario = Callable[[httpx.AsyncClient, LoadContext, random.Random], Awaitable[httpx.Response]]
+
+BATCH_POSTS = 20  # posts per GET /posts/batch, a page of a feed
+
+def read_conversation(client: httpx.AsyncClient, context: LoadContext, rng: random.Random) -> Awaitable[httpx.Response]:
+    picked = context.conversation(rng)
+    if picked is None:
+        # Nothing to read, the inbox costs the same lookups
+        return client.get("/dms/", headers=context.user(rng))
+    headers, conversation_id = picked
+    return client.get(f"/dms/{conversation_id}", headers=headers)
+
+def send_message(client: httpx.AsyncClient, context: LoadContext, rng: random.Random) -> Awaitable[httpx.Response]:
+    sender = context.users.pick(rng)
+    # Anyone but the sender, messaging yourself is rejected
+    recipient = rng.choice(context.user_ids[:sender] + context.user_ids[sender + 1:] or context.user_ids)
+    return client.post("/dms/send", data={"recipient_id": recipient, "text": sentence(rng, 2, 30)},
+                       headers=context.tokens[sender])
+
+# Route -> (share of the requests, request), reads dominate like on any forum
+MIX: dict[str, tuple[float, Scenario]] = \
+{
+    "GET /categories/": (8, lambda client, context, rng:
+        client.get("/categories/", headers=context.user(rng))),
+    "GET /categories/{category_id}": (10, lambda client, context, rng:
+        client.get(f"/categories/{rng.choice(context.categories)}", headers=context.user(rng))),
+    "GET /topics/{topic_id}": (30, lambda client, context, rng:
+        client.get(f"/topics/{context.topic(rng)}", headers=context.user(rng))),
+    "GET /topics/{topic_id}/export": (1, lambda client, context, rng:
+        client.get(f"/topics/{context.topic(rng)}/export", headers=context.user(rng))),
+    "POST /topics/{topic_id}/post": (5, lambda client, context, rng:
+        client.post(f"/topics/{context.topic(rng)}/post", data={"content": sentence(rng, 5, 40)},
+                    headers=context.user(rng))),
+    "GET /posts/{post_id}": (25, lambda client, context, rng:
+        client.get(f"/posts/{context.posts.pick(rng)}", headers=context.user(rng))),
+    "POST /posts/{post_id}/interaction": (10, lambda client, context, rng:
+        client.post(f"/posts/{context.posts.pick(rng)}/interaction", data={"vote": rng.choice((1, 1, 1, -1, 0))},
+                    headers=context.user(rng))),
+    "GET /posts/batch": (5, lambda client, context, rng:
+        client.get("/posts/batch", params={"ids": [context.posts.pick(rng) for _ in range(BATCH_POSTS)]},
+                   headers=context.user(rng))),
+    "GET /dms/": (4, lambda client, context, rng:
+        client.get("/dms/", headers=context.user(rng))),
+    "GET /dms/{conversation_id}": (3, read_conversation),
+    "POST /dms/send": (1, send_message),
+    "GET /trending/topics": (3, lambda client, context, rng:
+        client.get("/trending/topics", headers=context.user(rng))),
+    "GET /trending/categories": (1, lambda client, context, rng:
+        client.get("/trending/categories", headers=context.user(rng))),
+    "GET /search/": (5, lambda client, context, rng:
+        client.get("/search/", params={"q": " ".join(rng.sample(WORDS, 2))}, headers=context.user(rng))),
+    "POST /auth/login": (1, lambda client, context, rng:
+        client.post("/auth/login", data={"username": rng.choice(context.usernames), "password": BENCHMARK_PASSWORD})),
+    "POST /auth/register": (0.5, lambda client, context, rng:
+        client.post("/auth/register", json=
+        {
+            "username": f"load-{uuid.uuid4().hex[:12]}",
+            "password": BENCHMARK_PASSWORD,
+            "email": f"{uuid.uuid4().hex}@bench.local",
+            "age": 30
+        })),
+    "GET /admin/pool": (0.5, lambda client, context, rng:
+        client.get("/admin/pool", headers=context.admin(rng)))
+}
+
+
+async def drive(client: httpx.AsyncClient, context: LoadContext, requests: int, concurrency: int, seed: int) -> dict:
+    routes = list(MIX)
+    weights = [MIX[route][0] for route in routes]
+    latencies: dict[str, list[float]] = defaultdict(list)
+    statuses: dict[str, Counter] = defaultdict(Counter)
+    remaining = requests
+
+    async def worker(number: int) -> None:
+        nonlocal remaining
+        rng = random.Random(seed * 1000 + number)
+        while remaining > 0:
+            remaining -= 1
+            route = rng.choices(routes, weights=weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await MIX[route][1](client, context, rng)
+                status = str(response.status_code)
+            except httpx.HTTPError as error:
+                status = type(error).__name__
+            latencies[route].append(time.perf_counter() - start)
+            statuses[route][status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(number) for number in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return\
+    {
+        "total": summarize([latency for samples in latencies.values() for latency in samples], elapsed),
+        "routes":
+        {
+            route: {**summarize(latencies[route], elapsed), "statuses": dict(statuses[route])}
+            for route in routes if latencies[route]
+        }
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict:
+    db = SessionLocal()
+    try:
+        context = LoadContext(db, args.logins, args.skew, random.Random(args.seed))
+    finally:
+        db.close()
+
+    async def measure(client: httpx.AsyncClient) -> dict:
+        await context.login(client)
+        if args.warmup:
+            await drive(client, context, args.warmup, args.concurrency, args.seed + 1)
+        return await drive(client, context, args.requests, args.concurrency, args.seed)
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            results = await measure(client)
+    else:
+        from main import app
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+                results = await measure(client)
+
+    return\
+    {
+        "commit": git_commit(),
+        "database": engine.dialect.name,
+        "target": args.url or "in-process",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "mix": {route: share for route, (share, _) in MIX.items()},
+        **results
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=200, help="Unrecorded requests sent first")
+    parser.add_argument("--logins", type=int, default=50, help="Distinct users sending requests")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of the users and posts picked")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", default=None, help="Base URL of a running server, in-process if omitted")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
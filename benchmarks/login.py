@@ -0,0 +1,65 @@
+"""
+Login hashing benchmark: verifies passwords through the process pool the same way /auth/login does
+and reports throughput and latency percentiles as JSON.
+
+    PASSWORD_HASH_WORKERS=4 python benchmarks/login.py --requests 400 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import passwords
+from report import percentile
+
+
+async def run(requests: int, concurrency: int) -> dict:
+    hashed = passwords.hash_password("benchmark-password")
+    # Start the workers before timing, like a warmed-up server
+    await asyncio.gather(*[passwords.verify_password_async("x", hashed) for _ in range(passwords.PASSWORD_HASH_WORKERS)])
+
+    latencies = []
+    gate = asyncio.Semaphore(concurrency)
+
+    async def login() -> None:
+        async with gate:
+            start = time.perf_counter()
+            assert await passwords.verify_password_async("benchmark-password", hashed)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[login() for _ in range(requests)])
+    elapsed = time.perf_counter() - start
+
+    return\
+    {
+        "workers": passwords.PASSWORD_HASH_WORKERS,
+        "scrypt_n": passwords.PASSWORD_SCRYPT_N,
+        "requests": requests,
+        "concurrency": concurrency,
+        "throughput_per_s": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    try:
+        print(json.dumps(asyncio.run(run(args.requests, args.concurrency)), indent=2))
+    finally:
+        passwords.shutdown_hash_pool()
+
+
+if __name__ == "__main__":
+    main()
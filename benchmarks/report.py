@@ -0,0 +1,27 @@
+"""
+Latency statistics shared by the benchmarks
+"""
+import statistics
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    """
+    Throughput over elapsed seconds and latency percentiles in milliseconds
+    """
+    if not latencies:
+        return {"count": 0}
+    return\
+    {
+        "count": len(latencies),
+        "throughput_per_s": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "max_ms": max(latencies) * 1000
+    }
@@ -0,0 +1,298 @@
+"""
+Seeded synthetic forum data for the benchmarks, skewed like a real forum: a few hot topics hold most
+of the posts, a few heavy posters and voters write most of them and some categories are hidden or private.
+Chatty users hold most of the direct message conversations the same way.
+
+    DB_URL=sqlite:///bench.db python benchmarks/seed.py --users 2000 --topics 1000 --posts 100000 --votes 300000
+
+The same --seed and scale always produce the same rows. SQLite databases get their tables created,
+Postgres ones need sql/new_db_postgre.sql applied first. Every user's password is BENCHMARK_PASSWORD.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timedelta, timezone
+from itertools import accumulate, islice
+from typing import Iterator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from bulk_import import reset_id_sequence
+from db import SessionLocal, engine
+from maintenance import reconcile_activity, reconcile_votes
+from models import Base, Users, Category, CategoryAccessPrivilege, Conversation, DirectMessage, Topic, Post, \
+    PostInteraction
+from passwords import hash_password
+
+BENCHMARK_PASSWORD = "benchmark-password"
+INSERT_BATCH_SIZE = 5000
+EPOCH = date(2020, 1, 1)
+
+# Small vocabulary so searches find something, common words first so they're also the most frequent
+WORDS = \
+(
+    "the forum post topic reply question answer thanks python database query index cache latency "
+    "release version bug fix feature request server client network memory thread process lock vote "
+    "category moderator archive search ranking benchmark profile trace metric deploy config schema"
+).split()
+
+
+@dataclass(frozen=True)
+class Scale:
+    users: int = 1000
+    categories: int = 20
+    topics: int = 500
+    posts: int = 20000
+    votes: int = 50000
+    conversations: int = 2000
+    messages: int = 10000
+    skew: float = 1.1  # Zipf exponent of topic, poster and voter popularity
+    seed: int = 1
+
+
+def zipf_weights(count: int, skew: float) -> list[float]:
+    """
+    Cumulative Zipf weights for random.choices(cum_weights=...), rank 0 is the most popular
+    """
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+class Popularity:
+    """
+    Picks ids with Zipf-distributed popularity, which ids are popular is itself random (seeded)
+    """
+
+    def __init__(self, ids: list[int], skew: float, rng: random.Random):
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.weights = zipf_weights(len(self.ids), skew)
+
+    def pick(self, rng: random.Random) -> int:
+        return rng.choices(self.ids, cum_weights=self.weights)[0]
+
+
+WORD_WEIGHTS = zipf_weights(len(WORDS), 0.8)
+
+def sentence(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choices(WORDS, cum_weights=WORD_WEIGHTS, k=rng.randint(low, high)))
+
+
+def insert_rows(db: Session, model, rows: Iterator[dict]) -> int:
+    """
+    Inserts rows in multi-row batches and returns how many were written
+    """
+    written = 0
+    while batch := list(islice(rows, INSERT_BATCH_SIZE)):
+        db.execute(insert(model), batch)
+        written += len(batch)
+    db.commit()
+    reset_id_sequence(db, model)
+    return written
+
+
+def generate(db: Session, scale: Scale) -> dict:
+    """
+    Fills an empty database and returns the number of rows written per table
+    """
+    rng = random.Random(scale.seed)
+    # One hash shared by all users, seeding 1000s of scrypt hashes would take minutes (login is benchmarked separately)
+    hashed_password = hash_password(BENCHMARK_PASSWORD)
+    admins = max(1, scale.users // 100)
+    user_ids = range(1, scale.users + 1)
+    category_ids = range(1, scale.categories + 1)
+    counts = {}
+
+    counts["users"] = insert_rows(db, Users, iter(
+    [
+        {
+            "id": user_id,
+            "username": f"user{user_id}",
+            "hashed_password": hashed_password,
+            "email": f"user{user_id}@bench.local",
+            "age": rng.randint(16, 80),
+            "nickname": f"nick{user_id}" if rng.random() < 0.5 else None,
+            "registration_date": EPOCH + timedelta(days=rng.randrange(1500)),
+            "admin": user_id <= admins
+        }
+        for user_id in user_ids
+    ]))
+
+    # Every 10th category is hidden, every 5th has privileges (granting or denying) for some users
+    counts["categories"] = insert_rows(db, Category, iter(
+    [
+        {
+            "id": category_id,
+            "name": f"category {category_id}",
+            "description": sentence(rng, 5, 20),
+            "visibility": category_id % 10 != 0,
+            "locked": False
+        }
+        for category_id in category_ids
+    ]))
+
+    privileges = []
+    for category_id in category_ids:
+        if category_id % 5 == 0:
+            for user_id in rng.sample(user_ids, max(1, scale.users // 20)):
+                privileges.append\
+                ({
+                    "user_id": user_id,
+                    "category_id": category_id,
+                    "permission_type": "read" if rng.random() < 0.7 else ""
+                })
+    counts["category_access_privileges"] = insert_rows(db, CategoryAccessPrivilege, iter(privileges))
+
+    posters = Popularity(list(user_ids), scale.skew, rng)
+    categories = Popularity(list(category_ids), scale.skew / 2, rng)
+    topic_categories = {topic_id: categories.pick(rng) for topic_id in range(1, scale.topics + 1)}
+    counts["topics"] = insert_rows(db, Topic, iter(
+    [
+        {
+            "id": topic_id,
+            "title": sentence(rng, 2, 8)[:100],
+            "description": sentence(rng, 5, 30),
+            "locked": rng.random() < 0.02,
+            "user_id": posters.pick(rng),
+            "category_id": category_id
+        }
+        for topic_id, category_id in topic_categories.items()
+    ]))
+
+    topics = Popularity(list(topic_categories), scale.skew, rng)
+
+    # Posts are spread evenly from EPOCH to now in id order, so the oldest topics are cold enough to archive
+    first_post_at = datetime.combine(EPOCH, datetime.min.time(), timezone.utc)
+    post_interval = (datetime.now(timezone.utc) - first_post_at) / max(scale.posts, 1)
+
+    def post_rows() -> Iterator[dict]:
+        for post_id in range(1, scale.posts + 1):
+            topic_id = topics.pick(rng)
+            yield\
+            {
+                "id": post_id,
+                "content": sentence(rng, 5, 80),
+                "user_id": posters.pick(rng),
+                "topic_id": topic_id,
+                "category_id": topic_categories[topic_id],
+                "created_at": first_post_at + post_interval * (post_id - 1)
+            }
+    counts["posts"] = insert_rows(db, Post, post_rows())
+
+    def vote_rows() -> Iterator[dict]:
+        voters = Popularity(list(user_ids), scale.skew, rng)
+        posts = Popularity(list(range(1, scale.posts + 1)), scale.skew, rng)
+        seen = set()
+        # (post, user) is unique, so the most skewed scales can't reach the wanted count, attempts are bounded
+        for _ in range(scale.votes * 3):
+            if len(seen) == scale.votes:
+                break
+            key = (posts.pick(rng), voters.pick(rng))
+            if key in seen:
+                continue
+            seen.add(key)
+            yield {"id": len(seen), "post_id": key[0], "user_id": key[1], "vote": rng.random() < 0.8}
+    counts["post_interactions"] = insert_rows(db, PostInteraction, vote_rows()) if scale.posts else 0
+
+    counts.update(generate_messages(db, scale, rng, Popularity(list(user_ids), scale.skew, rng)))
+
+    reconcile_votes(db)
+    reconcile_activity(db)
+    return counts
+
+def generate_messages(db: Session, scale: Scale, rng: random.Random, chatters: Popularity) -> dict:
+    """
+    Writes conversations between distinct pairs of users and their messages, spread from EPOCH to now like posts,
+    with the inbox summaries and unread counters send_message and mark_conversation_read maintain
+    """
+    pairs = {}
+    # Pairs are unordered and unique, so the most skewed scales can't reach the wanted count, attempts are bounded
+    for _ in range(scale.conversations * 3):
+        if len(pairs) == scale.conversations or scale.users < 2:
+            break
+        initiator, receiver = chatters.pick(rng), chatters.pick(rng)
+        if initiator != receiver and (receiver, initiator) not in pairs:
+            pairs.setdefault((initiator, receiver), len(pairs) + 1)
+    if not pairs:
+        return {"conversations": 0, "direct_messages": 0}
+
+    first_message_at = datetime.combine(EPOCH, datetime.min.time(), timezone.utc)
+    message_interval = (datetime.now(timezone.utc) - first_message_at) / max(scale.messages, 1)
+    conversations = Popularity(list(pairs.items()), scale.skew, rng)
+
+    # Only who wrote when is kept for the summaries, the texts are generated while inserting
+    messages = []
+    summaries: dict[int, dict] = {}
+    for message_id in range(1, scale.messages + 1):
+        (initiator, receiver), conversation_id = conversations.pick(rng)
+        sender_is_initiator = rng.random() < 0.5
+        sent_at = first_message_at + message_interval * (message_id - 1)
+        messages.append((message_id, conversation_id, initiator if sender_is_initiator else receiver, sent_at))
+
+        summary = summaries.setdefault(conversation_id, {"date": sent_at.date(), "initiator_unread": 0, "receiver_unread": 0})
+        summary["last_message_at"], summary["last_message_id"] = sent_at, message_id
+        # Sending reads the conversation, the other side has one more unread message
+        summary["receiver_unread" if sender_is_initiator else "initiator_unread"] += 1
+        summary["initiator_unread" if sender_is_initiator else "receiver_unread"] = 0
+
+    # Pairs no message was picked for stay empty, the inbox leaves those out
+    empty = {"date": EPOCH, "last_message_at": None, "last_message_id": None, "initiator_unread": 0, "receiver_unread": 0}
+    counts = {}
+    counts["conversations"] = insert_rows(db, Conversation, iter(
+    [
+        {"id": conversation_id, "initiator_id": initiator, "receiver_id": receiver, **summaries.get(conversation_id, empty)}
+        for (initiator, receiver), conversation_id in pairs.items()
+    ]))
+    counts["direct_messages"] = insert_rows(db, DirectMessage, (
+        {
+            "id": message_id,
+            "text": sentence(rng, 2, 30),
+            "date": sent_at.date(),
+            "conversation_id": conversation_id,
+            "sender_id": sender_id
+        }
+        for message_id, conversation_id, sender_id, sent_at in messages
+    ))
+
+    unread: dict[int, int] = {}
+    for (initiator, receiver), conversation_id in pairs.items():
+        summary = summaries.get(conversation_id, empty)
+        unread[initiator] = unread.get(initiator, 0) + summary["initiator_unread"]
+        unread[receiver] = unread.get(receiver, 0) + summary["receiver_unread"]
+    rows = [{"id": user_id, "unread_messages": count} for user_id, count in unread.items() if count]
+    if rows:
+        db.execute(update(Users), rows)
+        db.commit()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for field, default in asdict(Scale()).items():
+        parser.add_argument(f"--{field}", type=type(default), default=default)
+    args = parser.parse_args()
+    scale = Scale(**{field: getattr(args, field) for field in asdict(Scale())})
+
+    if engine.dialect.name == "sqlite":
+        Base.metadata.create_all(engine)
+
+    db = SessionLocal()
+    try:
+        if db.query(Users.id).first():
+            sys.exit("The database already has data, seed an empty one so runs stay comparable")
+        start = time.perf_counter()
+        counts = generate(db, scale)
+    finally:
+        db.close()
+
+    print(json.dumps({"scale": asdict(scale), "rows": counts, "seconds": time.perf_counter() - start}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Bulk import of users, categories, topics, posts and post interactions from NDJSON or CSV.
+
+    python bulk_import.py posts legacy/posts.ndjson --checkpoint posts.checkpoint
+
+Rows keep their ids (so legacy references resolve) and are written in batches of multi-row
+INSERT ... ON CONFLICT DO NOTHING RETURNING, one transaction per batch. With --checkpoint the
+number of rows done is saved after every batch and a rerun resumes from there.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import time
+from datetime import date, datetime
+from itertools import islice
+from typing import Any, Callable, Iterator, TextIO
+
+from sqlalchemy import Boolean, Date, DateTime, Integer, select, text
+from sqlalchemy.orm import Session
+
+from db import SessionLocal, dialect_insert
+from maintenance import reconcile_activity, reconcile_votes
+from models import Users, Category, Topic, Post, PostInteraction
+
+DEFAULT_BATCH_SIZE = 5000
+MAX_REPORTED_REJECTS = 100
+
+TABLES = \
+{
+    "users": Users,
+    "categories": Category,
+    "topics": Topic,
+    "posts": Post,
+    "post_interactions": PostInteraction
+}
+
+# Referencing column -> referenced model, checked once per batch
+FOREIGN_KEYS = \
+{
+    "topics": {"user_id": Users, "category_id": Category},
+    "posts": {"user_id": Users, "topic_id": Topic, "category_id": Category},
+    "post_interactions": {"post_id": Post, "user_id": Users}
+}
+
+# Derived data rebuilt once the table has been imported
+POST_IMPORT: dict[str, Callable[[Session], Any]] = \
+{
+    "posts": reconcile_activity,
+    "post_interactions": reconcile_votes
+}
+
+
+class ImportReport:
+    """
+    Running totals of an import
+    """
+
+    def __init__(self, table: str, skip: int = 0):
+        self.table = table
+        self.skip = skip
+        self.processed = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.rejects: list[dict] = []
+        self.started = time.perf_counter()
+
+    def reject(self, row: int, reason: str) -> None:
+        self.rejected += 1
+        if len(self.rejects) < MAX_REPORTED_REJECTS:
+            self.rejects.append({"row": row, "reason": reason})
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return\
+        {
+            "table": self.table,
+            "skipped": self.skip,
+            "processed": self.processed,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "rejects": self.rejects,
+            "seconds": elapsed,
+            "rows_per_second": self.processed / elapsed if elapsed else 0.0
+        }
+
+
+def _coerce(column, value: Any) -> Any:
+    # CSV gives strings for everything and NDJSON dates as strings
+    if value is None or value == "":
+        return None
+    if isinstance(column.type, Boolean) and isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "t", "yes")
+    if isinstance(column.type, Integer) and not isinstance(value, int):
+        return int(value)
+    if isinstance(column.type, DateTime) and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if isinstance(column.type, Date) and isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+def read_rows(stream: TextIO, file_format: str) -> Iterator[dict]:
+    """
+    Yields the rows of an NDJSON or CSV (with header) stream
+    """
+    if file_format == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+def prepare_row(model, row: dict) -> dict:
+    """
+    Keeps the model's columns of a row and converts their values, raises ValueError on bad rows
+    """
+    prepared = {}
+    for column in model.__table__.columns:
+        value = _coerce(column, row.get(column.key))
+        if value is None:
+            # Left out so the database/model default (or a new id) applies
+            if column.nullable or column.primary_key or column.default is not None or column.server_default is not None:
+                continue
+            raise ValueError(f"missing {column.key}")
+        prepared[column.key] = value
+    return prepared
+
+def check_foreign_keys(db: Session, table: str, rows: list[tuple[int, dict]], report: ImportReport) -> list[dict]:
+    """
+    Returns the rows whose references exist, with one query per referenced table for the whole batch
+    """
+    valid = rows
+    for column, referenced in FOREIGN_KEYS.get(table, {}).items():
+        wanted = {row[column] for _, row in valid}
+        found = set(db.execute(select(referenced.id).where(referenced.id.in_(wanted))).scalars())
+        checked = []
+        for number, row in valid:
+            if row[column] in found:
+                checked.append((number, row))
+            else:
+                report.reject(number, f"{column} {row[column]} does not exist")
+        valid = checked
+    return [row for _, row in valid]
+
+def insert_batch(db: Session, model, rows: list[dict]) -> int:
+    """
+    Inserts rows with a multi-row INSERT, skipping ids that already exist, and returns the number inserted
+    """
+    # One multi-row statement per set of provided columns, normally the whole batch
+    shapes: dict[tuple, list[dict]] = {}
+    for row in rows:
+        shapes.setdefault(tuple(sorted(row)), []).append(row)
+
+    statement = dialect_insert(db, model).on_conflict_do_nothing().returning(model.id)
+    return sum(len(db.execute(statement, shape).all()) for shape in shapes.values())
+
+def reset_id_sequence(db: Session, model) -> None:
+    """
+    Moves the Postgres id sequence past the imported ids
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    table = model.__tablename__
+    db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"))
+    db.commit()
+
+def import_rows(db: Session,
+                table: str,
+                rows: Iterator[dict],
+                batch_size: int = DEFAULT_BATCH_SIZE,
+                skip: int = 0,
+                on_batch: Callable[[int], None] | None = None
+) -> ImportReport:
+    """
+    Imports rows into a table in batches, one transaction each.
+    skip rows are passed over first (resume), on_batch gets the total rows done after every committed batch
+    """
+    model = TABLES[table]
+    report = ImportReport(table, skip)
+    rows = islice(enumerate(rows, start=1), skip, None)
+
+    while batch := list(islice(rows, batch_size)):
+        prepared = []
+        for number, row in batch:
+            try:
+                prepared.append((number, prepare_row(model, row)))
+            except (ValueError, TypeError) as error:
+                report.reject(number, str(error))
+
+        valid = check_foreign_keys(db, table, prepared, report)
+        inserted = insert_batch(db, model, valid)
+        db.commit()
+
+        report.processed += len(batch)
+        report.inserted += inserted
+        report.duplicates += len(valid) - inserted
+        if on_batch:
+            on_batch(skip + report.processed)
+
+    reset_id_sequence(db, model)
+    if table in POST_IMPORT:
+        POST_IMPORT[table](db)
+    return report
+
+def import_upload(table: str, upload: io.IOBase, file_format: str, batch_size: int, skip: int) -> dict:
+    """
+    Imports an uploaded file with its own session (used by the admin endpoint) and returns the report
+    """
+    db = SessionLocal()
+    try:
+        stream = io.TextIOWrapper(upload, encoding="utf-8", newline="")
+        return import_rows(db, table, read_rows(stream, file_format), batch_size, skip).as_dict()
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("table", choices=TABLES)
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("ndjson", "csv"), default=None, help="Defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--checkpoint", default=None, help="File recording progress, resumes from it if present")
+    args = parser.parse_args()
+
+    file_format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+
+    skip = 0
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        with open(args.checkpoint) as checkpoint:
+            skip = json.load(checkpoint)["rows"]
+        print(f"Resuming {args.table} after {skip} rows")
+
+    def save_checkpoint(done: int) -> None:
+        if args.checkpoint:
+            with open(args.checkpoint, "w") as checkpoint:
+                json.dump({"table": args.table, "path": args.path, "rows": done}, checkpoint)
+        print(f"{args.table}: {done} rows", flush=True)
+
+    db = SessionLocal()
+    try:
+        with open(args.path, newline="", encoding="utf-8") as stream:
+            report = import_rows(db, args.table, read_rows(stream, file_format), args.batch_size, skip, save_checkpoint)
+    finally:
+        db.close()
+
+    print(json.dumps(report.as_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
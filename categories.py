@@ -1,37 +1,48 @@
-from typing import List, Type
+from typing import List
 
-from fastapi import APIRouter, Depends, Form, HTTPException
+from fastapi import APIRouter, Depends, Form, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 
-from db import get_db
-from models import Users, Category, Topic
-from schemas import CategorySchema, TopicSchema
-from utils import get_current_user, can_user_see_category, get_admin
+from db import get_db, db_route
+from models import Category, Topic
+from ratelimit import limit, WRITE
+from replicas import get_read_db, mark_written
+from pagination import keyset_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from schemas import CategorySchema, TopicPageSchema
+from trending import visible_categories_cache
+from utils import CurrentUser, get_current_user, get_admin, resolve_visible_categories
+from versions import cached_listing, versions
 
 router = APIRouter(
     tags=["categories"]
 )
 
+# Listings select the columns of TopicSchema, plain rows are much cheaper to load and encode than entities
+TOPIC_COLUMNS = (Topic.id, Topic.title, Topic.description, Topic.locked, Topic.user_id, Topic.category_id,
+                 Topic.post_count, Topic.reply_count, Topic.last_post_id, Topic.last_post_at)
+
 @router.get("/", response_model=List[CategorySchema])
-def get_categories(db: Session = Depends(get_db), user: Users = Depends(get_current_user)) -> list:
+async def get_categories(request: Request,
+                         db: Session = Depends(get_read_db),
+                         user: CurrentUser = Depends(get_current_user)
+) -> Response:
     """
     Lists all visible categories for the logged-in user
+    :param request: the request, for its If-None-Match header
     :param db: database connection
     :param user: user requesting access
     :return: list of visible categories for logged-in user
     """
-    categories = db.query(Category).all()
-    visible_categories =\
-    [
-        category for category in categories
-        if can_user_see_category(user, category, db)
-    ]
-
-    return visible_categories
+    return await cached_listing\
+    (
+        request, user, ("categories", 0), List[CategorySchema], db,
+        lambda session: resolve_visible_categories(user, session)
+    )
 
-@router.post("/add", response_model=CategorySchema)
+@router.post("/add", response_model=CategorySchema, dependencies=[Depends(limit(WRITE))])
+@db_route
 def add_category(db: Session = Depends(get_db),
-                 admin: Users = Depends(get_admin),
+                 admin: CurrentUser = Depends(get_admin),
                  name: str = Form(...),
                  description: str = Form(...)
 ) -> CategorySchema:
@@ -55,26 +66,53 @@ def add_category(db: Session = Depends(get_db),
     db.add(new_category)
     db.commit()
     db.refresh(new_category)
+    versions.bump("categories")
+    visible_categories_cache.clear()
+    mark_written(admin)
 
     entry = db.query(Category).filter(Category.name.__eq__(name)).first()
 
     return CategorySchema(id=entry.id, name=name, description=description)
 
-@router.get("/{category_id}", response_model=List[TopicSchema])
-def get_topics_in_category(category_id: int,
-                           db: Session = Depends(get_db),
-                           user: Users = Depends(get_current_user)
-) -> list[Type[Topic]]:
+@router.get("/{category_id}", response_model=TopicPageSchema)
+async def get_topics_in_category(category_id: int,
+                                 request: Request,
+                                 cursor: str | None = None,
+                                 limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                                 db: Session = Depends(get_read_db),
+                                 user: CurrentUser = Depends(get_current_user)
+) -> Response:
     """
-    API request for all topics in a given category
+    API request for one page of topics in a given category, ordered by id
     """
+    return await cached_listing\
+    (
+        request, user, ("category", category_id), None, db,
+        lambda session: list_topics_in_category(category_id, cursor, limit, session, user)
+    )
 
-    category = db.query(Category).filter(Category.id.__eq__(category_id)).first()
+def list_topics_in_category(category_id: int,
+                            cursor: str | None,
+                            limit: int,
+                            db: Session,
+                            user: CurrentUser
+) -> dict:
+    """
+    Checks access to the category and returns one page of its topics as plain dicts
+    """
+    visible_categories = resolve_visible_categories(user, db, [category_id])
 
-    if (not category or
-        not can_user_see_category(user, category, db)):
+    if not visible_categories:
         raise HTTPException(status_code=403, detail="Invalid category")
+    category = visible_categories[0]
+
+    topics, next_cursor, prev_cursor = keyset_page\
+    (
+        db.query(*TOPIC_COLUMNS).filter(Topic.category_id.__eq__(category.id)),
+        [Topic.id],
+        f"category:{category.id}",
+        cursor,
+        limit
+    )
 
-    # Get all topics within this category
-    topics = db.query(Topic).filter(Topic.category_id.__eq__(category.id)).all()
-    return topics
\ No newline at end of file
+    return {"items": [topic._asdict() for topic in topics], "next_cursor": next_cursor, "prev_cursor": prev_cursor}
\ No newline at end of file
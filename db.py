@@ -1,25 +1,156 @@
+import functools
 import os
+import threading
+import time
+from typing import Any, Callable
 
-from sqlalchemy import create_engine
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, make_url, Insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
+DB_URL = os.getenv("DB_URL")  # Full SQLAlchemy URL, overrides DB_USER..DB_NAME (e.g. sqlite:///bench.db)
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")  # Opt-in asyncpg mode
 
-SQLALCHEMY_DATABASE_URL =\
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds, -1 disables
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "0"))  # milliseconds, 0 disables
+
+SQLALCHEMY_DATABASE_URL = DB_URL or\
     f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+def async_database_url(url: str) -> str:
+    """
+    Returns the URL with the asyncpg driver, so both engines reach the same database. Only Postgres has one here
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "postgresql":
+        raise RuntimeError(f"DB_ASYNC needs a Postgres database, DB_URL points at {parsed.get_backend_name()}")
+    return parsed.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+SQLALCHEMY_ASYNC_DATABASE_URL = async_database_url(SQLALCHEMY_DATABASE_URL) if DB_ASYNC else None
+
+class PoolStats:
+    """
+    Counters of connection checkouts from a pool and the time spent waiting for them
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, waited: bool, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.checkouts += not timed_out
+            self.waits += waited
+            self.timeouts += timed_out
+            self.wait_time += seconds
+            self.max_wait_time = max(self.max_wait_time, seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return\
+            {
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "wait_time": self.wait_time,
+                "max_wait_time": self.max_wait_time
+            }
+
+class PoolWaitMixin:
+    """
+    Times every checkout of a QueuePool, a checkout waits when no idle connection is left and overflow is exhausted
+    """
+    stats: PoolStats
+
+    def _do_get(self):
+        waited = self.checkedin() == 0 and self.overflow() >= self._max_overflow
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record(waited, time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(waited, time.perf_counter() - start)
+        return connection
+
+class InstrumentedQueuePool(PoolWaitMixin, QueuePool):
+    stats = PoolStats()
+
+class InstrumentedAsyncQueuePool(PoolWaitMixin, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+
+def pool_options(url: str, async_driver: bool = False) -> dict:
+    """
+    Returns the create_engine pool/connection arguments configured through the DB_POOL_* variables
+    """
+    options = dict\
+    (
+        poolclass=InstrumentedAsyncQueuePool if async_driver else InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING
+    )
+    # Server-side timeout, so a runaway query can't hold a pooled connection forever
+    if DB_STATEMENT_TIMEOUT and url.startswith("postgresql"):
+        if async_driver:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"}
+    return options
+
+def pool_status(pool: QueuePool) -> dict:
+    """
+    Returns the live state and wait counters of a pool
+    """
+    return\
+    {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "timeout": DB_POOL_TIMEOUT,
+        **pool.stats.snapshot()
+    }
+
 engine = create_engine\
 (
-    SQLALCHEMY_DATABASE_URL
+    SQLALCHEMY_DATABASE_URL,
+    **pool_options(SQLALCHEMY_DATABASE_URL)
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The sync engine above stays available (tests, CLI commands, streaming exports) in async mode
+async_engine = create_async_engine\
+(
+    SQLALCHEMY_ASYNC_DATABASE_URL,
+    **pool_options(SQLALCHEMY_ASYNC_DATABASE_URL, async_driver=True)
+) if DB_ASYNC else None
+
+AsyncSessionLocal = async_sessionmaker(autoflush=False, bind=async_engine)
+
 Base = declarative_base()
 
 def get_db() -> SessionLocal:
@@ -32,4 +163,37 @@ def get_db() -> SessionLocal:
     finally:
         db.close()
 
-#Comments here 
\ No newline at end of file
+async def get_async_db() -> AsyncSession:
+    """
+    Returns an async db session, replaces get_db for all routes when DB_ASYNC is enabled
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def run_db(db: Session | AsyncSession, fn: Callable[[Session], Any]) -> Any:
+    """
+    Runs fn(session) without blocking the event loop: in the threadpool for a sync session,
+    through AsyncSession.run_sync (no thread needed) for an async one
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn)
+    return await run_in_threadpool(fn, db)
+
+def dialect_insert(db: Session, model: Any) -> Insert:
+    """
+    Returns an INSERT for the session's dialect, supporting ON CONFLICT on both Postgres and SQLite
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite_insert(model)
+    return postgresql_insert(model)
+
+def db_route(route: Callable) -> Callable:
+    """
+    Makes a route written against a sync `db` session work with both get_db and get_async_db
+    """
+    @functools.wraps(route)
+    async def wrapper(*args, db: Session | AsyncSession, **kwargs) -> Any:
+        return await run_db(db, lambda session: route(*args, db=session, **kwargs))
+    return wrapper
+
+#Comments here 
@@ -0,0 +1,230 @@
+from datetime import datetime, timezone
+from typing import Type
+
+from fastapi import APIRouter, Depends, Form, HTTPException, Query
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db import get_db, db_route
+from models import Conversation, DirectMessage, Users
+from pagination import keyset_page, keyset_merge_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from ratelimit import limit, WRITE
+from realtime import hub
+from replicas import get_read_db, mark_written
+from schemas import InboxPageSchema, MessagePageSchema, MessageSchema, UnreadSchema
+from utils import CurrentUser, get_current_user, not_found
+
+DM_PREVIEW_LENGTH = 200  # characters of the last message shown in the inbox
+
+router = APIRouter(
+    tags=["direct messages"]
+)
+
+def find_conversation(db: Session, user_id: int, other_id: int) -> Type[Conversation] | None:
+    """
+    Returns the conversation between two users, whichever of them started it
+    """
+    return db.query(Conversation).filter\
+    (
+        or_
+        (
+            and_(Conversation.initiator_id.__eq__(user_id), Conversation.receiver_id.__eq__(other_id)),
+            and_(Conversation.initiator_id.__eq__(other_id), Conversation.receiver_id.__eq__(user_id))
+        )
+    ).first()
+
+def get_or_create_conversation(db: Session, user_id: int, other_id: int) -> Type[Conversation]:
+    conversation = find_conversation(db, user_id, other_id)
+    if conversation:
+        return conversation
+
+    conversation = Conversation\
+    (
+        date=datetime.now(timezone.utc).date(),
+        initiator_id=user_id,
+        receiver_id=other_id
+    )
+    try:
+        with db.begin_nested():
+            db.add(conversation)
+    except IntegrityError:
+        # Both users started it at the same time, the unique pair index kept the other one
+        return find_conversation(db, user_id, other_id)
+    return conversation
+
+def get_participant_conversation(conversation_id: int, user: CurrentUser, db: Session, lock: bool = False
+) -> Type[Conversation]:
+    """
+    Returns the conversation if the user takes part in it, 404 otherwise so other users' conversation ids can't be probed
+    """
+    query = db.query(Conversation).filter(Conversation.id.__eq__(conversation_id))
+    if lock:
+        query = query.with_for_update()
+    conversation = query.first()
+    if not conversation or user.id not in (conversation.initiator_id, conversation.receiver_id):
+        raise not_found
+    return conversation
+
+@router.get("/", response_model=InboxPageSchema)
+@db_route
+def get_inbox(cursor: str | None = None,
+              limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+              db: Session = Depends(get_read_db),
+              user: CurrentUser = Depends(get_current_user)
+) -> dict:
+    """
+    Lists one page of the user's conversations, most recently active first, with the last message and unread count.
+    Everything comes from the conversation row and two joins, so the cost doesn't grow with the number of messages.
+    The conversations the user started and those they received are read separately, each in the order of its
+    (participant, last_message_at, id) index, and merged, an OR of both would sort all of the user's conversations
+    """
+    def participant_query(own_id, other_id, unread):
+        return db.query\
+        (
+            Conversation.id,
+            Conversation.last_message_at,
+            Conversation.last_message_id,
+            other_id.label("other_user_id"),
+            Users.username.label("other_username"),
+            func.substr(DirectMessage.text, 1, DM_PREVIEW_LENGTH).label("last_message"),
+            unread.label("unread")
+        )\
+        .join(Users, Users.id.__eq__(other_id))\
+        .outerjoin(DirectMessage, DirectMessage.id.__eq__(Conversation.last_message_id))\
+        .filter(own_id.__eq__(user.id), Conversation.last_message_at.isnot(None))
+
+    conversations, next_cursor, prev_cursor = keyset_merge_page\
+    (
+        [
+            participant_query(Conversation.initiator_id, Conversation.receiver_id, Conversation.initiator_unread),
+            participant_query(Conversation.receiver_id, Conversation.initiator_id, Conversation.receiver_unread)
+        ],
+        [Conversation.last_message_at, Conversation.id],
+        f"inbox:{user.id}",
+        cursor,
+        limit,
+        descending=True
+    )
+
+    return {"items": conversations, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
+
+@router.get("/unread", response_model=UnreadSchema)
+@db_route
+def get_unread_count(db: Session = Depends(get_read_db), user: CurrentUser = Depends(get_current_user)) -> dict:
+    """
+    Returns the user's total of unread messages, kept on the user row
+    """
+    unread = db.query(Users.unread_messages).filter(Users.id.__eq__(user.id)).scalar()
+    return {"unread": unread or 0}
+
+@router.post("/send", response_model=MessageSchema, dependencies=[Depends(limit(WRITE))])
+@db_route
+def send_message(recipient_id: int = Form(...),
+                 text: str = Form(..., min_length=1),
+                 db: Session = Depends(get_db),
+                 user: CurrentUser = Depends(get_current_user)
+) -> MessageSchema:
+    """
+    Sends a message to a user, starting a conversation with them if there's none yet
+    """
+    if recipient_id == user.id:
+        raise HTTPException(status_code=400, detail="You can't message yourself.")
+    if not db.query(Users.id).filter(Users.id.__eq__(recipient_id)).scalar():
+        raise not_found
+
+    conversation = get_or_create_conversation(db, user.id, recipient_id)
+    now = datetime.now(timezone.utc)
+
+    message = DirectMessage\
+    (
+        text=text,
+        date=now.date(),
+        conversation_id=conversation.id,
+        sender_id=user.id
+    )
+    db.add(message)
+    db.flush()
+
+    # Counters are incremented in place, so concurrent sends never lose an update
+    unread = Conversation.receiver_unread if conversation.initiator_id == user.id else Conversation.initiator_unread
+    db.query(Conversation).filter(Conversation.id.__eq__(conversation.id)).update\
+    (
+        {
+            Conversation.last_message_at: now,
+            Conversation.last_message_id: message.id,
+            unread: unread + 1
+        },
+        synchronize_session=False
+    )
+    # Bulk update without the principal cache's ORM events, unread_messages isn't part of the cached principal
+    db.query(Users).filter(Users.id.__eq__(recipient_id)).update\
+    (
+        {Users.unread_messages: Users.unread_messages + 1},
+        synchronize_session=False
+    )
+    db.commit()
+
+    sent = MessageSchema.model_validate(message)
+    # The sender's channel too, so their other open clients see the message
+    for user_id in (recipient_id, user.id):
+        hub.publish(f"user:{user_id}", {"type": "message", "message": sent.model_dump(mode="json")})
+    mark_written(user)
+
+    return sent
+
+@router.get("/{conversation_id}", response_model=MessagePageSchema)
+@db_route
+def get_messages(conversation_id: int,
+                 cursor: str | None = None,
+                 limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                 db: Session = Depends(get_read_db),
+                 user: CurrentUser = Depends(get_current_user)
+) -> dict:
+    """
+    Lists one page of a conversation's messages, newest first. next_cursor goes back in time, prev_cursor forward
+    """
+    get_participant_conversation(conversation_id, user, db)
+
+    messages, next_cursor, prev_cursor = keyset_page\
+    (
+        db.query(DirectMessage).filter(DirectMessage.conversation_id.__eq__(conversation_id)),
+        [DirectMessage.date, DirectMessage.id],
+        f"conversation:{conversation_id}",
+        cursor,
+        limit,
+        descending=True
+    )
+
+    return {"items": messages, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
+
+@router.post("/{conversation_id}/read", response_model=UnreadSchema)
+@db_route
+def mark_conversation_read(conversation_id: int,
+                           db: Session = Depends(get_db),
+                           user: CurrentUser = Depends(get_current_user)
+) -> dict:
+    """
+    Marks the conversation read for the user and returns their remaining unread total
+    """
+    # Locked so a message sent meanwhile is counted either before or after, never lost
+    conversation = get_participant_conversation(conversation_id, user, db, lock=True)
+    unread = Conversation.initiator_unread if conversation.initiator_id == user.id else Conversation.receiver_unread
+    count = getattr(conversation, unread.key)
+
+    if count:
+        db.query(Conversation).filter(Conversation.id.__eq__(conversation_id)).update\
+        (
+            {unread: 0},
+            synchronize_session=False
+        )
+        # Like in send_message, the cached principal doesn't hold unread_messages
+        db.query(Users).filter(Users.id.__eq__(user.id)).update\
+        (
+            {Users.unread_messages: Users.unread_messages - count},
+            synchronize_session=False
+        )
+    db.commit()
+    mark_written(user)
+
+    return {"unread": db.query(Users.unread_messages).filter(Users.id.__eq__(user.id)).scalar() or 0}
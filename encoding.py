@@ -0,0 +1,73 @@
+import gzip
+import os
+import threading
+from typing import Any
+
+import orjson
+from fastapi import Request
+
+try:
+    import brotli
+except ImportError:  # optional, responses fall back to gzip without it
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))  # bytes, smaller bodies aren't worth compressing
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))  # 0-11, higher levels cost far more CPU for little gain
+
+# Preferred first
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+def dumps(content: Any) -> bytes:
+    """
+    Encodes plain data (dicts, lists, rows' _asdict()) to JSON without going through Pydantic
+    """
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+def pick_encoding(request: Request) -> str | None:
+    """
+    Returns the best supported encoding the client accepts, None for identity
+    """
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        accepted[name.strip().lower()] = quality
+
+    for encoding in SUPPORTED_ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+class EncodedBody:
+    """
+    A JSON body and its compressed variants, each compressed once on first use so cached bodies are shared by every hit
+    """
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self._variants: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding: str | None) -> tuple[bytes, str | None]:
+        """
+        Returns the body in the encoding and the encoding actually used, small bodies always stay identity
+        """
+        if encoding is None or len(self.body) < COMPRESS_MIN_SIZE:
+            return self.body, None
+        with self._lock:
+            if encoding not in self._variants:
+                self._variants[encoding] = compress(self.body, encoding)
+            return self._variants[encoding], encoding
+
@@ -0,0 +1,76 @@
+import asyncio
+import math
+import os
+
+from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool, QueuePool
+
+from db import DB_MAX_OVERFLOW, SQLALCHEMY_DATABASE_URL, async_engine, engine, pool_status
+from replicas import replica_set
+from schemas import HealthSchema
+
+HEALTH_DB_TIMEOUT = float(os.getenv("HEALTH_DB_TIMEOUT", "2"))  # seconds the readiness query may take
+
+router = APIRouter(
+    tags=["health"]
+)
+
+# The probe connects on its own, each attempt bounded by HEALTH_DB_TIMEOUT: a checkout from the app's pool can wait
+# DB_POOL_TIMEOUT, holding a thread of the limiter the routes use while the pool is exhausted
+ping_engine = create_engine\
+(
+    SQLALCHEMY_DATABASE_URL,
+    poolclass=NullPool,
+    connect_args=
+    {
+        "connect_timeout": max(1, math.ceil(HEALTH_DB_TIMEOUT)),
+        "options": f"-c statement_timeout={int(HEALTH_DB_TIMEOUT * 1000)}"
+    } if engine.dialect.name == "postgresql" else {"timeout": HEALTH_DB_TIMEOUT}
+)
+
+def serving_pool() -> QueuePool:
+    """
+    The pool the routes check out from: the async engine's in DB_ASYNC mode, the sync engine's otherwise
+    """
+    return async_engine.pool if async_engine else engine.pool
+
+def ping_database() -> None:
+    """
+    Raises if the routes' pool has no connection to spare or the database doesn't answer within HEALTH_DB_TIMEOUT
+    """
+    pool = serving_pool()
+    if pool.checkedin() == 0 and pool.overflow() >= DB_MAX_OVERFLOW:
+        raise RuntimeError("Connection pool exhausted")
+    with ping_engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+@router.get("", response_model=HealthSchema)
+async def health() -> ORJSONResponse:
+    """
+    Readiness probe for load balancers and orchestrators, no login needed: 200 while the routes' pool has a connection
+    to spare and the primary answers within HEALTH_DB_TIMEOUT, 503 otherwise
+    """
+    error = None
+    try:
+        await asyncio.wait_for(run_in_threadpool(ping_database), HEALTH_DB_TIMEOUT)
+    except asyncio.TimeoutError:
+        error = f"No database answer within {HEALTH_DB_TIMEOUT}s"
+    except Exception as exception:
+        error = str(exception).splitlines()[0]
+
+    return ORJSONResponse\
+    (
+        status_code=503 if error else 200,
+        content=
+        {
+            "status": "unavailable" if error else "ok",
+            "database": error or "ok",
+            "pool": pool_status(engine.pool),
+            "pool_async": pool_status(async_engine.pool) if async_engine else None,
+            "healthy_replicas": sum(replica.healthy for replica in replica_set.replicas),
+            "replicas": len(replica_set.replicas)
+        }
+    )
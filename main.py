@@ -1,18 +1,78 @@
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+
+from db import DB_ASYNC, get_db, get_async_db
+from encoding import COMPRESS_MIN_SIZE, GZIP_LEVEL
+from health import router as health_router
+from passwords import shutdown_hash_pool
+from profiling import PROFILING, ProfilingMiddleware
+from server import configure_threadpool
+from votes import vote_buffer
 from auth import router as auth_router
-# from admin import router as admin_router
+from admin import router as admin_router
 from categories import router as category_router
 from topics import router as topics_router
 from posts import router as posts_router
+from dms import router as dms_router
+from realtime import router as realtime_router, hub
+from replicas import replica_set
+from search import router as search_router, load_search_index
+from trending import router as trending_router, trending
+from warmup import FirstRequestTimer, record_startup, warm_up
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    configure_threadpool()
+    load_search_index()
+    hub.start()
+    replica_set.start()
+    trending.start()
+    if vote_buffer:
+        vote_buffer.start()
+    # Before serving, so the first requests after a deploy don't pay for connecting and compiling
+    await warm_up()
+    record_startup(started)
+    yield
+    if vote_buffer:
+        # Flushes the votes still buffered before the process exits
+        vote_buffer.stop()
+    trending.stop()
+    replica_set.stop()
+    hub.stop()
+    shutdown_hash_pool()
+
+# Routes that don't build their own body are encoded with orjson too
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+if DB_ASYNC:
+    # Every route depends on get_db, in async mode they all get an AsyncSession instead
+    app.dependency_overrides[get_db] = get_async_db
+
+# Compresses the responses not compressed already, cached listings bring their own (brotli when installed)
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_SIZE, compresslevel=GZIP_LEVEL)
+
+if PROFILING:
+    app.add_middleware(ProfilingMiddleware)
 
-app = FastAPI()
+app.add_middleware(FirstRequestTimer)
 
+app.include_router(health_router, prefix="/health")
 app.include_router(auth_router, prefix="/auth")
-# app.include_router(admin_router, prefix="/admin")
+app.include_router(admin_router, prefix="/admin")
 app.include_router(category_router, prefix="/categories")
 app.include_router(topics_router, prefix="/topics")
 app.include_router(posts_router, prefix="/posts")
+app.include_router(search_router, prefix="/search")
+app.include_router(dms_router, prefix="/dms")
+app.include_router(realtime_router, prefix="/realtime")
+app.include_router(trending_router, prefix="/trending")
 
 if __name__ == "__main__":
+    # Development server, production runs server.py
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8080, reload=True)
\ No newline at end of file
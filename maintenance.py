@@ -0,0 +1,129 @@
+import argparse
+
+from sqlalchemy import case, select, func, update
+from sqlalchemy.orm import Session
+
+from archive import ARCHIVE_IDLE_DAYS, archive_topic, find_cold_topics
+from db import SessionLocal
+from models import Category, Post, PostInteraction, Topic
+
+
+def reconcile_votes(db: Session, post_id: int | None = None) -> int:
+    """
+    Rebuilds the vote counters of all posts (or a single one) from post_interactions.
+    Returns the number of updated posts
+    """
+    def count_votes(vote: bool):
+        return select(func.count(PostInteraction.id)).where\
+        (
+            PostInteraction.post_id.__eq__(Post.id),
+            PostInteraction.vote.is_(vote)
+        ).scalar_subquery()
+
+    statement = update(Post).values\
+    (
+        upvotes=count_votes(True),
+        downvotes=count_votes(False),
+        score=count_votes(True) - count_votes(False)
+    )
+    if post_id is not None:
+        statement = statement.where(Post.id.__eq__(post_id))
+
+    result = db.execute(statement.execution_options(synchronize_session=False))
+    db.commit()
+    return result.rowcount
+
+
+def reconcile_activity(db: Session, topic_id: int | None = None) -> tuple[int, int]:
+    """
+    Rebuilds the post counts and last posts of all topics (or a single one and its category) from posts,
+    then the categories' from their topics. Archived topics keep the summary they were archived with.
+    Returns the numbers of updated topics and categories
+    """
+    post_count = select(func.count(Post.id)).where(Post.topic_id.__eq__(Topic.id)).scalar_subquery()
+    last_post = select(Post.id, Post.created_at).where(Post.topic_id.__eq__(Topic.id)).order_by(Post.id.desc()).limit(1)
+
+    topics = update(Topic).values\
+    (
+        post_count=post_count,
+        reply_count=case((post_count > 0, post_count - 1), else_=0),
+        last_post_id=last_post.with_only_columns(Post.id).scalar_subquery(),
+        last_post_at=last_post.with_only_columns(Post.created_at).scalar_subquery()
+    ).where(Topic.archived.is_(False))
+
+    def topic_total(column):
+        return select(func.coalesce(func.sum(column), 0)).where(Topic.category_id.__eq__(Category.id)).scalar_subquery()
+
+    last_topic = select(Topic.last_post_id, Topic.last_post_at)\
+        .where(Topic.category_id.__eq__(Category.id), Topic.last_post_id.isnot(None))\
+        .order_by(Topic.last_post_id.desc()).limit(1)
+
+    categories = update(Category).values\
+    (
+        post_count=topic_total(Topic.post_count),
+        reply_count=topic_total(Topic.reply_count),
+        last_post_id=last_topic.with_only_columns(Topic.last_post_id).scalar_subquery(),
+        last_post_at=last_topic.with_only_columns(Topic.last_post_at).scalar_subquery()
+    )
+
+    if topic_id is not None:
+        topics = topics.where(Topic.id.__eq__(topic_id))
+        categories = categories.where(Category.id.__eq__(select(Topic.category_id).where(Topic.id.__eq__(topic_id))
+                                                         .scalar_subquery()))
+
+    updated_topics = db.execute(topics.execution_options(synchronize_session=False)).rowcount
+    updated_categories = db.execute(categories.execution_options(synchronize_session=False)).rowcount
+    db.commit()
+    return updated_topics, updated_categories
+
+
+def archive_cold_topics(db: Session, idle_days: float, limit: int, topic_id: int | None = None) -> tuple[int, int]:
+    """
+    Archives one topic or up to limit cold ones (see find_cold_topics), each in its own transaction.
+    Returns the numbers of archived topics and posts
+    """
+    topic_ids = [topic_id] if topic_id is not None else find_cold_topics(db, idle_days, limit)
+    topics = posts = 0
+    for cold_topic_id in topic_ids:
+        archived_posts = archive_topic(cold_topic_id, db)
+        topics += 1
+        posts += archived_posts
+    return topics, posts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Forum maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    votes_parser = commands.add_parser("reconcile-votes", help="Rebuild post vote counters from post_interactions")
+    votes_parser.add_argument("--post-id", type=int, default=None, help="Only reconcile this post")
+
+    activity_parser = commands.add_parser("reconcile-activity",
+                                          help="Rebuild topic and category post counts and last posts from posts")
+    activity_parser.add_argument("--topic-id", type=int, default=None, help="Only reconcile this topic and its category")
+
+    archive_parser = commands.add_parser("archive-topics", help="Move cold topics' posts and votes into archived_topics")
+    archive_parser.add_argument("--idle-days", type=float, default=ARCHIVE_IDLE_DAYS,
+                                help="Archive topics without a post in this many days (locked ones always)")
+    archive_parser.add_argument("--limit", type=int, default=100, help="Most topics archived in this run")
+    archive_parser.add_argument("--topic-id", type=int, default=None, help="Only archive this topic")
+
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "reconcile-votes":
+            updated = reconcile_votes(db, args.post_id)
+            print(f"Reconciled vote counters of {updated} post(s)")
+        elif args.command == "reconcile-activity":
+            topics, categories = reconcile_activity(db, args.topic_id)
+            print(f"Reconciled activity of {topics} topic(s) and {categories} category(ies)")
+        elif args.command == "archive-topics":
+            topics, posts = archive_cold_topics(db, args.idle_days, args.limit, args.topic_id)
+            print(f"Archived {topics} topic(s) with {posts} post(s)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
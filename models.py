@@ -1,5 +1,7 @@
+from datetime import datetime, timezone
+
 from sqlalchemy import Column, Integer, String, Boolean, Date, Text, ForeignKey, DateTime, CheckConstraint, \
-    UniqueConstraint
+    UniqueConstraint, LargeBinary, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -17,6 +19,7 @@ class Users(Base):
     nickname = Column(String(50))  # Changed from 45 to 50
     registration_date = Column(Date, nullable=False)  # Removed default=date.today
     admin = Column(Boolean, nullable=False, default=False)  # Added nullable=False
+    unread_messages = Column(Integer, nullable=False, default=0, server_default="0")  # Maintained on DM send/read
 
     topics = relationship("Topic", back_populates="user")
     posts = relationship("Post", back_populates="user")
@@ -36,6 +39,11 @@ class Category(Base):
     description = Column(Text, nullable=False)  # Changed from String(255), removed name
     visibility = Column(Boolean, nullable=False, default=True)  # Added nullable=False
     locked = Column(Boolean, nullable=False, default=False)  # Added nullable=False
+    # Activity summary of the category's topics, maintained on every new and deleted post
+    post_count = Column(Integer, nullable=False, default=0, server_default="0")
+    reply_count = Column(Integer, nullable=False, default=0, server_default="0")  # posts after each topic's first
+    last_post_id = Column(Integer)
+    last_post_at = Column(DateTime(timezone=True))
 
     topics = relationship("Topic", back_populates="category")
     privileges = relationship("CategoryAccessPrivilege", back_populates="category")
@@ -52,6 +60,12 @@ class Topic(Base):
     locked = Column(Boolean, nullable=False, default=False)  # Added nullable=False
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), nullable=False)
+    archived = Column(Boolean, nullable=False, default=False, server_default="false")  # Posts moved to archived_topics
+    # Activity summary, maintained on every new and deleted post
+    post_count = Column(Integer, nullable=False, default=0, server_default="0")
+    reply_count = Column(Integer, nullable=False, default=0, server_default="0")  # posts after the first
+    last_post_id = Column(Integer)
+    last_post_at = Column(DateTime(timezone=True))
 
     user = relationship("Users", back_populates="topics")
     category = relationship("Category", back_populates="topics")
@@ -67,6 +81,11 @@ class Post(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     topic_id = Column(Integer, ForeignKey("topics.id", ondelete="CASCADE"), nullable=False)
     category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), nullable=False)
+    upvotes = Column(Integer, nullable=False, default=0, server_default="0")  # Maintained on every vote change
+    downvotes = Column(Integer, nullable=False, default=0, server_default="0")  # Maintained on every vote change
+    score = Column(Integer, nullable=False, default=0, server_default="0")  # upvotes - downvotes
+    created_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc),
+                        server_default=func.now())
 
     user = relationship("Users", back_populates="posts")
     topic = relationship("Topic", back_populates="posts")
@@ -96,6 +115,10 @@ class Conversation(Base):
     date = Column(Date, nullable=False)  # Changed from DateTime
     initiator_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     receiver_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    last_message_at = Column(DateTime(timezone=True))  # Inbox sort key, set on every message
+    last_message_id = Column(Integer)
+    initiator_unread = Column(Integer, nullable=False, default=0, server_default="0")
+    receiver_unread = Column(Integer, nullable=False, default=0, server_default="0")
 
     initiator = relationship("Users", foreign_keys=[initiator_id], backref="initiated_conversations")
     receiver = relationship("Users", foreign_keys=[receiver_id], back_populates="received_messages")
@@ -126,4 +149,20 @@ class CategoryAccessPrivilege(Base):
     __table_args__ = (UniqueConstraint('user_id', 'category_id'),)  # Added unique constraint
 
     user = relationship("Users", back_populates="category_privileges")
-    category = relationship("Category", back_populates="privileges")
\ No newline at end of file
+    category = relationship("Category", back_populates="privileges")
+
+
+class ArchivedTopic(Base):
+    __tablename__ = "archived_topics"
+
+    topic_id = Column(Integer, ForeignKey("topics.id", ondelete="CASCADE"), primary_key=True)
+    post_count = Column(Integer, nullable=False)
+    archived_at = Column(DateTime(timezone=True), nullable=False)
+    data = Column(LargeBinary, nullable=False)  # zlib-compressed JSON of the topic's posts and votes
+
+
+class ArchivedPost(Base):
+    __tablename__ = "archived_posts"
+
+    post_id = Column(Integer, primary_key=True)  # Which archived topic holds a post, for views by post id
+    topic_id = Column(Integer, ForeignKey("topics.id", ondelete="CASCADE"), nullable=False)
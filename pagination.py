@@ -0,0 +1,189 @@
+import base64
+import binascii
+import heapq
+import json
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from itertools import islice
+from typing import Any, Callable
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+invalid_cursor = HTTPException \
+(
+        status_code=400,
+        detail="Invalid pagination cursor."
+)
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    return value
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        return date.fromisoformat(value["d"])
+    return value
+
+def encode_cursor(scope: str, key: tuple, direction: str) -> str:
+    """
+    Builds an opaque cursor pointing after (next) or before (prev) the row with the provided sort key
+    """
+    raw = json.dumps([scope, direction, [_encode_value(value) for value in key]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, scope: str) -> tuple[tuple, str]:
+    """
+    Returns the sort key and direction of a cursor or raises an error if it's invalid or belongs to another listing
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_scope, direction, key = json.loads(raw)
+        if not isinstance(key, list) or any(isinstance(value, list) for value in key):
+            raise ValueError("not a sort key")
+        key = tuple(_decode_value(value) for value in key)
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise invalid_cursor
+
+    if cursor_scope != scope or direction not in ("next", "prev"):
+        raise invalid_cursor
+    return key, direction
+
+def keyset_page(query: Query,
+                columns: list,
+                scope: str,
+                cursor: str | None,
+                limit: int,
+                descending: bool = False,
+                key: Callable[[Any], tuple] | None = None
+) -> tuple[list, str | None, str | None]:
+    """
+    Returns one page of the query ordered by the provided (unique together) columns plus next/prev cursors.
+    The query must already be filtered to the listing (e.g. one topic), scope names that listing in the cursors.
+    """
+    if key is None:
+        key = lambda row: tuple(getattr(row, column.key) for column in columns)
+
+    query, direction = _order_after_cursor(query, columns, scope, cursor, descending)
+    rows = query.limit(limit + 1).all()
+    return _page_with_cursors(rows, key, scope, cursor, limit, direction)
+
+def keyset_merge_page(queries: list[Query],
+                      columns: list,
+                      scope: str,
+                      cursor: str | None,
+                      limit: int,
+                      descending: bool = False,
+                      key: Callable[[Any], tuple] | None = None
+) -> tuple[list, str | None, str | None]:
+    """
+    keyset_page over the union of queries with no row in common, e.g. the branches of an OR that can't use one index.
+    Each query reads at most a page and one more row in the sort order (from its own index) and the rows are merged,
+    so no branch is sorted in full
+    """
+    if key is None:
+        key = lambda row: tuple(getattr(row, column.key) for column in columns)
+
+    branches = []
+    for query in queries:
+        query, direction = _order_after_cursor(query, columns, scope, cursor, descending)
+        branches.append(query.limit(limit + 1).all())
+    reverse = (direction == "prev") != descending
+    rows = list(islice(heapq.merge(*branches, key=key, reverse=reverse), limit + 1))
+    return _page_with_cursors(rows, key, scope, cursor, limit, direction)
+
+def _matches_column(column, value: Any) -> bool:
+    """
+    Checks a cursor's key value against its column's type, a forged one would otherwise fail in the database
+    """
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return True
+    return value is None or isinstance(value, python_type)
+
+def _order_after_cursor(query: Query, columns: list, scope: str, cursor: str | None, descending: bool
+) -> tuple[Query, str]:
+    """
+    Filters the query to the rows after the cursor and orders it in the direction read, returns it and the direction
+    """
+    direction = "next"
+    if cursor:
+        after, direction = decode_cursor(cursor, scope)
+        if len(after) != len(columns) or not all(map(_matches_column, columns, after)):
+            raise invalid_cursor
+
+        sort_key = tuple_(*columns) if len(columns) > 1 else columns[0]
+        bound = tuple_(*after) if len(columns) > 1 else after[0]
+        # Going backwards over an ascending listing is the same as going forward over a descending one
+        if (direction == "next") != descending:
+            query = query.filter(sort_key > bound)
+        else:
+            query = query.filter(sort_key < bound)
+
+    reverse = (direction == "prev") != descending
+    return query.order_by(*[column.desc() if reverse else column.asc() for column in columns]), direction
+
+def _page_with_cursors(rows: list, key: Callable[[Any], tuple], scope: str, cursor: str | None, limit: int,
+                       direction: str
+) -> tuple[list, str | None, str | None]:
+    """
+    Cuts the rows read (up to limit + 1, in the direction read) to the page and builds its cursors
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if direction == "prev":
+        rows.reverse()
+        prev_cursor = encode_cursor(scope, key(rows[0]), "prev") if has_more else None
+        next_cursor = encode_cursor(scope, key(rows[-1]), "next") if rows else None
+    else:
+        next_cursor = encode_cursor(scope, key(rows[-1]), "next") if has_more else None
+        prev_cursor = encode_cursor(scope, key(rows[0]), "prev") if cursor and rows else None
+
+    return rows, next_cursor, prev_cursor
+
+def keyset_slice(rows: list,
+                 key: Callable[[Any], tuple],
+                 scope: str,
+                 cursor: str | None,
+                 limit: int
+) -> tuple[list, str | None, str | None]:
+    """
+    keyset_page over rows kept outside the database, already sorted ascending by key(row).
+    The cursors are the same as keyset_page's, so a listing can move between the two
+    """
+    start, end = 0, min(limit, len(rows))
+    direction = "next"
+    if cursor:
+        bound, direction = decode_cursor(cursor, scope)
+        try:
+            if direction == "next":
+                start = bisect_right(rows, bound, key=key)
+                end = min(start + limit, len(rows))
+            else:
+                end = bisect_left(rows, bound, key=key)
+                start = max(0, end - limit)
+        except TypeError:
+            # A key of other types than the rows', forged or from another listing
+            raise invalid_cursor
+
+    page = rows[start:end]
+    if direction == "prev":
+        prev_cursor = encode_cursor(scope, key(page[0]), "prev") if start > 0 else None
+        next_cursor = encode_cursor(scope, key(page[-1]), "next") if page else None
+    else:
+        next_cursor = encode_cursor(scope, key(page[-1]), "next") if end < len(rows) else None
+        prev_cursor = encode_cursor(scope, key(page[0]), "prev") if cursor and page else None
+
+    return page, next_cursor, prev_cursor
@@ -0,0 +1,114 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+from server import SERVER_WORKERS
+
+# scrypt cost, memory used per hash is 128 * N * R bytes (16 MiB with the defaults)
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+# Hash processes per server worker: the SERVER_WORKERS processes split the cores, so all of them together run about
+# one hash per core. Raise one of the two and lower the other, their product is what competes for the CPUs
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // SERVER_WORKERS))))
+# Hashes allowed in flight, the rest wait instead of piling up in the pool's queue
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", str(PASSWORD_HASH_WORKERS * 2)))
+
+SCHEME = "scrypt"
+
+_pool: ProcessPoolExecutor | None = None
+# A semaphore is bound to the event loop that first waits on it, so each loop gets its own
+_slots: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+
+def hash_password(password: str) -> str:
+    """
+    Hashes a password with a random salt, formatted as scrypt$N$r$p$salt$hash
+    """
+    salt = secrets.token_bytes(16)
+    digest = _scrypt(password, salt, PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+    return f"{SCHEME}${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}${_b64encode(salt)}${_b64encode(digest)}"
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    """
+    Verifies a password against a scrypt hash or a legacy unsalted SHA-256 one, a malformed hash never matches
+    """
+    if not hashed_password.startswith(f"{SCHEME}$"):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy.encode(), hashed_password.encode())
+
+    try:
+        _, n, r, p, salt, digest = hashed_password.split("$")
+        expected = _scrypt(password, _b64decode(salt), int(n), int(r), int(p))
+        return hmac.compare_digest(expected, _b64decode(digest))
+    except ValueError:
+        # Truncated or corrupted: wrong field count, bad numbers or base64, parameters scrypt rejects
+        return False
+
+def needs_rehash(hashed_password: str) -> bool:
+    """
+    Checks if a hash is legacy SHA-256 or uses other scrypt parameters than the configured ones
+    """
+    if not hashed_password.startswith(f"{SCHEME}$"):
+        return True
+    _, n, r, p, _, _ = hashed_password.split("$")
+    return (int(n), int(r), int(p)) != (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+
+def get_hash_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool running the hashes, started on first use
+    """
+    global _pool
+    if _pool is None:
+        # spawn: the workers only import this module instead of forking a threaded server
+        _pool = ProcessPoolExecutor\
+        (
+            max_workers=PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+def shutdown_hash_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+def _loop_slots() -> asyncio.Semaphore:
+    """
+    Returns the running loop's semaphore of PASSWORD_HASH_CONCURRENCY slots, created on its first hash
+    """
+    loop = asyncio.get_running_loop()
+    slots = _slots.get(loop)
+    if slots is None:
+        slots = _slots[loop] = asyncio.Semaphore(PASSWORD_HASH_CONCURRENCY)
+    return slots
+
+async def hash_password_async(password: str) -> str:
+    """
+    hash_password run in the process pool
+    """
+    async with _loop_slots():
+        return await asyncio.wrap_future(get_hash_pool().submit(hash_password, password))
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    """
+    verify_password run in the process pool
+    """
+    async with _loop_slots():
+        return await asyncio.wrap_future(get_hash_pool().submit(verify_password, password, hashed_password))
@@ -1,109 +1,227 @@
-from typing import Tuple, Any, Type
-
-from fastapi import APIRouter, Depends, Form, HTTPException
-from sqlalchemy.orm import Session
-
-from db import get_db
-from models import Users, Post, Topic, PostInteraction
-from schemas import PostViewSchema
-from utils import get_current_user, not_found, can_user_see_topic, access_denied
+from typing import List, Type
+
+from fastapi import APIRouter, Depends, Form, HTTPException, Query
+from sqlalchemy import and_
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Query as SessionQuery, Session
+
+from activity import count_deleted_post
+from archive import get_archived_post, get_archived_posts, lock_unarchived_topic, topic_archived
+from db import get_db, db_route
+from models import Category, CategoryAccessPrivilege, Post, PostInteraction, Topic
+from ratelimit import limit, VOTE, WRITE
+from realtime import hub
+from replicas import get_read_db, mark_written
+from schemas import PostBatchEntrySchema, PostBatchSchema, PostSchema, PostViewSchema
+from search import search_backend
+from trending import trending, TRENDING_VOTE_WEIGHT
+from utils import CurrentUser, get_current_user, not_found, access_denied, is_category_visible
+from versions import versions
+from votes import NO_PENDING_VOTES, apply_vote, vote_buffer
 
 router = APIRouter(
     tags=["posts"]
 )
 
-def get_post_and_topic(post_id: int,
-                       user: Users,
-                       db: Session
-) -> tuple[Type[Post], Type[Topic]]:
+MAX_BATCH_POSTS = 200
+
+def visible_posts_query(user: CurrentUser, db: Session) -> SessionQuery:
     """
-    Checks permission and existence of provided post and its topic/category
+    Posts with everything their access check and view need: their topic and category,
+    the user's privilege for that category and the user's vote
     """
-    post = db.query(Post).filter(Post.id.__eq__(post_id)).first()
-    if not post:
-        raise not_found
-    topic = db.query(Topic).filter(Topic.id.__eq__(post.topic_id)).first()
-    if not topic:
+    return db.query\
+    (
+        Post,
+        Topic.id.label("found_topic_id"),
+        Topic.category_id.label("topic_category_id"),
+        Category.id.label("found_category_id"),
+        Category.visibility,
+        CategoryAccessPrivilege.permission_type,
+        PostInteraction.vote
+    )\
+    .outerjoin(Topic, Topic.id.__eq__(Post.topic_id))\
+    .outerjoin(Category, Category.id.__eq__(Topic.category_id))\
+    .outerjoin\
+    (
+        CategoryAccessPrivilege,
+        and_(CategoryAccessPrivilege.category_id.__eq__(Category.id), CategoryAccessPrivilege.user_id.__eq__(user.id))
+    )\
+    .outerjoin\
+    (
+        PostInteraction,
+        and_(PostInteraction.post_id.__eq__(Post.id), PostInteraction.user_id.__eq__(user.id))
+    )
+
+def check_post_row(row: Row, user: CurrentUser) -> tuple[Type[Post], int, bool | None]:
+    """
+    Checks the access to a visible_posts_query row, returns the post, its topic's category id and the user's vote
+    """
+    if row.found_topic_id is None:
         raise not_found
-    if not can_user_see_topic(user, topic, db):
+    # A missing category is forbidden (for admins too), like an empty resolve_visible_categories
+    if row.found_category_id is None or not is_category_visible(user, row.visibility, row.permission_type):
         raise access_denied
-    return post, topic
+    return row.Post, row.topic_category_id, row.vote
 
-@router.get("/{post_id}", response_model=PostViewSchema)
-def get_post_data(post_id: int,
-                  db: Session = Depends(get_db),
-                  user: Users = Depends(get_current_user)
+def get_visible_post(post_id: int,
+                     user: CurrentUser,
+                     db: Session,
+                     include_archived: bool = True
+) -> tuple[Type[Post], int, bool | None]:
+    """
+    Loads the post with everything its access check and view need in one query.
+    Returns the post, its topic's category id and the user's stored vote, or raises not_found/access_denied
+    exactly like the post -> topic -> category -> privilege lookups did.
+    Posts of archived topics come from the archive (a transient Post), or raise topic_archived without include_archived
+    """
+    row = visible_posts_query(user, db).filter(Post.id.__eq__(post_id)).first()
+
+    if not row:
+        # Only posts missing from the hot table cost the archive lookup
+        archived = get_archived_post(post_id, user, db)
+        if not include_archived:
+            raise topic_archived
+        return archived
+    return check_post_row(row, user)
+
+def build_post_view(post: Type[Post],
+                    user: CurrentUser,
+                    stored_vote: bool | None,
+                    pending: tuple[int, int, bool, bool | None] | None = None
 ) -> PostViewSchema:
     """
-    View post and its interactions
+    Builds the post view with its vote counters and the user's vote, including votes still in the write-behind buffer.
+    pending is the post's buffered change when the caller already read it for many posts (VoteBuffer.pending_views)
     """
-    post, topic = get_post_and_topic(post_id, user, db)
-
-    interactions = db.query(PostInteraction).filter(PostInteraction.post_id.__eq__(post_id)).all()
-    sum_interactions = 0
-    for interaction in interactions:
-        sum_interactions += -1 if not interaction.vote else 1
+    upvotes, downvotes = post.upvotes, post.downvotes
+    user_vote = stored_vote
+
+    if pending is None and vote_buffer:
+        pending = vote_buffer.pending_view(post.id, user.id)
+    if pending is not None:
+        pending_up, pending_down, has_buffered_vote, buffered_vote = pending
+        upvotes += pending_up
+        downvotes += pending_down
+        if has_buffered_vote:
+            user_vote = buffered_vote
 
-    user_interaction = None
-
-    for interaction in interactions:
-        if interaction.user_id == user.id:
-            user_interaction = interaction.vote
-
-    result = PostViewSchema\
+    return PostViewSchema\
     (
         post=post,
-        interactions=sum_interactions,
-        user_vote=user_interaction
+        interactions=upvotes - downvotes,
+        upvotes=upvotes,
+        downvotes=downvotes,
+        user_vote=user_vote
     )
 
-    return result
+@router.get("/batch", response_model=PostBatchSchema)
+@db_route
+def get_posts_batch(ids: List[int] = Query(..., min_length=1, max_length=MAX_BATCH_POSTS),
+                    db: Session = Depends(get_read_db),
+                    user: CurrentUser = Depends(get_current_user)
+) -> PostBatchSchema:
+    """
+    Views of many posts at once (?ids=1&ids=2...), in the order asked for, each with its status:
+    ok, not_found or forbidden. Costs one query for the posts, their access and the user's votes,
+    and one more (plus the uncached archived topics) when some ids aren't in the hot table
+    """
+    post_ids = list(dict.fromkeys(ids))
+    results: dict[int, tuple[Type[Post], int, bool | None] | HTTPException] = {}
+
+    for row in visible_posts_query(user, db).filter(Post.id.in_(post_ids)):
+        try:
+            results[row.Post.id] = check_post_row(row, user)
+        except HTTPException as error:
+            results[row.Post.id] = error
+
+    missing = [post_id for post_id in post_ids if post_id not in results]
+    if missing:
+        results.update(get_archived_posts(missing, user, db))
+
+    # The write-behind buffer is read under one lock for the whole batch
+    pending = vote_buffer.pending_views(post_ids, user.id) if vote_buffer else {}
+
+    items = []
+    for post_id in post_ids:
+        result = results.get(post_id, not_found)
+        if isinstance(result, HTTPException):
+            status = "forbidden" if result.status_code == 403 else "not_found"
+            items.append(PostBatchEntrySchema(id=post_id, status=status))
+        else:
+            post, _, stored_vote = result
+            view = build_post_view(post, user, stored_vote, pending.get(post_id, NO_PENDING_VOTES))
+            items.append(PostBatchEntrySchema(id=post_id, status="ok", view=view))
+
+    return PostBatchSchema(items=items)
 
-@router.post("/{post_id}/interaction", response_model=PostViewSchema)
+@router.get("/{post_id}", response_model=PostViewSchema)
+@db_route
+def get_post_data(post_id: int,
+                  db: Session = Depends(get_read_db),
+                  user: CurrentUser = Depends(get_current_user)
+) -> PostViewSchema:
+    """
+    View post and its interactions
+    """
+    post, category_id, stored_vote = get_visible_post(post_id, user, db)
+
+    return build_post_view(post, user, stored_vote)
+
+@router.post("/{post_id}/interaction", response_model=PostViewSchema, dependencies=[Depends(limit(VOTE))])
+@db_route
 def add_or_change_user_interaction(post_id: int,
                                    vote: int = Form(...),
                                    db: Session = Depends(get_db),
-                                   user: Users = Depends(get_current_user)
+                                   user: CurrentUser = Depends(get_current_user)
 ) -> PostViewSchema:
     """
     Update or add post interaction. 1 for upvote, 0 to remove interaction, -1 for downvote
     """
 
-    post, topic = get_post_and_topic(post_id, user, db)
-
-    interaction = db.query(PostInteraction).filter\
-    (
-        PostInteraction.post_id.__eq__(post_id),
-        PostInteraction.user_id.__eq__(user.id)
-    ).first()
+    post, category_id, stored_vote = get_visible_post(post_id, user, db, include_archived=False)
 
     interaction_type = True if vote == 1 else False if vote == -1 else None
 
-    if interaction_type is None:
-        if interaction:
-            db.delete(interaction)
-            db.commit()
+    if vote_buffer:
+        # Write-behind: the vote is written by the next flush, the response already includes it
+        vote_buffer.add(post_id, user.id, stored_vote, interaction_type)
     else:
-        if interaction:
-            interaction.vote = interaction_type
-        else:
-            interaction = PostInteraction\
-            (
-                vote=interaction_type,
-                post_id=post_id,
-                user_id=user.id
-            )
-            db.add(interaction)
+        lock_unarchived_topic(post.topic_id, db)
+        apply_vote(post_id, user.id, interaction_type, db)
         db.commit()
-
-    interactions = db.query(PostInteraction).filter(PostInteraction.post_id.__eq__(post_id)).all()
-    sum_votes = 0
-    for interaction in interactions:
-        sum_votes += -1 if not interaction.vote else 1
-
-    return PostViewSchema\
-    (
-        post=post,
-        interactions=sum_votes,
-        user_vote=interaction_type
-    )
\ No newline at end of file
+        stored_vote = interaction_type
+    trending.record(post.topic_id, category_id, TRENDING_VOTE_WEIGHT)
+    mark_written(user)
+
+    return build_post_view(post, user, stored_vote)
+
+@router.delete("/{post_id}", response_model=PostSchema, dependencies=[Depends(limit(WRITE))])
+@db_route
+def delete_post(post_id: int,
+                db: Session = Depends(get_db),
+                user: CurrentUser = Depends(get_current_user)
+) -> PostSchema:
+    """
+    Deletes a post with its interactions, only its author or an admin can. Posts of archived topics can't be deleted
+    """
+    post, _, _ = get_visible_post(post_id, user, db, include_archived=False)
+    if post.user_id != user.id and not user.admin:
+        raise access_denied
+    lock_unarchived_topic(post.topic_id, db)
+
+    deleted = PostSchema.model_validate(post)
+    db.query(PostInteraction).filter(PostInteraction.post_id.__eq__(post_id)).delete(synchronize_session=False)
+    db.delete(post)
+    db.flush()
+    count_deleted_post(post, db)
+    db.commit()
+    search_backend.remove_post(post_id)
+    versions.bump("topic", deleted.topic_id)
+    versions.bump("category", deleted.category_id)
+    versions.bump("categories")
+    mark_written(user)
+
+    hub.publish(f"topic:{deleted.topic_id}", {"type": "post_deleted", "post": deleted.model_dump()})
+
+    return deleted
@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILING = os.getenv("PROFILING", "false").lower() in ("1", "true", "yes")  # opt-in, adds work to every statement
+PROFILE_N_PLUS_ONE = int(os.getenv("PROFILE_N_PLUS_ONE", "3"))  # runs of one statement shape flagged as likely N+1
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))  # opt-in slow request log, 0 disables
+PROFILE_SLOW_SAMPLE = float(os.getenv("PROFILE_SLOW_SAMPLE", "1.0"))  # fraction of the slow requests logged
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger(f"{__name__}.slow")
+
+# Placeholder lists of expanding IN (...) and inline literals vary between otherwise identical statements
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|\$\d+|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|\$\d+|:\w+))*\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_WHITESPACE = re.compile(r"\s+")
+
+def statement_shape(statement: str) -> str:
+    """
+    Normalizes a statement so repeats with different parameters compare equal
+    """
+    shape = _PLACEHOLDER_LIST.sub("(?)", statement)
+    shape = _LITERAL.sub("?", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class RequestProfile:
+    """
+    The statements one request ran and the time spent on each
+    """
+
+    def __init__(self):
+        self.statements: list[tuple[str, float]] = []
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.statements.append((statement, seconds))
+
+    @property
+    def db_time(self) -> float:
+        return sum(seconds for _, seconds in self.statements)
+
+    def repeated_shapes(self) -> dict[str, int]:
+        """
+        Statement shapes run at least PROFILE_N_PLUS_ONE times, the usual sign of a query per row
+        """
+        shapes = Counter(statement_shape(statement) for statement, _ in self.statements)
+        return {shape: count for shape, count in shapes.items() if count >= PROFILE_N_PLUS_ONE}
+
+    def server_timing(self, elapsed: float) -> str:
+        timings =\
+        [
+            f'db;dur={self.db_time * 1000:.2f};desc="{len(self.statements)} queries"',
+            f"app;dur={elapsed * 1000:.2f}"
+        ]
+        if repeated := self.repeated_shapes():
+            timings.append(f'n-plus-one;desc="{len(repeated)} repeated statements"')
+        return ", ".join(timings)
+
+
+_current_profile: ContextVar[RequestProfile | None] = ContextVar("current_profile", default=None)
+
+def current_profile() -> RequestProfile | None:
+    return _current_profile.get()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if _current_profile.get() is not None:
+        context._profile_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    profile = _current_profile.get()
+    start = getattr(context, "_profile_start", None)
+    if profile is not None and start is not None:
+        profile.record(statement, time.perf_counter() - start)
+
+# Registered on the Engine class so every engine (sync, async's sync_engine, replicas) is covered, only when
+# profiling so statements aren't wrapped otherwise.
+# The context var is copied into the threadpool and run_sync greenlets, so route code is attributed too
+if PROFILING:
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the database work of every HTTP request: adds a Server-Timing header (db time and query count),
+    warns about likely N+1 statements and, when PROFILE_SLOW_MS is set, logs a sample of the slow requests
+    with their full statement list
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # Queries of a streamed body run after the headers, they only show up in the logs
+                MutableHeaders(scope=message).append("Server-Timing", profile.server_timing(time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_profile.reset(token)
+            self.report(scope, status, profile, time.perf_counter() - start)
+
+    @staticmethod
+    def report(scope: Scope, status: int, profile: RequestProfile, elapsed: float) -> None:
+        route = f"{scope['method']} {scope['path']}"
+
+        for shape, count in profile.repeated_shapes().items():
+            logger.warning("Likely N+1 in %s: %d x %s", route, count, shape)
+
+        if PROFILE_SLOW_MS and elapsed * 1000 >= PROFILE_SLOW_MS and random.random() < PROFILE_SLOW_SAMPLE:
+            slow_logger.warning("Slow request %s", json.dumps(
+            {
+                "route": route,
+                "status": status,
+                "duration_ms": elapsed * 1000,
+                "db_ms": profile.db_time * 1000,
+                "queries": len(profile.statements),
+                "statements": [{"sql": statement, "ms": seconds * 1000} for statement, seconds in profile.statements]
+            }))
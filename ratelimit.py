@@ -0,0 +1,215 @@
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from db import engine
+from utils import CurrentUser, get_current_user
+
+RATE_LIMIT = os.getenv("RATE_LIMIT", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory (per worker) or postgres (shared by all workers)
+RATE_LIMIT_PRUNE_CHANCE = 0.001  # share of postgres checks that also delete long-idle buckets
+
+
+@dataclass(frozen=True)
+class RouteClass:
+    """
+    Limits shared by a group of write routes: token buckets (requests per second and burst size) per user and
+    per IP, and the most requests of the group one worker serves at once. A rate of 0 disables that bucket
+    """
+    name: str
+    user_rate: float
+    user_burst: int
+    ip_rate: float
+    ip_burst: int
+    concurrency: int
+
+def route_class(name: str, user_rate: float, user_burst: int, ip_rate: float, ip_burst: int, concurrency: int
+) -> RouteClass:
+    """
+    Builds a route class, every limit can be overridden with RATE_<NAME>_<LIMIT>, e.g. RATE_WRITE_USER_RATE=2
+    """
+    def setting(limit: str, default: float) -> float:
+        return float(os.getenv(f"RATE_{name.upper()}_{limit}", str(default)))
+
+    return RouteClass\
+    (
+        name=name,
+        user_rate=setting("USER_RATE", user_rate),
+        user_burst=int(setting("USER_BURST", user_burst)),
+        ip_rate=setting("IP_RATE", ip_rate),
+        ip_burst=int(setting("IP_BURST", ip_burst)),
+        concurrency=int(setting("CONCURRENCY", concurrency))
+    )
+
+# Posts, categories and DMs
+WRITE = route_class("write", user_rate=0.5, user_burst=10, ip_rate=2, ip_burst=30, concurrency=32)
+VOTE = route_class("vote", user_rate=2, user_burst=30, ip_rate=10, ip_burst=100, concurrency=32)
+# Registration and login hash passwords, the most expensive requests there are, and have no user yet
+AUTH = route_class("auth", user_rate=0, user_burst=0, ip_rate=0.2, ip_burst=10, concurrency=8)
+
+
+class MemoryBuckets:
+    """
+    Token buckets of this worker only, each worker then allows the full rate
+    """
+
+    def __init__(self):
+        # Key -> theoretical arrival time (GCRA): when the bucket will be full again, an equivalent of tokens + timestamp
+        self._arrivals: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Takes a token, returns 0 when it was available or else the seconds until one is
+        """
+        interval = 1 / rate
+        now = time.time()
+        with self._lock:
+            arrival = max(self._arrivals.get(key, now), now) + interval
+            wait = arrival - now - burst * interval
+            if wait > 0:
+                return wait
+            self._arrivals[key] = arrival
+            if len(self._arrivals) > 100000:
+                # Buckets that are full again hold no state worth keeping
+                self._arrivals = {key: at for key, at in self._arrivals.items() if at > now}
+        return 0.0
+
+
+class PostgresBuckets:
+    """
+    Token buckets in an UNLOGGED table (sql/migrations/005_rate_limit_buckets.sql), shared by every worker.
+    Each check is a single upsert, a bucket that is empty is left unchanged
+    """
+
+    TAKE = text\
+    (
+        "INSERT INTO rate_limit_buckets AS b (key, arrival) VALUES (:key, :now + :interval) "
+        "ON CONFLICT (key) DO UPDATE SET arrival = GREATEST(b.arrival, :now) + :interval "
+        "WHERE GREATEST(b.arrival, :now) + :interval - :now <= :burst * :interval "
+        "RETURNING arrival"
+    )
+    ARRIVAL = text("SELECT arrival FROM rate_limit_buckets WHERE key = :key")
+    PRUNE = text("DELETE FROM rate_limit_buckets WHERE arrival < :now")
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+
+    def _take(self, key: str, rate: float, burst: int) -> float:
+        interval = 1 / rate
+        now = time.time()
+        with self.engine.begin() as connection:
+            if connection.execute(self.TAKE, {"key": key, "now": now, "interval": interval, "burst": burst}).first():
+                if random.random() < RATE_LIMIT_PRUNE_CHANCE:
+                    connection.execute(self.PRUNE, {"now": now})
+                return 0.0
+            arrival = connection.execute(self.ARRIVAL, {"key": key}).scalar() or now
+        return max(arrival + interval - now - burst * interval, 0.001)
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        return await run_in_threadpool(self._take, key, rate, burst)
+
+
+class AdmissionControl:
+    """
+    Admits a request to a route class or rejects it at once: 503 when the worker already serves the class's
+    concurrency cap, 429 when the user's or IP's bucket is empty. Both carry Retry-After, nothing is queued
+    """
+
+    def __init__(self, buckets: MemoryBuckets | PostgresBuckets):
+        self.buckets = buckets
+        self.rejections: Counter[tuple[str, str]] = Counter()
+        self._in_flight: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def reject(self, route: RouteClass, reason: str, status_code: int, retry_after: float) -> HTTPException:
+        with self._lock:
+            self.rejections[(route.name, reason)] += 1
+        return HTTPException\
+        (
+            status_code=status_code,
+            detail="Server busy, try again later." if status_code == 503 else "Too many requests, slow down.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    def enter(self, route: RouteClass) -> None:
+        with self._lock:
+            if self._in_flight[route.name] >= route.concurrency:
+                busy = True
+            else:
+                busy = False
+                self._in_flight[route.name] += 1
+        if busy:
+            raise self.reject(route, "concurrency", 503, 1)
+
+    def leave(self, route: RouteClass) -> None:
+        with self._lock:
+            self._in_flight[route.name] -= 1
+
+    async def check_buckets(self, route: RouteClass, ip: str, user: CurrentUser | None) -> None:
+        if route.ip_rate:
+            wait = await self.buckets.take(f"{route.name}:ip:{ip}", route.ip_rate, route.ip_burst)
+            if wait:
+                raise self.reject(route, "ip", 429, wait)
+        if route.user_rate and user is not None:
+            wait = await self.buckets.take(f"{route.name}:user:{user.id}", route.user_rate, route.user_burst)
+            if wait:
+                raise self.reject(route, "user", 429, wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            rejections =\
+            [
+                {"route_class": name, "reason": reason, "count": count}
+                for (name, reason), count in sorted(self.rejections.items())
+            ]
+            return {"backend": RATE_LIMIT_BACKEND, "in_flight": dict(self._in_flight), "rejections": rejections}
+
+
+admission = AdmissionControl(PostgresBuckets(engine) if RATE_LIMIT_BACKEND == "postgres" else MemoryBuckets())
+
+def client_ip(request: Request) -> str:
+    """
+    The client address, behind a trusted reverse proxy uvicorn already resolved it (SERVER_FORWARDED_ALLOW_IPS).
+    X-Forwarded-For isn't read here, clients can put any address first in it
+    """
+    return request.client.host if request.client else "unknown"
+
+@asynccontextmanager
+async def admitted(route: RouteClass, request: Request, user: CurrentUser | None) -> AsyncIterator[None]:
+    if not RATE_LIMIT:
+        yield
+        return
+    admission.enter(route)
+    try:
+        await admission.check_buckets(route, client_ip(request), user)
+        yield
+    finally:
+        admission.leave(route)
+
+def limit(route: RouteClass, per_user: bool = True) -> Callable:
+    """
+    Route dependency admitting requests to the route class, per_user=False for routes without a logged-in user.
+    Used as dependencies=[Depends(limit(WRITE))], the slot is held until the route returns
+    """
+    if not per_user:
+        async def admit_anonymous(request: Request) -> AsyncIterator[None]:
+            async with admitted(route, request, None):
+                yield
+        return admit_anonymous
+
+    async def admit_user(request: Request, user: CurrentUser = Depends(get_current_user)) -> AsyncIterator[None]:
+        async with admitted(route, request, user):
+            yield
+    return admit_user
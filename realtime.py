@@ -0,0 +1,383 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import secrets
+import select
+import threading
+from collections import defaultdict
+from typing import AsyncIterator, Callable
+
+from fastapi import APIRouter, HTTPException, Query, WebSocket
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from db import engine, SessionLocal, run_db
+from models import Topic
+from utils import get_current_user, can_user_see_topic, not_found, access_denied
+from versions import versions
+
+# postgres (LISTEN/NOTIFY across workers) or memory, other databases have no LISTEN/NOTIFY
+REALTIME_BROKER = os.getenv("REALTIME_BROKER", "postgres" if engine.dialect.name == "postgresql" else "memory")
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "100"))  # undelivered events before a client is dropped
+REALTIME_HEARTBEAT = float(os.getenv("REALTIME_HEARTBEAT", "15"))  # seconds between SSE keep-alives
+REALTIME_RECONNECT_DELAY = float(os.getenv("REALTIME_RECONNECT_DELAY", "2"))  # seconds
+REALTIME_OUTBOX_SIZE = int(os.getenv("REALTIME_OUTBOX_SIZE", "10000"))  # events waiting to be sent before new ones are dropped
+NOTIFY_BATCH_SIZE = 100  # events sent per transaction
+NOTIFY_CHANNEL = "forum_events"
+NOTIFY_MAX_PAYLOAD = 7900  # Postgres rejects NOTIFY payloads of 8000 bytes and more
+
+# Identifies this process in broker messages, so it can tell its own events from other workers'
+WORKER_ID = secrets.token_hex(8)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    tags=["realtime"]
+)
+
+
+class InMemoryBroker:
+    """
+    Delivers events within the process only, for tests and single-worker deployments
+    """
+
+    def __init__(self):
+        self._callback: Callable[[str], None] | None = None
+
+    def publish(self, message: str) -> None:
+        if self._callback:
+            self._callback(message)
+
+    def start(self, callback: Callable[[str], None]) -> None:
+        self._callback = callback
+
+    def stop(self) -> None:
+        self._callback = None
+
+
+class PostgresBroker:
+    """
+    Fans events out to every worker with NOTIFY, each worker LISTENs on a dedicated connection in a thread.
+    Publishing only queues the event, a sender thread NOTIFYs in batches so requests never wait on the broker
+    or take a second pooled connection. Events sent while a listener reconnects are missed, clients catch up
+    by reloading the listing
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._sender: threading.Thread | None = None
+        self._outbox: queue.Queue[str | None] = queue.Queue(maxsize=REALTIME_OUTBOX_SIZE)
+        self._callback: Callable[[str], None] | None = None
+
+    def publish(self, message: str) -> None:
+        if len(message.encode()) > NOTIFY_MAX_PAYLOAD:
+            envelope = json.loads(message)
+            # Too big to send, subscribers are told something changed and fetch it themselves
+            envelope["data"] = {"type": envelope["data"].get("type"), "truncated": True}
+            message = json.dumps(envelope)
+        # Raises queue.Full when the sender can't keep up, the hub logs it and the event is dropped
+        self._outbox.put_nowait(message)
+
+    def _send(self) -> None:
+        while True:
+            message = self._outbox.get()
+            if message is None:
+                return
+            batch = [message]
+            while len(batch) < NOTIFY_BATCH_SIZE:
+                try:
+                    message = self._outbox.get_nowait()
+                except queue.Empty:
+                    break
+                if message is None:
+                    # Stopping, the batch so far is still sent
+                    self._outbox.put_nowait(None)
+                    break
+                batch.append(message)
+            try:
+                with self.engine.connect() as connection:
+                    for message in batch:
+                        connection.execute(func.pg_notify(NOTIFY_CHANNEL, message).select())
+                    connection.commit()
+            except Exception:
+                logger.exception("Sending %d realtime events failed, they are dropped", len(batch))
+
+    def start(self, callback: Callable[[str], None]) -> None:
+        self._callback = callback
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, name="realtime-listener", daemon=True)
+        self._thread.start()
+        self._sender = threading.Thread(target=self._send, name="realtime-sender", daemon=True)
+        self._sender.start()
+
+    def stop(self) -> None:
+        if self._sender:
+            # Queued after every pending event, so they are sent before the sender exits
+            self._outbox.put(None)
+            self._sender.join()
+            self._sender = None
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _listen(self) -> None:
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                # Taken out of the pool for good, LISTEN needs a connection of its own
+                connection = self.engine.raw_connection()
+                connection.detach()
+                listener = connection.dbapi_connection
+                listener.autocommit = True
+                listener.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+
+                while not self._stopping.is_set():
+                    if select.select([listener], [], [], 1.0) == ([], [], []):
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        self._callback(listener.notifies.pop(0).payload)
+            except Exception:
+                logger.exception("Realtime listener lost its connection, reconnecting")
+                self._stopping.wait(REALTIME_RECONNECT_DELAY)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+
+class Subscriber:
+    """
+    One connected client: a bounded queue of serialized events on the event loop serving it
+    """
+
+    def __init__(self, channel: str, size: int):
+        self.channel = channel
+        self.queue: asyncio.Queue[str | None] = asyncio.Queue(maxsize=size)
+        self.loop = asyncio.get_running_loop()
+        self.dropped = False
+
+    def push(self, text: str) -> None:
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            # A slow client is disconnected rather than buffered without bound or silently skipped
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self) -> str | None:
+        """
+        Returns the next event, None once the client has been dropped for falling behind
+        """
+        return await self.queue.get()
+
+
+class Hub:
+    """
+    In-process pub/sub: events published here go through the broker (so every worker gets them)
+    and are fanned out to the local subscribers of their channel ("topic:<id>" or "user:<id>")
+    """
+
+    def __init__(self, broker: InMemoryBroker | PostgresBroker, queue_size: int = REALTIME_QUEUE_SIZE):
+        self.broker = broker
+        self.queue_size = queue_size
+        self._subscribers: dict[str, set[Subscriber]] = defaultdict(set)
+        self._listeners: list[Callable[[str, dict, str], None]] = []
+        self._lock = threading.Lock()
+        self.slow_disconnects = 0
+
+    def subscribe(self, channel: str) -> Subscriber:
+        subscriber = Subscriber(channel, self.queue_size)
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.channel]
+        self.slow_disconnects += subscriber.dropped
+
+    def add_listener(self, listener: Callable[[str, dict, str], None]) -> None:
+        """
+        Registers listener(channel, data, origin) for every event of every worker, called on the broker's thread
+        """
+        self._listeners.append(listener)
+
+    def publish(self, channel: str, data: dict) -> None:
+        """
+        Publishes an event to all workers without waiting for the broker. Called after the write is committed,
+        a failure is logged, not raised
+        """
+        try:
+            self.broker.publish(json.dumps({"channel": channel, "origin": WORKER_ID, "data": data}, default=str))
+        except Exception:
+            logger.exception("Publishing a realtime event to %s failed", channel)
+
+    def dispatch(self, message: str) -> None:
+        """
+        Broker callback: runs the listeners and hands the event to the channel's subscribers on their loops
+        """
+        envelope = json.loads(message)
+        channel, data = envelope["channel"], envelope["data"]
+
+        for listener in self._listeners:
+            try:
+                listener(channel, data, envelope["origin"])
+            except Exception:
+                logger.exception("Realtime listener failed on %s", channel)
+
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        if not subscribers:
+            return
+
+        # Serialized once per event and scheduled once per event loop, however many clients there are
+        text = json.dumps({"channel": channel, **data})
+        by_loop: dict[asyncio.AbstractEventLoop, list[Subscriber]] = defaultdict(list)
+        for subscriber in subscribers:
+            by_loop[subscriber.loop].append(subscriber)
+        for loop, loop_subscribers in by_loop.items():
+            loop.call_soon_threadsafe(self._push_all, loop_subscribers, text)
+
+    @staticmethod
+    def _push_all(subscribers: list[Subscriber], text: str) -> None:
+        for subscriber in subscribers:
+            subscriber.push(text)
+
+    def start(self) -> None:
+        self.broker.start(self.dispatch)
+
+    def stop(self) -> None:
+        self.broker.stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return\
+            {
+                "channels": len(self._subscribers),
+                "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+                "slow_disconnects": self.slow_disconnects
+            }
+
+
+def bump_listing_versions(channel: str, data: dict, origin: str) -> None:
+    """
+    Invalidates this worker's cached listings on other workers' writes, the writer already bumped its own
+    """
+    kind, _, scope_id = channel.partition(":")
+    if origin != WORKER_ID and kind == "topic":
+        versions.bump("topic", int(scope_id))
+        # New and deleted posts change the activity summaries of the category's topic listing and the categories
+        if (category_id := data.get("post", {}).get("category_id")) is not None:
+            versions.bump("category", category_id)
+            versions.bump("categories")
+
+
+hub = Hub(PostgresBroker(engine) if REALTIME_BROKER == "postgres" else InMemoryBroker())
+hub.add_listener(bump_listing_versions)
+
+async def authorize_channel(token: str, topic_id: int | None) -> str:
+    """
+    Returns the channel the token's user may subscribe to: the topic's or, without a topic, their own DMs
+    """
+    # A short-lived session, a subscription can stay open for hours and must not hold a connection
+    db = SessionLocal()
+    try:
+        user = await get_current_user(token, db)
+        if topic_id is None:
+            return f"user:{user.id}"
+
+        def check_topic(session: Session) -> None:
+            topic = session.query(Topic).filter(Topic.id.__eq__(topic_id)).first()
+            if not topic:
+                raise not_found
+            if not can_user_see_topic(user, topic, session):
+                raise access_denied
+        await run_db(db, check_topic)
+        return f"topic:{topic_id}"
+    finally:
+        await run_db(db, lambda session: session.close())
+
+@router.websocket("/ws")
+async def websocket_events(websocket: WebSocket,
+                           token: str = Query(...),
+                           topic: int | None = None
+) -> None:
+    """
+    Pushes the events of a topic (new posts) or, without topic, the user's DMs as JSON text frames.
+    The token is a query parameter since browsers can't set headers on WebSockets
+    """
+    try:
+        channel = await authorize_channel(token, topic)
+    except HTTPException as error:
+        await websocket.close(code=1008, reason=str(error.detail))
+        return
+
+    await websocket.accept()
+    subscriber = hub.subscribe(channel)
+    # Clients don't send anything, receiving only notices the disconnect
+    receiver = asyncio.ensure_future(websocket.receive())
+    getter = asyncio.ensure_future(subscriber.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                text = getter.result()
+                if text is None:
+                    await websocket.close(code=1013, reason="Slow consumer")
+                    return
+                await websocket.send_text(text)
+                getter = asyncio.ensure_future(subscriber.get())
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    return
+                receiver = asyncio.ensure_future(websocket.receive())
+    finally:
+        receiver.cancel()
+        getter.cancel()
+        hub.unsubscribe(subscriber)
+
+async def sse_stream(channel: str) -> AsyncIterator[str]:
+    subscriber = hub.subscribe(channel)
+    try:
+        yield f"retry: {int(REALTIME_RECONNECT_DELAY * 1000)}\n\n"
+        while True:
+            try:
+                text = await asyncio.wait_for(subscriber.get(), REALTIME_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            if text is None:
+                yield "event: error\ndata: Slow consumer\n\n"
+                return
+            yield f"data: {text}\n\n"
+    finally:
+        hub.unsubscribe(subscriber)
+
+@router.get("/sse")
+async def sse_events(token: str = Query(...), topic: int | None = None) -> StreamingResponse:
+    """
+    Server-sent events version of /ws, for clients that only need to receive
+    """
+    channel = await authorize_channel(token, topic)
+    return StreamingResponse\
+    (
+        sse_stream(channel),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
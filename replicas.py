@@ -0,0 +1,163 @@
+import itertools
+import logging
+import os
+import threading
+from typing import AsyncIterator
+
+from fastapi import Depends
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+
+from cache import TTLCache
+from db import DB_ASYNC, InstrumentedQueuePool, PoolStats, SessionLocal, AsyncSessionLocal, pool_options, pool_status
+from realtime import hub
+from utils import CurrentUser, get_current_user
+
+# Comma separated SQLAlchemy URLs, e.g. postgresql+psycopg2://forum:pw@replica1:5432/forum or sqlite:///replica.db
+DB_REPLICA_URLS = [url.strip() for url in os.getenv("DB_REPLICA_URLS", "").split(",") if url.strip()]
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))  # seconds between health checks
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "10"))  # seconds of replay lag before a replica is skipped
+DB_STICKY_SECONDS = float(os.getenv("DB_STICKY_SECONDS", "5"))  # reads stay on the primary this long after a write
+STICKY_CHANNEL = "sticky"
+
+# Replay lag of a Postgres standby, 0 while it has replayed everything it received (an idle primary isn't lag)
+REPLICA_LAG_QUERY = text\
+(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    """
+    A read replica's engine and its health as of the last check
+    """
+
+    def __init__(self, url: str):
+        # A pool class of its own per replica, so its wait counters aren't mixed with the primary's
+        poolclass = type("ReplicaQueuePool", (InstrumentedQueuePool,), {"stats": PoolStats()})
+        self.engine = create_engine(url, **{**pool_options(url), "poolclass": poolclass})
+        self.sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.healthy = True
+        self.lag = 0.0
+        self.error: str | None = None
+
+    def check(self) -> None:
+        try:
+            with self.engine.connect() as connection:
+                if self.engine.dialect.name == "postgresql":
+                    self.lag = float(connection.execute(REPLICA_LAG_QUERY).scalar())
+                else:
+                    connection.execute(text("SELECT 1"))
+                    self.lag = 0.0
+            self.healthy = not DB_REPLICA_MAX_LAG or self.lag <= DB_REPLICA_MAX_LAG
+            self.error = None if self.healthy else f"Replication lag {self.lag:.1f}s"
+        except Exception as error:
+            self.healthy = False
+            self.error = str(error).splitlines()[0]
+
+    def status(self) -> dict:
+        return\
+        {
+            "url": self.engine.url.render_as_string(hide_password=True),
+            "healthy": self.healthy,
+            "lag": self.lag,
+            "error": self.error,
+            "pool": pool_status(self.engine.pool)
+        }
+
+
+class ReplicaSet:
+    """
+    Round-robin over the healthy replicas, checked in the background every DB_REPLICA_CHECK_INTERVAL
+    """
+
+    def __init__(self, urls: list[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self._counter = itertools.count()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def pick(self) -> Replica | None:
+        """
+        Returns the next healthy replica, None if there are none (reads then go to the primary)
+        """
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    def check(self) -> None:
+        for replica in self.replicas:
+            was_healthy = replica.healthy
+            replica.check()
+            if was_healthy != replica.healthy:
+                logger.warning("Replica %s is now %s%s", replica.engine.url.render_as_string(hide_password=True),
+                               "healthy" if replica.healthy else "unhealthy: ", replica.error or "")
+
+    def _run(self) -> None:
+        while not self._stopping.wait(DB_REPLICA_CHECK_INTERVAL):
+            self.check()
+
+    def start(self) -> None:
+        if not self.replicas:
+            return
+        self.check()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-health", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for replica in self.replicas:
+            replica.engine.dispose()
+
+
+replica_set = ReplicaSet(DB_REPLICA_URLS)
+
+# Users who wrote within DB_STICKY_SECONDS, their reads go to the primary so they see their own writes
+sticky_users = TTLCache(maxsize=100000, ttl=DB_STICKY_SECONDS)
+# Users whose stickiness was announced to the other workers recently, re-announced at half the window
+_announced = TTLCache(maxsize=100000, ttl=DB_STICKY_SECONDS / 2)
+
+def mark_written(user: CurrentUser) -> None:
+    """
+    Called by write routes after committing: keeps the user's reads on the primary on every worker for a while
+    """
+    if not replica_set.replicas:
+        return
+    sticky_users.set(user.id, True)
+    if _announced.get(user.id) is None:
+        _announced.set(user.id, True)
+        hub.publish(STICKY_CHANNEL, {"type": "sticky", "user_id": user.id})
+
+def apply_remote_sticky(channel: str, data: dict, origin: str) -> None:
+    if channel == STICKY_CHANNEL and replica_set.replicas:
+        sticky_users.set(data["user_id"], True)
+
+hub.add_listener(apply_remote_sticky)
+
+async def get_read_db(user: CurrentUser = Depends(get_current_user)) -> AsyncIterator[Session | AsyncSession]:
+    """
+    Read-only routes' replacement of get_db: a session on a healthy replica, or on the primary
+    when there are none, or when the user wrote something in the last DB_STICKY_SECONDS.
+    Replica sessions are always sync, routes handle both through db_route/run_db
+    """
+    replica = None if sticky_users.get(user.id) else replica_set.pick()
+
+    if replica is None and DB_ASYNC:
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+
+    db = replica.sessionmaker() if replica else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
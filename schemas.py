@@ -1,4 +1,5 @@
-from typing import Optional
+from datetime import date, datetime
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -38,9 +39,76 @@ class AdminResponse(BaseModel):
     username: str
     email: str
     age: int
-    nickname: str
+    nickname: str | None = None
     admin: bool
 
+class PoolStatusSchema(BaseModel):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    max_overflow: int
+    timeout: float
+    checkouts: int
+    waits: int
+    timeouts: int
+    wait_time: float
+    max_wait_time: float
+
+class ReplicaStatusSchema(BaseModel):
+    url: str
+    healthy: bool
+    lag: float
+    error: str | None = None
+    pool: PoolStatusSchema
+
+class DatabasePoolsSchema(BaseModel):
+    primary: PoolStatusSchema
+    primary_async: PoolStatusSchema | None = None
+    replicas: List[ReplicaStatusSchema] = []
+
+class HealthSchema(BaseModel):
+    status: str
+    database: str
+    pool: PoolStatusSchema
+    pool_async: PoolStatusSchema | None = None  # The pool serving the routes in DB_ASYNC mode
+    healthy_replicas: int
+    replicas: int
+
+class StartupReportSchema(BaseModel):
+    warmed: bool
+    connections_ms: float | None = None
+    mappers_ms: float | None = None
+    statements_ms: float | None = None
+    startup_ms: float | None = None
+    first_request: str | None = None
+    first_request_ms: float | None = None
+
+class RejectionCountSchema(BaseModel):
+    route_class: str
+    reason: str
+    count: int
+
+class AdmissionStatsSchema(BaseModel):
+    backend: str
+    in_flight: dict[str, int]
+    rejections: List[RejectionCountSchema]
+
+class ImportRejectSchema(BaseModel):
+    row: int
+    reason: str
+
+class ImportReportSchema(BaseModel):
+    table: str
+    skipped: int
+    processed: int
+    inserted: int
+    duplicates: int
+    rejected: int
+    rejects: List[ImportRejectSchema]
+    seconds: float
+    rows_per_second: float
+
 # CONTENT
 
 class CategorySchema(BaseModel):
@@ -48,6 +116,10 @@ class CategorySchema(BaseModel):
     name: str
     description: str
     locked: bool = False
+    post_count: int = 0
+    reply_count: int = 0
+    last_post_id: int | None = None
+    last_post_at: datetime | None = None
 
 class TopicSchema(BaseModel):
     id: int
@@ -56,6 +128,15 @@ class TopicSchema(BaseModel):
     locked: bool
     user_id: int
     category_id: int
+    post_count: int = 0
+    reply_count: int = 0
+    last_post_id: int | None = None
+    last_post_at: datetime | None = None
+
+class TopicPageSchema(BaseModel):
+    items: List[TopicSchema]
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
 
 
 class PostSchema(BaseModel):
@@ -68,10 +149,85 @@ class PostSchema(BaseModel):
     class Config:
         from_attributes = True
 
+class PostPageSchema(BaseModel):
+    items: List[PostSchema]
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+
 class PostViewSchema(BaseModel):
     post: PostSchema
     interactions: int
+    upvotes: int = 0
+    downvotes: int = 0
     user_vote: Optional[bool] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class PostBatchEntrySchema(BaseModel):
+    id: int
+    status: str  # ok, not_found or forbidden
+    view: PostViewSchema | None = None  # only when ok
+
+class PostBatchSchema(BaseModel):
+    items: List[PostBatchEntrySchema]
+
+class SearchHitSchema(BaseModel):
+    type: str  # post or topic
+    id: int
+    topic_id: int
+    category_id: int
+    rank: float
+    title: str | None = None
+    snippet: str
+
+class SearchResultsSchema(BaseModel):
+    items: List[SearchHitSchema]
+    next_offset: int | None = None
+
+class TrendingTopicSchema(BaseModel):
+    topic_id: int
+    category_id: int
+    score: float
+
+class TrendingCategorySchema(BaseModel):
+    category_id: int
+    score: float
+
+
+# DIRECT MESSAGES
+
+class MessageSchema(BaseModel):
+    id: int
+    text: str
+    date: date
+    conversation_id: int
+    sender_id: int
+
+    class Config:
+        from_attributes = True
+
+class MessagePageSchema(BaseModel):
+    items: List[MessageSchema]
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+
+class ConversationSchema(BaseModel):
+    id: int
+    other_user_id: int
+    other_username: str
+    last_message_at: datetime | None = None
+    last_message_id: int | None = None
+    last_message: str | None = None
+    unread: int = 0
+
+    class Config:
+        from_attributes = True
+
+class InboxPageSchema(BaseModel):
+    items: List[ConversationSchema]
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+
+class UnreadSchema(BaseModel):
+    unread: int
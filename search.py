@@ -0,0 +1,252 @@
+import html
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Type
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import and_, case, func, literal, literal_column, select, union_all
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ColumnElement
+
+from db import db_route, SessionLocal
+from models import Post, Topic
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from replicas import get_read_db
+from schemas import SearchResultsSchema
+from utils import CurrentUser, get_current_user, resolve_visible_categories
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "postgres")  # postgres or memory
+SEARCH_CONFIG = "english"  # Must match the generated search_vector columns
+SNIPPET_WORDS = 20
+
+router = APIRouter(
+    tags=["search"]
+)
+
+
+def html_escaped(text: ColumnElement) -> ColumnElement:
+    """
+    Escapes user text in SQL before ts_headline, which keeps any markup in it and only adds the <b> tags
+    """
+    return func.replace(func.replace(func.replace(text, "&", "&amp;"), "<", "&lt;"), ">", "&gt;")
+
+
+class PostgresSearchBackend:
+    """
+    Ranked search over the generated, GIN-indexed search_vector columns of posts and topics.
+    The columns are computed by Postgres on every write, so there is nothing to index here
+    """
+
+    def index_post(self, post: Type[Post]) -> None:
+        pass
+
+    def index_topic(self, topic: Type[Topic]) -> None:
+        pass
+
+    def remove_post(self, post_id: int) -> None:
+        pass
+
+    def search(self, db: Session, text: str, category_ids: list[int] | None, limit: int, offset: int) -> list[dict]:
+        query = func.websearch_to_tsquery(SEARCH_CONFIG, text)
+        post_vector = literal_column("posts.search_vector")
+        topic_vector = literal_column("topics.search_vector")
+
+        posts = select\
+        (
+            literal("post").label("type"), Post.id, Post.topic_id, Post.category_id,
+            func.ts_rank_cd(post_vector, query).label("rank")
+        ).where(post_vector.op("@@")(query))
+        topics = select\
+        (
+            literal("topic").label("type"), Topic.id, Topic.id.label("topic_id"), Topic.category_id,
+            func.ts_rank_cd(topic_vector, query).label("rank")
+        ).where(topic_vector.op("@@")(query))
+
+        if category_ids is not None:
+            posts = posts.where(Post.category_id.in_(category_ids))
+            topics = topics.where(Topic.category_id.in_(category_ids))
+
+        # Post and topic ids come from different sequences, type breaks the ties of equal ranks and ids
+        ranked = union_all(posts, topics)\
+            .order_by(literal_column("rank").desc(), literal_column("type"), literal_column("id"))\
+            .limit(limit).offset(offset).subquery()
+
+        # Headlines are expensive, so they're only built for the rows of the page
+        options = f"MaxWords={SNIPPET_WORDS}, MinWords=5, MaxFragments=2"
+        rows = db.execute\
+        (
+            select
+            (
+                ranked.c.type, ranked.c.id, ranked.c.topic_id, ranked.c.category_id, ranked.c.rank,
+                Topic.title,
+                case
+                (
+                    (
+                        ranked.c.type == "post",
+                        func.ts_headline(SEARCH_CONFIG, html_escaped(Post.content), query, options)
+                    ),
+                    else_=func.ts_headline(SEARCH_CONFIG, html_escaped(func.coalesce(Topic.description, "")),
+                                           query, options)
+                ).label("snippet")
+            )
+            .outerjoin(Post, and_(ranked.c.type == "post", Post.id == ranked.c.id))
+            .outerjoin(Topic, and_(ranked.c.type == "topic", Topic.id == ranked.c.id))
+            .order_by(ranked.c.rank.desc(), ranked.c.type, ranked.c.id)
+        ).all()
+
+        return [dict(row._mapping) for row in rows]
+
+
+class InMemorySearchBackend:
+    """
+    Pure-Python inverted index with the same API, BM25 ranked, for tests and small deployments.
+    Filled from the database on startup and kept current by the write paths
+    """
+
+    def __init__(self):
+        self._postings: dict[str, dict[tuple[str, int], int]] = defaultdict(dict)
+        self._documents: dict[tuple[str, int], dict] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def tokenize(text: str) -> list[str]:
+        return re.findall(r"\w+", text.lower())
+
+    def _add(self, key: tuple[str, int], text: str, **fields) -> None:
+        terms = self.tokenize(text)
+        with self._lock:
+            self._remove(key)
+            self._documents[key] = {"text": text, "length": len(terms), **fields}
+            self._total_length += len(terms)
+            for term in terms:
+                postings = self._postings[term]
+                postings[key] = postings.get(key, 0) + 1
+
+    def _remove(self, key: tuple[str, int]) -> None:
+        document = self._documents.pop(key, None)
+        if document is None:
+            return
+        self._total_length -= document["length"]
+        for term in set(self.tokenize(document["text"])):
+            postings = self._postings[term]
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[term]
+
+    def index_post(self, post: Type[Post]) -> None:
+        self._add(("post", post.id), post.content, topic_id=post.topic_id, category_id=post.category_id, title=None)
+
+    def index_topic(self, topic: Type[Topic]) -> None:
+        self._add(("topic", topic.id), f"{topic.title} {topic.description or ''}",
+                  topic_id=topic.id, category_id=topic.category_id, title=topic.title)
+
+    def remove_post(self, post_id: int) -> None:
+        with self._lock:
+            self._remove(("post", post_id))
+
+    def rebuild(self, db: Session, batch_size: int = 1000) -> None:
+        """
+        Indexes all topics and posts, reading posts in keyset batches
+        """
+        for topic in db.query(Topic).yield_per(batch_size):
+            self.index_topic(topic)
+        last_id = 0
+        while posts := db.query(Post).filter(Post.id > last_id).order_by(Post.id).limit(batch_size).all():
+            for post in posts:
+                self.index_post(post)
+            last_id = posts[-1].id
+            db.expunge_all()
+
+    def snippet(self, text: str, terms: set[str]) -> str:
+        """
+        Returns up to SNIPPET_WORDS words around the first match with matches wrapped in <b></b>, like ts_headline.
+        The words are HTML-escaped, only the <b> tags are markup
+        """
+        words = text.split()
+        first = next((i for i, word in enumerate(words) if set(self.tokenize(word)) & terms), 0)
+        start = max(0, first - SNIPPET_WORDS // 4)
+        return " ".join\
+        (
+            f"<b>{escaped}</b>" if set(self.tokenize(word)) & terms else escaped
+            for word in words[start:start + SNIPPET_WORDS]
+            for escaped in (html.escape(word, quote=False),)
+        )
+
+    def search(self, db: Session, text: str, category_ids: list[int] | None, limit: int, offset: int) -> list[dict]:
+        terms = set(self.tokenize(text))
+        if not terms:
+            return []
+        allowed = set(category_ids) if category_ids is not None else None
+
+        with self._lock:
+            postings = sorted((self._postings.get(term, {}) for term in terms), key=len)
+            # All terms must match, like websearch_to_tsquery without operators
+            matches = set(postings[0]).intersection(*postings[1:]) if postings else set()
+            count = len(self._documents) or 1
+            average_length = self._total_length / count or 1
+
+            scored = []
+            for key in matches:
+                document = self._documents[key]
+                if allowed is not None and document["category_id"] not in allowed:
+                    continue
+                rank = 0.0
+                for term_postings in postings:
+                    frequency = term_postings[key]
+                    idf = math.log(1 + (count - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+                    rank += idf * frequency * 2.2 / (frequency + 1.2 * (0.25 + 0.75 * document["length"] / average_length))
+                scored.append((rank, key, document))
+
+        scored.sort(key=lambda hit: (-hit[0], hit[1]))
+        return\
+        [
+            {
+                "type": key[0],
+                "id": key[1],
+                "topic_id": document["topic_id"],
+                "category_id": document["category_id"],
+                "rank": rank,
+                "title": document["title"],
+                "snippet": self.snippet(document["text"], terms)
+            }
+            for rank, key, document in scored[offset:offset + limit]
+        ]
+
+
+search_backend = InMemorySearchBackend() if SEARCH_BACKEND == "memory" else PostgresSearchBackend()
+
+def load_search_index() -> None:
+    """
+    Fills the in-memory index on startup, nothing to do for Postgres
+    """
+    if isinstance(search_backend, InMemorySearchBackend):
+        db = SessionLocal()
+        try:
+            search_backend.rebuild(db)
+        finally:
+            db.close()
+
+@router.get("/", response_model=SearchResultsSchema)
+@db_route
+def search(q: str = Query(..., min_length=1, max_length=200),
+           limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+           offset: int = Query(0, ge=0),
+           db: Session = Depends(get_read_db),
+           user: CurrentUser = Depends(get_current_user)
+) -> dict:
+    """
+    Ranked full-text search over posts and topic titles/descriptions in the categories the user can see
+    """
+    category_ids = None if user.admin else [category.id for category in resolve_visible_categories(user, db)]
+
+    hits = search_backend.search(db, q, category_ids, limit + 1, offset)
+
+    return\
+    {
+        "items": hits[:limit],
+        "next_offset": offset + limit if len(hits) > limit else None
+    }
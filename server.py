@@ -0,0 +1,57 @@
+"""
+Production entry point: several worker processes sharing the port, no reload watcher.
+
+    SERVER_WORKERS=4 python server.py
+
+main.py's __main__ stays the development server with auto-reload.
+"""
+import os
+
+import anyio.to_thread
+import uvicorn
+
+from db import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+# Processes, one per core by default. Each runs its own PASSWORD_HASH_WORKERS scrypt processes, whose default
+# shares the cores among the SERVER_WORKERS
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))
+# Threads per worker running the sync routes (db_route, run_db), one per pooled connection by default: more would
+# only wait on checkout for DB_POOL_TIMEOUT, raise DB_POOL_SIZE/DB_MAX_OVERFLOW along with it
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+SERVER_KEEPALIVE = int(os.getenv("SERVER_KEEPALIVE", "5"))  # seconds an idle keep-alive connection stays open
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))  # pending connections the listening socket queues
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))  # seconds in-flight requests get on SIGTERM
+# Addresses whose X-Forwarded-For/Proto headers are trusted, the reverse proxy's
+SERVER_FORWARDED_ALLOW_IPS = os.getenv("SERVER_FORWARDED_ALLOW_IPS", "127.0.0.1")
+SERVER_ACCESS_LOG = os.getenv("SERVER_ACCESS_LOG", "false").lower() in ("1", "true", "yes")  # a log line per request
+
+
+def configure_threadpool() -> None:
+    """
+    Sizes the thread limiter of the running event loop, called from the app's lifespan in every worker
+    """
+    anyio.to_thread.current_default_thread_limiter().total_tokens = SERVER_THREADS
+
+
+def main() -> None:
+    # On SIGTERM every worker stops accepting, lets in-flight requests finish for up to SERVER_GRACEFUL_TIMEOUT,
+    # then runs the lifespan shutdown (flushing buffered votes, stopping the background threads)
+    uvicorn.run\
+    (
+        "main:app",
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=SERVER_WORKERS,
+        timeout_keep_alive=SERVER_KEEPALIVE,
+        backlog=SERVER_BACKLOG,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT,
+        proxy_headers=True,
+        forwarded_allow_ips=SERVER_FORWARDED_ALLOW_IPS,
+        access_log=SERVER_ACCESS_LOG
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+-- Vote counters on posts, maintained by the API on every vote change
+ALTER TABLE posts ADD COLUMN upvotes INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE posts ADD COLUMN downvotes INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE posts ADD COLUMN score INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill from the existing votes (same as `python maintenance.py reconcile-votes`)
+UPDATE posts SET
+    upvotes = counts.upvotes,
+    downvotes = counts.downvotes,
+    score = counts.upvotes - counts.downvotes
+FROM (
+    SELECT post_id,
+           COUNT(*) FILTER (WHERE vote) AS upvotes,
+           COUNT(*) FILTER (WHERE NOT vote) AS downvotes
+    FROM post_interactions
+    GROUP BY post_id
+) AS counts
+WHERE posts.id = counts.post_id;
@@ -0,0 +1,3 @@
+-- Composite indexes backing keyset pagination of topic and category listings
+CREATE INDEX idx_topics_category_id_id ON topics(category_id, id);
+CREATE INDEX idx_posts_topic_id_id ON posts(topic_id, id);
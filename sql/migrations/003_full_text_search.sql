@@ -0,0 +1,9 @@
+-- Full-text search vectors, computed by Postgres on every insert/update
+ALTER TABLE posts ADD COLUMN search_vector TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;
+ALTER TABLE topics ADD COLUMN search_vector TSVECTOR
+    GENERATED ALWAYS AS
+        (setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED;
+
+CREATE INDEX idx_posts_search_vector ON posts USING GIN (search_vector);
+CREATE INDEX idx_topics_search_vector ON topics USING GIN (search_vector);
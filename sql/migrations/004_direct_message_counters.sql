@@ -0,0 +1,25 @@
+-- Inbox sort key and unread counters of direct messages, maintained by the DM endpoints on send and read
+ALTER TABLE users ADD COLUMN unread_messages INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE conversations
+    ADD COLUMN last_message_at TIMESTAMPTZ,
+    ADD COLUMN last_message_id INTEGER,
+    ADD COLUMN initiator_unread INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN receiver_unread INTEGER NOT NULL DEFAULT 0;
+
+-- Existing messages are considered read, there was no read tracking before
+UPDATE conversations c
+SET last_message_at = last.date::timestamptz,
+    last_message_id = last.id
+FROM (
+    SELECT DISTINCT ON (conversation_id) conversation_id, id, date
+    FROM direct_messages
+    ORDER BY conversation_id, date DESC, id DESC
+) last
+WHERE last.conversation_id = c.id;
+
+CREATE INDEX idx_conversations_initiator_id_last_message ON conversations(initiator_id, last_message_at DESC, id DESC);
+CREATE INDEX idx_conversations_receiver_id_last_message ON conversations(receiver_id, last_message_at DESC, id DESC);
+-- Fails if a pair already has several conversations, merge those first
+CREATE UNIQUE INDEX uq_conversations_pair ON conversations(LEAST(initiator_id, receiver_id), GREATEST(initiator_id, receiver_id));
+CREATE INDEX idx_direct_messages_conversation_id_date_id ON direct_messages(conversation_id, date, id);
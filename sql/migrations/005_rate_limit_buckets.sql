@@ -0,0 +1,6 @@
+-- Token buckets of the write rate limits when RATE_LIMIT_BACKEND=postgres, shared by every worker.
+-- UNLOGGED: no WAL for a row update per write request, losing the buckets on a crash only resets the limits
+CREATE UNLOGGED TABLE rate_limit_buckets (
+    key VARCHAR(255) PRIMARY KEY, -- <route class>:<user|ip>:<id or address>
+    arrival DOUBLE PRECISION NOT NULL -- Epoch seconds at which the bucket is full again
+);
@@ -0,0 +1,19 @@
+-- Cold topics archived out of the hot posts/post_interactions tables (maintenance.py archive-topics).
+-- Each archived topic is one zlib-compressed JSON row, archived_posts maps post ids to it for views by post id
+ALTER TABLE topics ADD COLUMN archived BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE TABLE archived_topics (
+    topic_id INTEGER PRIMARY KEY,
+    post_count INTEGER NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL,
+    data BYTEA NOT NULL,
+    FOREIGN KEY (topic_id) REFERENCES topics(id) ON DELETE CASCADE
+);
+
+CREATE TABLE archived_posts (
+    post_id INTEGER PRIMARY KEY,
+    topic_id INTEGER NOT NULL,
+    FOREIGN KEY (topic_id) REFERENCES topics(id) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_archived_posts_topic_id ON archived_posts(topic_id);
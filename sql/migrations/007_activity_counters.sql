@@ -0,0 +1,50 @@
+-- Post counts and last posts of topics and categories, kept in sync by add_post and post deletion so listings
+-- need no aggregation (maintenance.py reconcile-activity rebuilds them).
+--
+-- Posts had no timestamp and nothing else records when they were written (topics have no date either, a user's
+-- registration_date only bounds it from below), so existing posts and every backfilled last_post_at get the
+-- migration time. Until ARCHIVE_IDLE_DAYS have passed since the migration, archive-topics then finds no idle
+-- unlocked topic, archive known cold topics with --topic-id meanwhile. The trending
+-- ranking also warms up with the whole backlog as posted at migration time, which decays within a few
+-- TRENDING_HALF_LIFEs of it
+ALTER TABLE posts ADD COLUMN created_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+ALTER TABLE topics
+    ADD COLUMN post_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN reply_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN last_post_id INTEGER,
+    ADD COLUMN last_post_at TIMESTAMPTZ;
+
+ALTER TABLE categories
+    ADD COLUMN post_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN reply_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN last_post_id INTEGER,
+    ADD COLUMN last_post_at TIMESTAMPTZ;
+
+UPDATE topics t SET
+    post_count = p.posts,
+    reply_count = p.posts - 1,
+    last_post_id = p.last_post_id,
+    last_post_at = now()
+FROM (SELECT topic_id, count(*) AS posts, max(id) AS last_post_id FROM posts GROUP BY topic_id) p
+WHERE p.topic_id = t.id;
+
+-- Archived topics' posts are only in their archived_topics row
+UPDATE topics t SET
+    post_count = a.post_count,
+    reply_count = GREATEST(a.post_count - 1, 0),
+    last_post_id = (SELECT max(post_id) FROM archived_posts WHERE topic_id = t.id),
+    last_post_at = now()
+FROM archived_topics a
+WHERE a.topic_id = t.id AND a.post_count > 0;
+
+UPDATE categories c SET
+    post_count = t.posts,
+    reply_count = t.replies,
+    last_post_id = t.last_post_id,
+    last_post_at = now()
+FROM (SELECT category_id, sum(post_count) AS posts, sum(reply_count) AS replies, max(last_post_id) AS last_post_id
+      FROM topics GROUP BY category_id) t
+WHERE t.category_id = c.id AND t.posts > 0;
+
+CREATE INDEX idx_topics_category_id_last_post_id ON topics(category_id, last_post_id);
@@ -7,7 +7,8 @@ CREATE TABLE users (
     age INTEGER CHECK (age >= 0),
     nickname VARCHAR(50),
     registration_date DATE NOT NULL,
-    admin BOOLEAN NOT NULL DEFAULT FALSE
+    admin BOOLEAN NOT NULL DEFAULT FALSE,
+    unread_messages INTEGER NOT NULL DEFAULT 0 -- Kept in sync on every DM send/read
 );
 
 -- Create the categories table
@@ -16,7 +17,11 @@ CREATE TABLE categories (
     name VARCHAR(50) NOT NULL,
     description TEXT NOT NULL,
     visibility BOOLEAN NOT NULL DEFAULT TRUE,
-    locked BOOLEAN NOT NULL DEFAULT FALSE
+    locked BOOLEAN NOT NULL DEFAULT FALSE,
+    post_count INTEGER NOT NULL DEFAULT 0, -- Sums of its topics' counters, kept in sync on every post add/delete
+    reply_count INTEGER NOT NULL DEFAULT 0,
+    last_post_id INTEGER,
+    last_post_at TIMESTAMPTZ
 );
 
 -- Create the topics table
@@ -27,6 +32,13 @@ CREATE TABLE topics (
     locked BOOLEAN NOT NULL DEFAULT FALSE,
     user_id INTEGER NOT NULL,
     category_id INTEGER NOT NULL,
+    archived BOOLEAN NOT NULL DEFAULT FALSE, -- Posts moved to archived_topics
+    post_count INTEGER NOT NULL DEFAULT 0, -- Kept in sync on every post add/delete
+    reply_count INTEGER NOT NULL DEFAULT 0, -- Posts after the first one
+    last_post_id INTEGER,
+    last_post_at TIMESTAMPTZ,
+    search_vector TSVECTOR GENERATED ALWAYS AS
+        (setweight(to_tsvector('english', title), 'A') || setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
     FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE CASCADE
 );
@@ -38,6 +50,11 @@ CREATE TABLE posts (
     user_id INTEGER NOT NULL,
     topic_id INTEGER NOT NULL,
     category_id INTEGER NOT NULL,
+    upvotes INTEGER NOT NULL DEFAULT 0, -- Kept in sync with post_interactions on every vote
+    downvotes INTEGER NOT NULL DEFAULT 0,
+    score INTEGER NOT NULL DEFAULT 0, -- upvotes - downvotes
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    search_vector TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', content)) STORED,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
     FOREIGN KEY (topic_id) REFERENCES topics(id) ON DELETE CASCADE,
     FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE CASCADE
@@ -71,6 +88,10 @@ CREATE TABLE conversations (
     date DATE NOT NULL,
     initiator_id INTEGER NOT NULL,
     receiver_id INTEGER NOT NULL,
+    last_message_at TIMESTAMPTZ, -- Inbox sort key, set on every message
+    last_message_id INTEGER,
+    initiator_unread INTEGER NOT NULL DEFAULT 0,
+    receiver_unread INTEGER NOT NULL DEFAULT 0,
     FOREIGN KEY (initiator_id) REFERENCES users(id) ON DELETE CASCADE,
     FOREIGN KEY (receiver_id) REFERENCES users(id) ON DELETE CASCADE
 );
@@ -86,6 +107,28 @@ CREATE TABLE direct_messages (
     FOREIGN KEY (sender_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
+-- Cold topics' posts and votes, one zlib-compressed JSON row per archived topic
+CREATE TABLE archived_topics (
+    topic_id INTEGER PRIMARY KEY,
+    post_count INTEGER NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL,
+    data BYTEA NOT NULL,
+    FOREIGN KEY (topic_id) REFERENCES topics(id) ON DELETE CASCADE
+);
+
+-- The archived topic holding each archived post
+CREATE TABLE archived_posts (
+    post_id INTEGER PRIMARY KEY,
+    topic_id INTEGER NOT NULL,
+    FOREIGN KEY (topic_id) REFERENCES topics(id) ON DELETE CASCADE
+);
+
+-- Token buckets of the write rate limits (RATE_LIMIT_BACKEND=postgres), unlogged since losing them only resets the limits
+CREATE UNLOGGED TABLE rate_limit_buckets (
+    key VARCHAR(255) PRIMARY KEY, -- <route class>:<user|ip>:<id or address>
+    arrival DOUBLE PRECISION NOT NULL -- Epoch seconds at which the bucket is full again
+);
+
 -- categories table
 CREATE INDEX idx_categories_visibility ON categories(visibility);
 CREATE INDEX idx_categories_locked ON categories(locked);
@@ -94,12 +137,17 @@ CREATE INDEX idx_categories_visibility_locked ON categories(visibility, locked);
 -- topics table
 CREATE INDEX idx_topics_user_id ON topics(user_id);
 CREATE INDEX idx_topics_category_id ON topics(category_id);
+CREATE INDEX idx_topics_category_id_id ON topics(category_id, id); -- Keyset pagination of category listings
 CREATE INDEX idx_topics_locked ON topics(locked);
+CREATE INDEX idx_topics_category_id_last_post_id ON topics(category_id, last_post_id); -- A category's previous last post
+CREATE INDEX idx_topics_search_vector ON topics USING GIN (search_vector);
 
 -- posts table
 CREATE INDEX idx_posts_user_id ON posts(user_id);
 CREATE INDEX idx_posts_topic_id ON posts(topic_id);
+CREATE INDEX idx_posts_topic_id_id ON posts(topic_id, id); -- Keyset pagination of topic listings
 CREATE INDEX idx_posts_category_id ON posts(category_id);
+CREATE INDEX idx_posts_search_vector ON posts USING GIN (search_vector);
 
 -- post_interactions table
 CREATE INDEX idx_post_interactions_user_id ON post_interactions(user_id);
@@ -111,9 +159,16 @@ CREATE INDEX idx_category_access_privileges_category_id ON category_access_privi
 CREATE INDEX idx_conversations_initiator_id ON conversations(initiator_id);
 CREATE INDEX idx_conversations_receiver_id ON conversations(receiver_id);
 CREATE INDEX idx_conversations_date ON conversations(date);
+CREATE INDEX idx_conversations_initiator_id_last_message ON conversations(initiator_id, last_message_at DESC, id DESC); -- Inbox pages
+CREATE INDEX idx_conversations_receiver_id_last_message ON conversations(receiver_id, last_message_at DESC, id DESC);
+CREATE UNIQUE INDEX uq_conversations_pair ON conversations(LEAST(initiator_id, receiver_id), GREATEST(initiator_id, receiver_id));
 
 -- direct_messages table
 CREATE INDEX idx_direct_messages_conversation_id ON direct_messages(conversation_id);
 CREATE INDEX idx_direct_messages_sender_id ON direct_messages(sender_id);
 CREATE INDEX idx_direct_messages_date ON direct_messages(date);
-CREATE INDEX idx_direct_messages_conversation_id_date ON direct_messages(conversation_id, date);
\ No newline at end of file
+CREATE INDEX idx_direct_messages_conversation_id_date ON direct_messages(conversation_id, date);
+CREATE INDEX idx_direct_messages_conversation_id_date_id ON direct_messages(conversation_id, date, id); -- History pages
+
+-- archived_posts table
+CREATE INDEX idx_archived_posts_topic_id ON archived_posts(topic_id);
@@ -0,0 +1,84 @@
+import os
+import sys
+from datetime import date
+
+import pytest
+
+# The modules import their engines on import, tests run against SQLite without a Postgres server
+os.environ.setdefault("DB_URL", "sqlite://")
+os.environ.setdefault("SEARCH_BACKEND", "memory")
+os.environ.setdefault("REALTIME_BROKER", "memory")
+os.environ.setdefault("RATE_LIMIT", "false")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+import db as db_module  # noqa: E402
+from models import Base, Category, Post, Topic, Users  # noqa: E402
+from utils import create_access_token, principal_cache  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """
+    A fresh SQLite database with the schema, bound to SessionLocal for the code opening its own sessions
+    """
+    default_engine = db_module.engine
+    engine = create_engine(f"sqlite:///{tmp_path}/forum.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(db_module, "engine", engine)
+    db_module.SessionLocal.configure(bind=engine)
+    yield engine
+    db_module.SessionLocal.configure(bind=default_engine)
+    engine.dispose()
+
+@pytest.fixture
+def db(engine):
+    session = db_module.SessionLocal()
+    yield session
+    session.close()
+
+@pytest.fixture
+def client(engine):
+    """
+    The app on the test database, without its lifespan (no warm-up or background threads)
+    """
+    from fastapi.testclient import TestClient
+    from main import app
+    from versions import listing_cache
+
+    # Ids repeat in every test's database, nothing cached for an earlier one may be served
+    principal_cache.clear()
+    listing_cache.clear()
+    yield TestClient(app)
+    principal_cache.clear()
+    listing_cache.clear()
+
+def auth(user: Users) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': user.username})}"}
+
+def add_user(db, username: str, admin: bool = False) -> Users:
+    user = Users(username=username, hashed_password="-", email=f"{username}@example.com", age=30,
+                 registration_date=date.today(), admin=admin)
+    db.add(user)
+    db.commit()
+    return user
+
+def add_category(db, name: str = "general", visibility: bool = True) -> Category:
+    category = Category(name=name, description=name, visibility=visibility, locked=False)
+    db.add(category)
+    db.commit()
+    return category
+
+def add_topic(db, user: Users, category: Category, title: str = "topic") -> Topic:
+    topic = Topic(title=title, description=title, locked=False, user_id=user.id, category_id=category.id)
+    db.add(topic)
+    db.commit()
+    return topic
+
+def add_post(db, topic: Topic, content: str = "post", **columns) -> Post:
+    post = Post(content=content, user_id=topic.user_id, topic_id=topic.id, category_id=topic.category_id, **columns)
+    db.add(post)
+    db.commit()
+    return post
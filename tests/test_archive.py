@@ -0,0 +1,56 @@
+import zlib
+from datetime import datetime
+
+import orjson
+
+import archive
+from archive import ARCHIVE_FORMAT, ArchivedTopicData, archive_cache, archive_topic, load_archived_topic
+from models import ArchivedTopic
+from search import InMemorySearchBackend
+
+from conftest import add_category, add_post, add_topic, add_user
+
+
+def test_archived_posts_keep_their_creation_time(db):
+    user = add_user(db, "author")
+    topic = add_topic(db, user, add_category(db))
+    first = add_post(db, topic, "first", created_at=datetime(2020, 1, 1, 12, 30)).id
+    reply = add_post(db, topic, "reply", created_at=datetime(2020, 1, 2, 8, 0)).id
+    archive_cache.clear()
+
+    assert archive_topic(topic.id, db) == 2
+
+    archived = load_archived_topic(topic.id, db)
+    assert archived.post(first).created_at == datetime(2020, 1, 1, 12, 30)
+    assert archived.post(reply).created_at == datetime(2020, 1, 2, 8, 0)
+    # Listings and exports keep serving the PostSchema fields only
+    assert set(archived.posts[0]) == {"id", "content", "user_id", "topic_id", "category_id"}
+    blob = db.get(ArchivedTopic, topic.id).data
+    assert orjson.loads(zlib.decompress(blob))["format"] == ARCHIVE_FORMAT == 2
+
+def test_format_1_topics_load_without_creation_times():
+    archived = ArchivedTopicData\
+    ({
+        "format": 1,
+        "posts": [{"id": 1, "content": "old", "user_id": 1, "topic_id": 1, "category_id": 1}],
+        "counters": [[1, 2, 1]],
+        "votes": []
+    })
+
+    post = archived.post(1)
+    assert (post.content, post.created_at, post.score) == ("old", None, 1)
+
+
+def test_archived_posts_leave_the_search_index(db, monkeypatch):
+    backend = InMemorySearchBackend()
+    monkeypatch.setattr(archive, "search_backend", backend)
+    user = add_user(db, "author")
+    topic, other = (add_topic(db, user, add_category(db), title) for title in ("cold", "warm"))
+    for post in (add_post(db, topic, "vacuum tuning", created_at=datetime(2020, 1, 1)),
+                 add_post(db, other, "vacuum freeze", created_at=datetime(2024, 1, 1))):
+        backend.index_post(post)
+
+    archive_topic(topic.id, db)
+
+    hit, = backend.search(None, "vacuum", None, 10, 0)
+    assert (hit["type"], hit["topic_id"]) == ("post", other.id)
@@ -0,0 +1,29 @@
+from bulk_import import import_rows
+from models import Category, Topic
+
+from conftest import add_category, add_topic, add_user
+
+
+def test_imported_posts_are_counted(db):
+    user = add_user(db, "author")
+    category = add_category(db)
+    topic, other = add_topic(db, user, category), add_topic(db, user, category, "other")
+    rows = \
+    [
+        {"id": 10, "content": "first", "user_id": user.id, "topic_id": topic.id, "category_id": category.id,
+         "created_at": "2021-01-01T00:00:00+00:00"},
+        {"id": 11, "content": "reply", "user_id": user.id, "topic_id": topic.id, "category_id": category.id,
+         "created_at": "2021-01-02T00:00:00+00:00"},
+        {"id": 12, "content": "other", "user_id": user.id, "topic_id": other.id, "category_id": category.id,
+         "created_at": "2021-01-03T00:00:00+00:00"}
+    ]
+
+    report = import_rows(db, "posts", iter(rows), batch_size=2)
+
+    assert report.inserted == 3
+    db.expire_all()
+    topic, other, category = db.get(Topic, topic.id), db.get(Topic, other.id), db.get(Category, category.id)
+    assert (topic.post_count, topic.reply_count, topic.last_post_id) == (2, 1, 11)
+    assert topic.last_post_at.date().isoformat() == "2021-01-02"
+    assert (other.post_count, other.reply_count, other.last_post_id) == (1, 0, 12)
+    assert (category.post_count, category.reply_count, category.last_post_id) == (3, 1, 12)
@@ -0,0 +1,73 @@
+import pytest
+
+from models import Conversation, Users
+
+from conftest import add_user, auth
+
+
+@pytest.fixture
+def users(db):
+    return [add_user(db, username) for username in ("alice", "bob", "carol")]
+
+def send(client, sender, recipient, text: str) -> dict:
+    response = client.post("/dms/send", data={"recipient_id": recipient.id, "text": text}, headers=auth(sender))
+    assert response.status_code == 200
+    return response.json()
+
+def unread(client, user) -> int:
+    return client.get("/dms/unread", headers=auth(user)).json()["unread"]
+
+def inbox(client, user, **params) -> dict:
+    response = client.get("/dms/", params=params, headers=auth(user))
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_sending_counts_unread_and_reading_resets(client, db, users):
+    alice, bob, carol = users
+    conversation_id = send(client, alice, bob, "hi")["conversation_id"]
+    send(client, alice, bob, "are you there?")
+    send(client, carol, bob, "hello")
+    send(client, bob, alice, "yes")
+
+    assert (unread(client, alice), unread(client, bob), unread(client, carol)) == (1, 3, 0)
+    db.expire_all()
+    conversation = db.get(Conversation, conversation_id)
+    assert (conversation.initiator_unread, conversation.receiver_unread) == (1, 2)
+
+    response = client.post(f"/dms/{conversation_id}/read", headers=auth(bob))
+    assert response.json() == {"unread": 1}
+    db.expire_all()
+    assert db.get(Conversation, conversation_id).receiver_unread == 0
+    assert db.get(Conversation, conversation_id).initiator_unread == 1
+
+    # Reading again, or a conversation without unread messages, changes nothing
+    assert client.post(f"/dms/{conversation_id}/read", headers=auth(bob)).json() == {"unread": 1}
+    assert client.post(f"/dms/{conversation_id}/read", headers=auth(alice)).json() == {"unread": 0}
+    assert db.query(Users.unread_messages).filter(Users.id.__eq__(bob.id)).scalar() == 1
+
+    # Only participants can mark a conversation read
+    assert client.post(f"/dms/{conversation_id}/read", headers=auth(carol)).status_code == 404
+
+def test_inbox_is_ordered_by_last_message(client, users):
+    alice, bob, carol = users
+    send(client, alice, bob, "first")     # started by alice
+    send(client, carol, alice, "second")  # received by alice
+    send(client, bob, alice, "third")     # moves the conversation with bob up again
+
+    page = inbox(client, alice)
+    assert [(item["other_username"], item["last_message"], item["unread"]) for item in page["items"]] ==\
+        [("bob", "third", 1), ("carol", "second", 1)]
+    assert page["items"][0]["last_message_at"] > page["items"][1]["last_message_at"]
+    assert [item["other_username"] for item in inbox(client, bob)["items"]] == ["alice"]
+
+    # Paging merges the conversations alice started with those she received
+    first = inbox(client, alice, limit=1)
+    second = inbox(client, alice, limit=1, cursor=first["next_cursor"])
+    assert [item["other_username"] for item in first["items"] + second["items"]] == ["bob", "carol"]
+    assert second["next_cursor"] is None
+    back = inbox(client, alice, limit=1, cursor=second["prev_cursor"])
+    assert [item["other_username"] for item in back["items"]] == ["bob"] and back["prev_cursor"] is None
+
+    send(client, alice, carol, "fourth")
+    assert [item["other_username"] for item in inbox(client, alice)["items"]] == ["carol", "bob"]
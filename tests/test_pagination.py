@@ -0,0 +1,115 @@
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from models import Post
+from pagination import decode_cursor, encode_cursor, keyset_page, keyset_slice
+
+from conftest import add_category, add_post, add_topic, add_user, auth
+
+
+@pytest.fixture
+def topic(db):
+    user = add_user(db, "author")
+    topic = add_topic(db, user, add_category(db))
+    for number in range(7):
+        add_post(db, topic, f"post {number}")
+    return topic
+
+def page(db, topic, cursor: str | None, descending: bool = False):
+    query = db.query(Post.id).filter(Post.topic_id.__eq__(topic.id))
+    rows, next_cursor, prev_cursor = keyset_page(query, [Post.id], f"topic:{topic.id}", cursor, 3, descending)
+    return [row.id for row in rows], next_cursor, prev_cursor
+
+def walk(fetch) -> tuple[list[list], list[str | None]]:
+    """
+    Follows next cursors to the last page, then prev cursors back to the first, returns the pages seen
+    """
+    pages, cursor = [], None
+    while True:
+        ids, next_cursor, prev_cursor = fetch(cursor)
+        pages.append(ids)
+        if next_cursor is None:
+            break
+        cursor = next_cursor
+    backwards = []
+    while prev_cursor is not None:
+        ids, _, prev_cursor = fetch(prev_cursor)
+        backwards.append(ids)
+    return pages, backwards
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_round_trip(db, topic, descending):
+    ids = sorted(post.id for post in db.query(Post.id))
+    if descending:
+        ids.reverse()
+
+    pages, backwards = walk(lambda cursor: page(db, topic, cursor, descending))
+
+    assert pages == [ids[0:3], ids[3:6], ids[6:7]]
+    assert backwards == [ids[3:6], ids[0:3]]
+
+def test_first_and_last_pages(db, topic):
+    ids, next_cursor, prev_cursor = page(db, topic, None)
+    assert len(ids) == 3 and next_cursor and prev_cursor is None
+
+    ids, next_cursor, prev_cursor = page(db, topic, encode_cursor(f"topic:{topic.id}", (ids[-1] + 3,), "next"))
+    assert len(ids) == 1 and next_cursor is None and prev_cursor
+
+    # A page ending exactly at the last row has no next cursor either
+    ids, next_cursor, _ = page(db, topic, encode_cursor(f"topic:{topic.id}", (ids[0] - 3,), "next"))
+    assert len(ids) == 3 and next_cursor is None
+
+def test_slices_use_the_same_cursors(db, topic):
+    rows = [{"id": post_id} for post_id, in db.query(Post.id).order_by(Post.id)]
+
+    def fetch(cursor):
+        items, next_cursor, prev_cursor = keyset_slice(rows, lambda row: (row["id"],), f"topic:{topic.id}", cursor, 3)
+        return [item["id"] for item in items], next_cursor, prev_cursor
+
+    assert walk(fetch) == walk(lambda cursor: page(db, topic, cursor))
+
+def forged(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+@pytest.mark.parametrize("cursor",
+[
+    encode_cursor("topic:2", (1,), "next"),  # another listing
+    encode_cursor("topic:1", (1,), "sideways"),
+    "not a cursor!",
+    forged(["topic:1", "next"]),
+    forged({"scope": "topic:1"}),
+    forged(["topic:1", "next", [{"x": 1}]]),
+    forged(["topic:1", "next", [{"dt": "yesterday"}]]),
+    forged(["topic:1", "next", "1"]),
+    forged(["topic:1", "next", [[1]]]),
+])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, "topic:1")
+    assert error.value.status_code == 400
+
+def test_cursors_of_the_wrong_shape_are_rejected(db, topic):
+    scope = f"topic:{topic.id}"
+    with pytest.raises(HTTPException):
+        page(db, topic, encode_cursor(scope, (1, 2), "next"))
+    with pytest.raises(HTTPException):
+        page(db, topic, encode_cursor(scope, ("1",), "next"))
+    with pytest.raises(HTTPException):
+        keyset_slice([{"id": 1}], lambda row: (row["id"],), scope, encode_cursor(scope, ("a",), "next"), 3)
+
+def test_listings_answer_400_to_invalid_cursors(client, db, topic):
+    user = add_user(db, "reader")
+    headers = auth(user)
+    other_topic = encode_cursor(f"topic:{topic.id + 1}", (1,), "next")
+
+    for cursor in (other_topic, forged([f"topic:{topic.id}", "next", ["1"]]), "%%%"):
+        response = client.get(f"/topics/{topic.id}", params={"cursor": cursor}, headers=headers)
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid pagination cursor."}
+
+    response = client.get(f"/topics/{topic.id}", params={"limit": 3}, headers=headers)
+    assert response.status_code == 200 and response.json()["next_cursor"]
@@ -0,0 +1,46 @@
+import asyncio
+import hashlib
+
+import pytest
+
+import passwords
+from passwords import hash_password, verify_password, verify_password_async
+
+
+@pytest.fixture(autouse=True)
+def cheap_scrypt(monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_SCRYPT_N", 2 ** 4)
+
+
+def test_hashes_verify():
+    hashed = hash_password("secret")
+
+    assert verify_password("secret", hashed)
+    assert not verify_password("other", hashed)
+    assert verify_password("secret", hashlib.sha256(b"secret").hexdigest())
+
+@pytest.mark.parametrize("hashed",
+[
+    "scrypt$16$8$1$c2FsdA",  # truncated
+    "scrypt$sixteen$8$1$c2FsdA$ZGlnZXN0",
+    "scrypt$15$8$1$c2FsdA$ZGlnZXN0",  # N must be a power of 2
+    "scrypt$16$8$1$c2F*sdA$ZGlnZXN0",
+    "scrypt$$$$$$$",
+    "ünïcode",
+])
+def test_malformed_hashes_never_match(hashed):
+    assert not verify_password("secret", hashed)
+
+def test_hashing_works_from_several_event_loops():
+    hashed = hashlib.sha256(b"secret").hexdigest()
+    count = passwords.PASSWORD_HASH_CONCURRENCY + 1
+
+    async def verify_concurrently():
+        # More verifications than slots, so some wait, which binds a semaphore to the loop
+        return await asyncio.gather(*[verify_password_async("secret", hashed) for _ in range(count)])
+
+    try:
+        assert asyncio.run(verify_concurrently()) == [True] * count
+        assert asyncio.run(verify_concurrently()) == [True] * count
+    finally:
+        passwords.shutdown_hash_pool()
@@ -0,0 +1,101 @@
+import pytest
+
+from archive import archive_cache, archive_topic
+from maintenance import reconcile_votes
+from models import Post, PostInteraction
+from posts import MAX_BATCH_POSTS
+
+from conftest import add_category, add_post, add_topic, add_user, auth
+
+
+@pytest.fixture
+def forum(db):
+    author, voter = add_user(db, "author"), add_user(db, "voter")
+    topic = add_topic(db, author, add_category(db))
+    return author, voter, add_post(db, topic, "post").id
+
+def vote(client, user, post_id: int, value: int) -> dict:
+    response = client.post(f"/posts/{post_id}/interaction", data={"vote": value}, headers=auth(user))
+    assert response.status_code == 200
+    return response.json()
+
+def stored(db, post_id: int) -> tuple[dict[int, bool], tuple[int, int, int]]:
+    db.expire_all()
+    post = db.get(Post, post_id)
+    votes = {row.user_id: row.vote for row in db.query(PostInteraction).filter(PostInteraction.post_id.__eq__(post_id))}
+    return votes, (post.upvotes, post.downvotes, post.score)
+
+
+def test_votes_keep_the_counters_in_step(client, db, forum):
+    author, voter, post_id = forum
+
+    view = vote(client, voter, post_id, 1)
+    assert (view["upvotes"], view["downvotes"], view["interactions"], view["user_vote"]) == (1, 0, 1, True)
+    assert stored(db, post_id) == ({voter.id: True}, (1, 0, 1))
+
+    vote(client, author, post_id, 1)
+    view = vote(client, voter, post_id, -1)
+    assert (view["upvotes"], view["downvotes"], view["interactions"], view["user_vote"]) == (1, 1, 0, False)
+    assert stored(db, post_id) == ({author.id: True, voter.id: False}, (1, 1, 0))
+
+    # Voting the same way again changes nothing
+    vote(client, voter, post_id, -1)
+    assert stored(db, post_id) == ({author.id: True, voter.id: False}, (1, 1, 0))
+
+    view = vote(client, voter, post_id, 0)
+    assert (view["upvotes"], view["downvotes"], view["user_vote"]) == (1, 0, None)
+    assert stored(db, post_id) == ({author.id: True}, (1, 0, 1))
+
+    vote(client, voter, post_id, 0)
+    assert stored(db, post_id) == ({author.id: True}, (1, 0, 1))
+
+def test_reconcile_votes_fixes_drifted_counters(db, forum):
+    author, voter, post_id = forum
+    db.add_all([PostInteraction(post_id=post_id, user_id=author.id, vote=True),
+                PostInteraction(post_id=post_id, user_id=voter.id, vote=False)])
+    db.query(Post).update({Post.upvotes: 5, Post.downvotes: 0, Post.score: 5})
+    db.commit()
+
+    assert reconcile_votes(db, post_id) == 1
+    assert stored(db, post_id)[1] == (1, 1, 0)
+
+    db.query(Post).update({Post.upvotes: -3})
+    db.commit()
+    assert reconcile_votes(db) == 1
+    assert stored(db, post_id)[1] == (1, 1, 0)
+
+def test_batch_statuses_keep_the_order_asked_for(client, db, forum):
+    author, voter, post_id = forum
+    hidden_topic = add_topic(db, author, add_category(db, "drafts", visibility=False))
+    hidden_id = add_post(db, hidden_topic, "hidden").id
+    archived_topic = add_topic(db, author, add_category(db, "old"))
+    archived_id = add_post(db, archived_topic, "archived").id
+    archive_cache.clear()
+    archive_topic(archived_topic.id, db)
+    vote(client, voter, post_id, 1)
+
+    response = client.get("/posts/batch", params={"ids": [999, archived_id, post_id, hidden_id, post_id]},
+                          headers=auth(voter))
+
+    assert response.status_code == 200
+    items = response.json()["items"]
+    # Duplicates are answered once, at their first position
+    assert [(item["id"], item["status"]) for item in items] ==\
+        [(999, "not_found"), (archived_id, "ok"), (post_id, "ok"), (hidden_id, "forbidden")]
+    assert items[0]["view"] is None and items[3]["view"] is None
+    assert items[1]["view"]["post"]["content"] == "archived"
+    assert (items[2]["view"]["upvotes"], items[2]["view"]["user_vote"]) == (1, True)
+
+def test_batch_matches_single_views(client, db, forum):
+    author, voter, post_id = forum
+    single = client.get(f"/posts/{post_id}", headers=auth(voter)).json()
+
+    entry, = client.get("/posts/batch", params={"ids": [post_id]}, headers=auth(voter)).json()["items"]
+    assert entry["view"] == single
+
+def test_batch_size_is_bounded(client, forum):
+    author, _, post_id = forum
+
+    assert client.get("/posts/batch", headers=auth(author)).status_code == 422
+    too_many = list(range(1, MAX_BATCH_POSTS + 2))
+    assert client.get("/posts/batch", params={"ids": too_many}, headers=auth(author)).status_code == 422
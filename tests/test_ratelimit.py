@@ -0,0 +1,142 @@
+import asyncio
+import sqlite3
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, text
+
+import ratelimit
+from ratelimit import AdmissionControl, MemoryBuckets, PostgresBuckets, RouteClass, admitted
+from utils import CurrentUser
+
+ROUTE = RouteClass(name="write", user_rate=1, user_burst=2, ip_rate=4, ip_burst=5, concurrency=2)
+USER = CurrentUser(id=1, username="writer", admin=False)
+
+
+class Clock:
+    """
+    Stands in for time.time in the ratelimit module
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "time", clock)
+    return clock
+
+@pytest.fixture
+def postgres_buckets(tmp_path):
+    # The upsert runs on SQLite with GREATEST defined, the table is that of 005_rate_limit_buckets.sql
+    engine = create_engine(f"sqlite:///{tmp_path}/buckets.db")
+
+    @event.listens_for(engine, "connect")
+    def define_greatest(connection: sqlite3.Connection, _) -> None:
+        connection.create_function("GREATEST", 2, max)
+
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE rate_limit_buckets (key TEXT PRIMARY KEY, arrival DOUBLE PRECISION)"))
+    yield PostgresBuckets(engine)
+    engine.dispose()
+
+def take(buckets, key: str = "key", rate: float = 2, burst: int = 3) -> float:
+    return asyncio.run(buckets.take(key, rate, burst))
+
+def http_request(ip: str = "10.0.0.1"):
+    class Client:
+        host = ip
+
+    class Request:
+        client = Client()
+
+    return Request()
+
+
+@pytest.mark.parametrize("backend", ["memory", "postgres"])
+def test_buckets_allow_a_burst_then_the_rate(backend, clock, request):
+    buckets = MemoryBuckets() if backend == "memory" else request.getfixturevalue("postgres_buckets")
+
+    assert [take(buckets) for _ in range(3)] == [0, 0, 0]
+    assert take(buckets) == pytest.approx(0.5)
+    # Rejected requests take no token, waiting for the refill does
+    clock.now += 0.25
+    assert take(buckets) == pytest.approx(0.25)
+    clock.now += 0.25
+    assert take(buckets) == 0
+    assert take(buckets) == pytest.approx(0.5)
+
+    # Buckets are independent, and refill completely when idle
+    assert take(buckets, "other") == 0
+    clock.now += 10
+    assert [take(buckets) for _ in range(4)][-2:] == [0, pytest.approx(0.5)]
+
+def test_postgres_arrival_is_only_moved_by_admitted_requests(clock, postgres_buckets):
+    for _ in range(4):
+        take(postgres_buckets)
+
+    with postgres_buckets.engine.connect() as connection:
+        arrival = connection.execute(text("SELECT arrival FROM rate_limit_buckets WHERE key = 'key'")).scalar()
+    # Three admitted requests half a second apart from now, the rejected fourth left it
+    assert arrival == pytest.approx(clock.now + 1.5)
+
+def test_empty_buckets_answer_429_with_retry_after(clock):
+    admission = AdmissionControl(MemoryBuckets())
+
+    async def check(ip: str, user: CurrentUser | None) -> HTTPException | None:
+        try:
+            await admission.check_buckets(ROUTE, ip, user)
+        except HTTPException as error:
+            return error
+        return None
+
+    assert asyncio.run(check("10.0.0.1", USER)) is None
+    assert asyncio.run(check("10.0.0.1", USER)) is None
+    rejected = asyncio.run(check("10.0.0.1", USER))
+    assert rejected.status_code == 429 and rejected.headers == {"Retry-After": "1"}
+
+    # Another user on the same IP has a bucket of their own, requests without a user only count per IP
+    assert asyncio.run(check("10.0.0.1", CurrentUser(id=2, username="other", admin=False))) is None
+    assert asyncio.run(check("10.0.0.1", None)) is None
+    rejected = asyncio.run(check("10.0.0.1", None))
+    assert rejected.status_code == 429
+    assert admission.stats()["rejections"] ==\
+        [{"route_class": "write", "reason": "ip", "count": 1}, {"route_class": "write", "reason": "user", "count": 1}]
+
+def test_concurrency_cap_answers_503(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT", True)
+    admission = AdmissionControl(MemoryBuckets())
+    monkeypatch.setattr(ratelimit, "admission", admission)
+
+    async def scenario():
+        async with admitted(ROUTE, http_request("10.0.0.1"), None):
+            async with admitted(ROUTE, http_request("10.0.0.2"), None):
+                assert admission.stats()["in_flight"] == {"write": 2}
+                with pytest.raises(HTTPException) as error:
+                    async with admitted(ROUTE, http_request("10.0.0.3"), None):
+                        pass
+                assert error.value.status_code == 503 and error.value.headers == {"Retry-After": "1"}
+        # Slots are given back when the requests finish, rejected ones never held one
+        assert admission.stats()["in_flight"] == {"write": 0}
+        async with admitted(ROUTE, http_request("10.0.0.3"), None):
+            pass
+
+    asyncio.run(scenario())
+    assert admission.stats()["rejections"] == [{"route_class": "write", "reason": "concurrency", "count": 1}]
+
+def test_disabled_rate_limit_admits_everything(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT", False)
+    admission = AdmissionControl(MemoryBuckets())
+    monkeypatch.setattr(ratelimit, "admission", admission)
+
+    async def scenario():
+        for _ in range(ROUTE.concurrency + 1):
+            async with admitted(ROUTE, http_request(), USER):
+                pass
+
+    asyncio.run(scenario())
+    assert admission.stats()["rejections"] == []
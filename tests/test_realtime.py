@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+import pytest
+
+from realtime import Hub, InMemoryBroker, WORKER_ID
+
+
+@pytest.fixture
+def hub():
+    hub = Hub(InMemoryBroker(), queue_size=3)
+    hub.start()
+    yield hub
+    hub.stop()
+
+async def next_event(subscriber, timeout: float = 1.0):
+    text = await asyncio.wait_for(subscriber.get(), timeout)
+    return None if text is None else json.loads(text)
+
+
+def test_events_reach_every_subscriber_of_their_channel(hub):
+    async def scenario():
+        first, second = hub.subscribe("topic:1"), hub.subscribe("topic:1")
+        other = hub.subscribe("topic:2")
+
+        hub.publish("topic:1", {"type": "post", "post": {"id": 5}})
+
+        for subscriber in (first, second):
+            assert await next_event(subscriber) == {"channel": "topic:1", "type": "post", "post": {"id": 5}}
+        with pytest.raises(asyncio.TimeoutError):
+            await next_event(other, timeout=0.05)
+
+    asyncio.run(scenario())
+
+def test_unsubscribed_clients_get_nothing(hub):
+    async def scenario():
+        subscriber = hub.subscribe("user:1")
+        hub.unsubscribe(subscriber)
+        hub.publish("user:1", {"type": "message"})
+
+        with pytest.raises(asyncio.TimeoutError):
+            await next_event(subscriber, timeout=0.05)
+        assert hub.stats() == {"channels": 0, "subscribers": 0, "slow_disconnects": 0}
+
+    asyncio.run(scenario())
+
+def test_slow_subscribers_are_dropped(hub):
+    async def scenario():
+        slow, fast = hub.subscribe("topic:1"), hub.subscribe("topic:1")
+
+        for number in range(4):
+            hub.publish("topic:1", {"type": "post", "number": number})
+            # The fast client keeps up, the slow one never reads
+            assert (await next_event(fast))["number"] == number
+
+        assert slow.dropped and not fast.dropped
+        assert await next_event(slow) is None
+        hub.unsubscribe(slow)
+        assert hub.stats()["slow_disconnects"] == 1
+
+    asyncio.run(scenario())
+
+def test_listeners_see_every_event_with_its_origin(hub):
+    received = []
+    hub.add_listener(lambda channel, data, origin: received.append((channel, data, origin)))
+
+    hub.publish("sticky", {"type": "sticky", "user_id": 3})
+
+    assert received == [("sticky", {"type": "sticky", "user_id": 3}, WORKER_ID)]
+
+def test_a_failing_listener_doesnt_stop_delivery(hub):
+    async def scenario():
+        def broken(channel, data, origin):
+            raise RuntimeError("listener bug")
+
+        hub.add_listener(broken)
+        subscriber = hub.subscribe("topic:1")
+        hub.publish("topic:1", {"type": "post"})
+
+        assert await next_event(subscriber) == {"channel": "topic:1", "type": "post"}
+
+    asyncio.run(scenario())
+
+def test_events_of_other_workers_are_dispatched(hub):
+    async def scenario():
+        origins = []
+        hub.add_listener(lambda channel, data, origin: origins.append(origin))
+        subscriber = hub.subscribe("topic:1")
+
+        # What another worker's publish looks like when the broker delivers it here
+        hub.dispatch(json.dumps({"channel": "topic:1", "origin": "other-worker", "data": {"type": "post"}}))
+
+        assert await next_event(subscriber) == {"channel": "topic:1", "type": "post"}
+        assert origins == ["other-worker"]
+
+    asyncio.run(scenario())
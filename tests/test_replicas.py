@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import pytest
+
+import replicas
+from db import SessionLocal
+from replicas import ReplicaSet, apply_remote_sticky, get_read_db, mark_written, sticky_users
+from utils import CurrentUser
+
+WRITER = CurrentUser(id=1, username="writer", admin=False)
+READER = CurrentUser(id=2, username="reader", admin=False)
+
+
+@pytest.fixture
+def replica_set(tmp_path, monkeypatch):
+    replica_set = ReplicaSet([f"sqlite:///{tmp_path}/replica{number}.db" for number in range(2)])
+    monkeypatch.setattr(replicas, "replica_set", replica_set)
+    sticky_users.clear()
+    replicas._announced.clear()
+    yield replica_set
+    sticky_users.clear()
+    replicas._announced.clear()
+    replica_set.stop()
+
+def read_bind(user: CurrentUser):
+    """
+    Returns the engine get_read_db gives the user a session on
+    """
+    async def scenario():
+        sessions = get_read_db(user)
+        db = await sessions.__anext__()
+        try:
+            return db.get_bind()
+        finally:
+            await sessions.aclose()
+
+    return asyncio.run(scenario())
+
+
+def test_reads_rotate_over_healthy_replicas(replica_set):
+    first, second = replica_set.replicas
+
+    assert [replica_set.pick() for _ in range(4)] == [first, second, first, second]
+
+    second.healthy = False
+    assert [replica_set.pick() for _ in range(2)] == [first, first]
+
+    first.healthy = False
+    assert replica_set.pick() is None
+
+def test_health_checks_mark_unreachable_replicas(replica_set, tmp_path):
+    broken = ReplicaSet([f"sqlite:///{tmp_path}/missing/replica.db"])
+    broken.check()
+    replica_set.check()
+
+    assert not broken.replicas[0].healthy and broken.replicas[0].error
+    assert all(replica.healthy for replica in replica_set.replicas)
+
+def test_writers_read_their_writes_from_the_primary(replica_set):
+    replica_engines = {replica.engine for replica in replica_set.replicas}
+
+    assert read_bind(WRITER) in replica_engines
+    mark_written(WRITER)
+
+    assert read_bind(WRITER) is SessionLocal.kw["bind"]
+    # Everyone else keeps reading from the replicas
+    assert read_bind(READER) in replica_engines
+
+def test_stickiness_expires(replica_set, monkeypatch):
+    monkeypatch.setattr(sticky_users, "ttl", 0.01)
+    mark_written(WRITER)
+    time.sleep(0.02)
+
+    assert read_bind(WRITER) in {replica.engine for replica in replica_set.replicas}
+
+def test_writes_on_other_workers_make_the_user_sticky(replica_set):
+    apply_remote_sticky("sticky", {"type": "sticky", "user_id": READER.id}, "other-worker")
+
+    assert read_bind(READER) is SessionLocal.kw["bind"]
+
+def test_without_replicas_reads_go_to_the_primary(monkeypatch):
+    monkeypatch.setattr(replicas, "replica_set", ReplicaSet([]))
+    mark_written(WRITER)
+
+    assert sticky_users.get(WRITER.id) is None
+    assert read_bind(READER) is SessionLocal.kw["bind"]
@@ -0,0 +1,100 @@
+import pytest
+
+from models import Post, Topic
+from search import InMemorySearchBackend, SNIPPET_WORDS
+
+
+def post(post_id: int, content: str, category_id: int = 1) -> Post:
+    return Post(id=post_id, content=content, user_id=1, topic_id=1, category_id=category_id)
+
+@pytest.fixture
+def backend() -> InMemorySearchBackend:
+    return InMemorySearchBackend()
+
+def ids(hits: list[dict]) -> list[int]:
+    return [hit["id"] for hit in hits]
+
+
+def test_more_occurrences_rank_higher(backend):
+    backend.index_post(post(1, "python once among other words here"))
+    backend.index_post(post(2, "python python python among other words"))
+
+    assert ids(backend.search(None, "python", None, 10, 0)) == [2, 1]
+
+def test_shorter_documents_rank_higher(backend):
+    backend.index_post(post(1, "cache " + "filler " * 30))
+    backend.index_post(post(2, "cache filler"))
+
+    hits = backend.search(None, "cache", None, 10, 0)
+    assert ids(hits) == [2, 1]
+    assert hits[0]["rank"] > hits[1]["rank"] > 0
+
+def test_rare_terms_weigh_more(backend):
+    for post_id in range(1, 6):
+        backend.index_post(post(post_id, "common filler"))
+    backend.index_post(post(6, "rare filler"))
+
+    rare, = backend.search(None, "rare", None, 10, 0)
+    common = backend.search(None, "common", None, 10, 0)
+    assert len(common) == 5
+    assert rare["rank"] > common[0]["rank"]
+
+def test_all_terms_must_match(backend):
+    backend.index_post(post(1, "database index"))
+    backend.index_post(post(2, "database"))
+
+    assert ids(backend.search(None, "database index", None, 10, 0)) == [1]
+    assert backend.search(None, "missing", None, 10, 0) == []
+    assert backend.search(None, "!!!", None, 10, 0) == []
+
+def test_category_filter_and_paging(backend):
+    for post_id in range(1, 5):
+        backend.index_post(post(post_id, "lock", category_id=post_id % 2))
+
+    assert sorted(ids(backend.search(None, "lock", [1], 10, 0))) == [1, 3]
+    assert backend.search(None, "lock", [], 10, 0) == []
+    # Equal ranks are ordered by id, pages don't overlap
+    assert ids(backend.search(None, "lock", None, 2, 0)) == [1, 2]
+    assert ids(backend.search(None, "lock", None, 2, 2)) == [3, 4]
+
+def test_reindexing_and_removal(backend):
+    backend.index_post(post(1, "thread"))
+    backend.index_post(post(1, "process"))
+    assert backend.search(None, "thread", None, 10, 0) == []
+    assert ids(backend.search(None, "process", None, 10, 0)) == [1]
+
+    backend.remove_post(1)
+    assert backend.search(None, "process", None, 10, 0) == []
+
+def test_topics_are_searched_with_their_title(backend):
+    backend.index_topic(Topic(id=7, title="Release notes", description="what changed", category_id=1))
+
+    hit, = backend.search(None, "release", None, 10, 0)
+    assert (hit["type"], hit["id"], hit["topic_id"], hit["title"]) == ("topic", 7, 7, "Release notes")
+
+
+def test_snippet_highlights_matches(backend):
+    assert backend.snippet("Fix the Bug, please", {"bug"}) == "Fix the <b>Bug,</b> please"
+
+def test_snippet_is_a_window_around_the_first_match(backend):
+    words = [f"w{i}" for i in range(100)]
+    words[60] = "latency"
+
+    snippet = backend.snippet(" ".join(words), {"latency"}).split()
+    assert len(snippet) == SNIPPET_WORDS
+    assert snippet[SNIPPET_WORDS // 4] == "<b>latency</b>"
+
+def test_snippet_escapes_user_content(backend):
+    snippet = backend.snippet("<script>alert(1)</script> query & <i>more</i>", {"query"})
+
+    assert snippet == "&lt;script&gt;alert(1)&lt;/script&gt; <b>query</b> &amp; &lt;i&gt;more&lt;/i&gt;"
+
+def test_posts_and_topics_sharing_an_id_keep_their_order(backend):
+    backend.index_topic(Topic(id=1, title="alpha", description="beta", category_id=1))
+    backend.index_post(post(1, "alpha beta"))
+
+    hits = backend.search(None, "alpha", None, 10, 0)
+    assert hits[0]["rank"] == hits[1]["rank"]
+    assert [(hit["type"], hit["id"]) for hit in hits] == [("post", 1), ("topic", 1)]
+    assert [hit["type"] for offset in (0, 1) for hit in backend.search(None, "alpha", None, 1, offset)] ==\
+        ["post", "topic"]
@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+from trending import DecayedRanking, TrendingRanker
+
+
+@pytest.fixture
+def ranker():
+    ranker = TrendingRanker(half_life=1)
+    # Started long ago, so activity up to now spans several rebases
+    ranker.topics.base = ranker.categories.base = time.time() - 2000
+    return ranker
+
+
+def test_recent_activity_ranks_first():
+    ranking = DecayedRanking(half_life=1)
+    ranking.add(1, 4.0, ranking.base - 3)
+    ranking.add(2, 1.0, ranking.base - 2)
+    ranking.add(3, 1.0, ranking.base)
+
+    # 4 three half-lives ago is worth 0.5 now, 1 two half-lives ago 0.25
+    assert [key for key, _ in ranking.top(3)] == [3, 1, 2]
+    assert [key for key, _ in ranking.top(3, lambda key: key != 3)] == [1, 2]
+
+def test_rebases_forget_decayed_topics(ranker):
+    start = ranker.topics.base
+    ranker._apply(1, 10, 1.0, start)
+    ranker._apply(2, 20, 1.0, start)
+    assert ranker.topic_categories == {1: 10, 2: 20}
+
+    # Long enough later to rebase, the untouched topic has decayed to nothing
+    ranker._apply(2, 20, 1.0, start + 1000)
+    assert ranker.topics.base == start + 1000
+    assert [topic_id for topic_id, _ in ranker.topics.top(10)] == [2]
+    assert ranker.topic_categories == {2: 20}
+
+    # A decayed topic with new activity is ranked again, with its category
+    ranker._apply(1, 10, 1.0, start + 2000)
+    assert [topic_id for topic_id, _ in ranker.topics.top(10)] == [1]
+    assert ranker.topic_categories == {1: 10}
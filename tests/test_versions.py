@@ -0,0 +1,74 @@
+import pytest
+
+from models import CategoryAccessPrivilege
+from versions import versions
+
+from conftest import add_category, add_post, add_topic, add_user, auth
+
+
+@pytest.fixture
+def forum(db):
+    author = add_user(db, "author")
+    topic = add_topic(db, author, add_category(db))
+    add_post(db, topic, "first")
+    return author, topic
+
+
+def test_current_copies_get_304(client, forum):
+    author, topic = forum
+    headers = auth(author)
+
+    first = client.get(f"/topics/{topic.id}", headers=headers)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and etag
+
+    again = client.get(f"/topics/{topic.id}", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["ETag"] == etag and not again.content
+
+    listed = client.get(f"/topics/{topic.id}", headers={**headers, "If-None-Match": f'"other", W/{etag}'})
+    assert listed.status_code == 304
+
+    stale = client.get(f"/topics/{topic.id}", headers={**headers, "If-None-Match": '"stale"'})
+    assert stale.status_code == 200 and stale.json() == first.json()
+
+def test_writes_change_the_etag(client, forum):
+    author, topic = forum
+    headers = auth(author)
+    etag = client.get(f"/topics/{topic.id}", headers=headers).headers["ETag"]
+
+    assert client.post(f"/topics/{topic.id}/post", data={"content": "reply"}, headers=headers).status_code == 200
+
+    response = client.get(f"/topics/{topic.id}", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    assert [post["content"] for post in response.json()["items"]] == ["first", "reply"]
+
+    # Any bump of the scope invalidates it, e.g. a post written by another route
+    etag = response.headers["ETag"]
+    versions.bump("topic", topic.id)
+    assert client.get(f"/topics/{topic.id}", headers={**headers, "If-None-Match": etag}).status_code == 200
+
+def test_users_with_other_visibility_never_share_an_entry(client, db, forum):
+    author, _ = forum
+    member, outsider, admin = add_user(db, "member"), add_user(db, "outsider"), add_user(db, "admin", admin=True)
+    # An empty privilege revokes the access to a visible category, hidden ones only admins see
+    staff = add_category(db, "staff")
+    add_category(db, "drafts", visibility=False)
+    db.add(CategoryAccessPrivilege(user_id=outsider.id, category_id=staff.id, permission_type=""))
+    db.commit()
+
+    def listing(user, etag: str | None = None):
+        headers = {**auth(user), **({"If-None-Match": etag} if etag else {})}
+        return client.get("/categories/", headers=headers)
+
+    member_listing = listing(member)
+    outsider_listing = listing(outsider)
+    assert [category["name"] for category in member_listing.json()] == ["general", "staff"]
+    assert [category["name"] for category in outsider_listing.json()] == ["general"]
+    assert member_listing.headers["ETag"] != outsider_listing.headers["ETag"]
+
+    # Another user's ETag is never a match, even for the same listing
+    assert listing(outsider, member_listing.headers["ETag"]).status_code == 200
+    assert listing(author, outsider_listing.headers["ETag"]).status_code == 200
+    assert listing(member, member_listing.headers["ETag"]).status_code == 304
+
+    assert [category["name"] for category in listing(admin).json()] == ["general", "staff", "drafts"]
@@ -0,0 +1,116 @@
+import pytest
+
+import votes
+from models import Post, PostInteraction
+from votes import NO_PENDING_VOTES, VoteBuffer
+
+from conftest import add_category, add_post, add_topic, add_user
+
+
+@pytest.fixture
+def posts(db):
+    user = add_user(db, "author")
+    topic = add_topic(db, user, add_category(db))
+    return [add_post(db, topic, f"post {number}").id for number in range(2)]
+
+@pytest.fixture
+def buffer(engine):
+    return VoteBuffer(flush_size=10)
+
+def stored_votes(db) -> dict[tuple[int, int], bool]:
+    return {(row.post_id, row.user_id): row.vote for row in db.query(PostInteraction)}
+
+def counters(db, post_id: int) -> tuple[int, int, int]:
+    post = db.get(Post, post_id)
+    db.refresh(post)
+    return post.upvotes, post.downvotes, post.score
+
+
+def test_votes_coalesce_per_post_and_user(buffer):
+    buffer.add(1, 7, None, True)
+    # The stored vote of the first add is kept, later adds only change the latest vote
+    buffer.add(1, 7, True, False)
+    buffer.add(1, 8, None, True)
+
+    assert buffer.pending_view(1, 7) == (1, 1, True, False)
+    assert buffer.pending_view(1, 9) == (1, 1, False, None)
+    assert buffer.pending_view(2, 7) == NO_PENDING_VOTES
+    assert buffer._pending_count == 2
+
+def test_flush_size_wakes_the_flush_thread(buffer):
+    for user_id in range(9):
+        buffer.add(1, user_id, None, True)
+    buffer.add(1, 0, None, False)
+    assert not buffer._wakeup.is_set()
+
+    buffer.add(2, 0, None, True)
+    assert buffer._wakeup.is_set()
+
+def test_flush_writes_votes_and_counters(db, buffer, posts):
+    first, second = posts
+    buffer.add(first, 1, None, True)
+    buffer.add(first, 2, None, False)
+    buffer.add(second, 1, None, True)
+
+    assert buffer.flush() == 3
+    assert stored_votes(db) == {(first, 1): True, (first, 2): False, (second, 1): True}
+    assert counters(db, first) == (1, 1, 0)
+    assert counters(db, second) == (1, 0, 1)
+    assert buffer.pending_view(first, 1) == NO_PENDING_VOTES and buffer.flush() == 0
+
+    # Changing and removing stored votes moves the counters from the stored ones
+    buffer.add(first, 1, True, None)
+    buffer.add(first, 2, False, True)
+    assert buffer.flush() == 2
+    assert stored_votes(db) == {(first, 2): True, (second, 1): True}
+    assert counters(db, first) == (1, 0, 1)
+
+def test_votes_being_flushed_stay_visible(db, buffer, posts, monkeypatch):
+    post_id = posts[0]
+    write_votes = votes.write_votes
+    views = []
+
+    def write_while_voting(session, batch):
+        # A vote arrives while the first one is being written
+        buffer.add(post_id, 1, True, False)
+        views.append(buffer.pending_view(post_id, 1))
+        write_votes(session, batch)
+
+    monkeypatch.setattr(votes, "write_votes", write_while_voting)
+    buffer.add(post_id, 1, None, True)
+    buffer.flush()
+
+    # None -> True (flushing) and True -> False (pending) add up to None -> False
+    assert views == [(0, 1, True, False)]
+    assert buffer.pending_view(post_id, 1) == (-1, 1, True, False)
+    assert counters(db, post_id) == (1, 0, 1)
+
+    monkeypatch.setattr(votes, "write_votes", write_votes)
+    buffer.flush()
+    assert counters(db, post_id) == (0, 1, -1)
+    assert stored_votes(db) == {(post_id, 1): False}
+
+def test_failed_flushes_merge_back(db, buffer, posts, monkeypatch):
+    first, second = posts
+    write_votes = votes.write_votes
+
+    def fail_while_voting(session, batch):
+        buffer.add(first, 1, True, None)
+        buffer.add(second, 2, None, False)
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(votes, "write_votes", fail_while_voting)
+    buffer.add(first, 1, None, True)
+    buffer.add(first, 2, None, True)
+
+    assert buffer.flush() == 0
+    # The newer vote wins, measured from what the database still holds
+    assert buffer.pending_view(first, 1) == (1, 0, True, None)
+    assert buffer.pending_views([first, second], 2) == {first: (1, 0, True, True), second: (0, 1, True, False)}
+    assert buffer._pending_count == 3 and stored_votes(db) == {}
+
+    monkeypatch.setattr(votes, "write_votes", write_votes)
+    assert buffer.flush() == 3
+    assert stored_votes(db) == {(first, 2): True, (second, 2): False}
+    assert counters(db, first) == (1, 0, 1)
+    assert counters(db, second) == (0, 1, -1)
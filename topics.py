@@ -1,17 +1,33 @@
-from typing import List
+from typing import Iterator
 
-from fastapi import APIRouter, Depends, Form
+from fastapi import APIRouter, Depends, Form, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from db import get_db
-from models import Users, Topic, Post
-from schemas import PostSchema
-from utils import get_current_user, can_user_see_topic, not_found, access_denied
+from activity import count_new_post
+from archive import load_archived_topic, topic_archived
+from db import get_db, db_route, SessionLocal
+from encoding import dumps
+from models import Topic, Post
+from ratelimit import limit, WRITE
+from pagination import keyset_page, keyset_slice, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from realtime import hub
+from schemas import PostSchema, PostPageSchema
+from replicas import get_read_db, mark_written
+from search import search_backend
+from trending import trending, TRENDING_POST_WEIGHT
+from utils import CurrentUser, get_current_user, can_user_see_topic, not_found, access_denied
+from versions import cached_listing, versions
 
 router = APIRouter(
     tags=["topics"]
 )
 
+EXPORT_BATCH_SIZE = 1000
+
+# Listings select the columns of PostSchema, plain rows are much cheaper to load and encode than entities
+POST_COLUMNS = (Post.id, Post.content, Post.user_id, Post.topic_id, Post.category_id)
+
 def verify_topic_and_access(user, topic, db):
     if not topic:
         raise not_found
@@ -19,36 +35,116 @@ def verify_topic_and_access(user, topic, db):
     if not can_user_see_topic(user, topic, db):
         raise access_denied
 
-@router.get("/{topic_id}", response_model=List[PostSchema])
-def get_posts_in_topic(topic_id: int,
-                       db: Session = Depends(get_db),
-                       user: Users = Depends(get_current_user)
-) -> list:
+@router.get("/{topic_id}", response_model=PostPageSchema)
+async def get_posts_in_topic(topic_id: int,
+                             request: Request,
+                             cursor: str | None = None,
+                             limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                             db: Session = Depends(get_read_db),
+                             user: CurrentUser = Depends(get_current_user)
+) -> Response:
+    """
+    Lists one page of the topic's posts for the logged-in user, ordered by id.
+    Pass next_cursor/prev_cursor from a previous page as cursor to move through the topic
     """
-    Lists all visible posts for the logged-in user
+    return await cached_listing\
+    (
+        request, user, ("topic", topic_id), None, db,
+        lambda session: list_posts_in_topic(topic_id, cursor, limit, session, user)
+    )
+
+def list_posts_in_topic(topic_id: int,
+                        cursor: str | None,
+                        limit: int,
+                        db: Session,
+                        user: CurrentUser
+) -> dict:
+    """
+    Checks access to the topic and returns one page of its posts as plain dicts
     """
     topic = db.query(Topic).filter(Topic.id.__eq__(topic_id)).first()
 
     verify_topic_and_access(user, topic, db)
 
+    if topic.archived:
+        posts, next_cursor, prev_cursor = keyset_slice\
+        (
+            load_archived_topic(topic_id, db).posts,
+            lambda post: (post["id"],),
+            f"topic:{topic_id}",
+            cursor,
+            limit
+        )
+        return {"items": posts, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
+
+    posts, next_cursor, prev_cursor = keyset_page\
+    (
+        db.query(*POST_COLUMNS).filter(Post.topic_id.__eq__(topic_id)),
+        [Post.id],
+        f"topic:{topic_id}",
+        cursor,
+        limit
+    )
 
-    posts = db.query(Post).filter(Post.topic_id.__eq__(topic_id)).all()
-    posts = [post for post in posts] if posts else []
-    return posts
+    return {"items": [post._asdict() for post in posts], "next_cursor": next_cursor, "prev_cursor": prev_cursor}
 
-@router.post("/{topic_id}/post", response_model=PostSchema)
+@router.get("/{topic_id}/export")
+@db_route
+def export_posts_in_topic(topic_id: int,
+                          db: Session = Depends(get_db),
+                          user: CurrentUser = Depends(get_current_user)
+) -> StreamingResponse:
+    """
+    Streams all posts of the topic as NDJSON, one post per line, in id order
+    """
+    topic = db.query(Topic).filter(Topic.id.__eq__(topic_id)).first()
+
+    verify_topic_and_access(user, topic, db)
+
+    if topic.archived:
+        posts = load_archived_topic(topic_id, db).posts
+        return StreamingResponse((dumps(post) + b"\n" for post in posts), media_type="application/x-ndjson")
+    return StreamingResponse(stream_topic_posts(topic_id), media_type="application/x-ndjson")
+
+def stream_topic_posts(topic_id: int, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """
+    Yields the topic's posts as NDJSON lines, reading them in keyset batches so memory stays flat
+    """
+    # The request's session is closed once the route returns, the stream uses its own
+    db = SessionLocal()
+    try:
+        last_id = 0
+        while True:
+            posts = db.query(*POST_COLUMNS).filter\
+            (
+                Post.topic_id.__eq__(topic_id),
+                Post.id > last_id
+            ).order_by(Post.id).limit(batch_size).all()
+
+            if not posts:
+                break
+            yield b"".join(dumps(post._asdict()) + b"\n" for post in posts)
+            last_id = posts[-1].id
+    finally:
+        db.close()
+
+@router.post("/{topic_id}/post", response_model=PostSchema, dependencies=[Depends(limit(WRITE))])
+@db_route
 def add_post(topic_id: int,
              db: Session = Depends(get_db),
-             user: Users = Depends(get_current_user),
+             user: CurrentUser = Depends(get_current_user),
              content: str = Form(...)
 ) -> PostSchema:
     """
     Adds a post to topic
     """
 
-    topic = db.query(Topic).filter(Topic.id.__eq__(topic_id)).first()
+    # Share-locked until the commit, an archive_topic in flight finishes first and the check below sees it
+    topic = db.query(Topic).filter(Topic.id.__eq__(topic_id)).with_for_update(read=True).first()
 
     verify_topic_and_access(user, topic, db)
+    if topic.archived:
+        raise topic_archived
 
     post = Post\
     (
@@ -59,13 +155,22 @@ def add_post(topic_id: int,
     )
 
     db.add(post)
+    db.flush()
+    count_new_post(post, db)
     db.commit()
     db.refresh(post)
-
-    entry = db.query(Post).filter(Post.user_id.__eq__(user.id)).all()[-1]
-
-    return PostSchema(id=entry.id,
-                      content=content,
-                      user_id=user.id,
-                      topic_id=topic.id,
-                      category_id=topic.category_id)
\ No newline at end of file
+    search_backend.index_post(post)
+    versions.bump("topic", topic.id)
+    versions.bump("category", topic.category_id)
+    versions.bump("categories")
+    trending.record(topic.id, topic.category_id, TRENDING_POST_WEIGHT)
+    mark_written(user)
+
+    new_post = PostSchema(id=post.id,
+                          content=content,
+                          user_id=user.id,
+                          topic_id=topic.id,
+                          category_id=topic.category_id)
+    hub.publish(f"topic:{topic.id}", {"type": "post", "post": new_post.model_dump()})
+
+    return new_post
\ No newline at end of file
@@ -0,0 +1,229 @@
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Callable, List
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from cache import TTLCache
+from db import run_db, SessionLocal
+from models import Post
+from realtime import hub, WORKER_ID
+from replicas import get_read_db
+from schemas import TrendingCategorySchema, TrendingTopicSchema
+from utils import CurrentUser, get_current_user, resolve_visible_categories
+from versions import visibility_key
+
+TRENDING_HALF_LIFE = float(os.getenv("TRENDING_HALF_LIFE", "21600"))  # seconds for activity to lose half its weight
+TRENDING_POST_WEIGHT = float(os.getenv("TRENDING_POST_WEIGHT", "1.0"))
+TRENDING_VOTE_WEIGHT = float(os.getenv("TRENDING_VOTE_WEIGHT", "0.25"))
+TRENDING_PUBLISH_INTERVAL = float(os.getenv("TRENDING_PUBLISH_INTERVAL", "2"))  # seconds between batches to other workers
+TRENDING_WARM_POSTS = int(os.getenv("TRENDING_WARM_POSTS", "10000"))  # latest posts ranked on startup
+TRENDING_VISIBILITY_TTL = float(os.getenv("TRENDING_VISIBILITY_TTL", "30"))  # seconds a user's visible categories are cached
+TRENDING_CHANNEL = "trending"
+TRENDING_BATCH_ENTRIES = 200  # per broker message, keeps NOTIFY payloads well under their limit
+MAX_TRENDING = 100
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    tags=["trending"]
+)
+
+
+class DecayedRanking:
+    """
+    Exponentially decaying scores kept in score order.
+    Uses forward decay: activity is stored boosted by exp(rate * (t - base)) instead of decaying every
+    score as time passes, which keeps the order stable so only the changed entry moves on an update
+    """
+
+    def __init__(self, half_life: float, on_drop: Callable[[list[int]], None] | None = None):
+        self.rate = math.log(2) / half_life
+        # Called with the ids a rebase dropped, under the ranking's lock
+        self.on_drop = on_drop
+        self.base = time.time()
+        self._scores: dict[int, float] = {}
+        self._order: list[tuple[float, int]] = []  # (-boosted score, id), best first
+        self._lock = threading.Lock()
+
+    def add(self, key: int, weight: float, at: float | None = None) -> None:
+        at = time.time() if at is None else at
+        with self._lock:
+            # Boosts grow without bound, long running processes rebase before floats overflow
+            dropped = self._rebase(at) if (at - self.base) * self.rate > 500 else []
+            old = self._scores.get(key)
+            if old is not None:
+                del self._order[bisect_left(self._order, (-old, key))]
+            new = (old or 0.0) + weight * math.exp((at - self.base) * self.rate)
+            self._scores[key] = new
+            insort(self._order, (-new, key))
+            # The id being added is back in the ranking
+            dropped = [dropped_key for dropped_key in dropped if dropped_key != key]
+            if dropped and self.on_drop:
+                self.on_drop(dropped)
+
+    def top(self, limit: int, allow: Callable[[int], bool] | None = None) -> list[tuple[int, float]]:
+        """
+        Returns up to limit (id, current score) pairs, best first, skipping ids allow() rejects
+        """
+        results = []
+        with self._lock:
+            factor = math.exp(-(time.time() - self.base) * self.rate)
+            for boosted, key in self._order:
+                if allow is None or allow(key):
+                    results.append((key, -boosted * factor))
+                    if len(results) == limit:
+                        break
+        return results
+
+    def _rebase(self, at: float) -> list[int]:
+        """
+        Moves the base to at, returns the ids dropped
+        """
+        factor = math.exp(-(at - self.base) * self.rate)
+        # Entries that have decayed to nothing are dropped, so memory follows recent activity
+        scores = {key: score * factor for key, score in self._scores.items() if score * factor > 1e-6}
+        dropped = [key for key in self._scores if key not in scores]
+        self._scores = scores
+        self._order = sorted((-score, key) for key, score in self._scores.items())
+        self.base = at
+        return dropped
+
+
+class TrendingRanker:
+    """
+    Hot topics and categories of the whole forum. Write paths record activity locally, batches of it are
+    published to the other workers through the realtime hub, so every worker ranks all activity
+    """
+
+    def __init__(self, half_life: float = TRENDING_HALF_LIFE):
+        # Topic id -> category id of the ranked topics, topics dropped from the ranking are forgotten
+        self.topic_categories: dict[int, int] = {}
+        self.topics = DecayedRanking(half_life, on_drop=self._forget_topics)
+        self.categories = DecayedRanking(half_life)
+        self._pending: dict[tuple[int, int], float] = defaultdict(float)
+        self._pending_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _forget_topics(self, topic_ids: list[int]) -> None:
+        for topic_id in topic_ids:
+            self.topic_categories.pop(topic_id, None)
+
+    def _apply(self, topic_id: int, category_id: int, weight: float, at: float | None = None) -> None:
+        self.topic_categories[topic_id] = category_id
+        self.topics.add(topic_id, weight, at)
+        self.categories.add(category_id, weight, at)
+
+    def record(self, topic_id: int, category_id: int, weight: float) -> None:
+        """
+        Records activity on a topic (a post or a vote) from this worker
+        """
+        self._apply(topic_id, category_id, weight)
+        with self._pending_lock:
+            self._pending[(topic_id, category_id)] += weight
+
+    def apply_remote(self, channel: str, data: dict, origin: str) -> None:
+        """
+        Hub listener: applies the activity batches of the other workers
+        """
+        if channel != TRENDING_CHANNEL or origin == WORKER_ID:
+            return
+        for topic_id, category_id, weight in data["activity"]:
+            self._apply(topic_id, category_id, weight, data["at"])
+
+    def publish_pending(self) -> None:
+        with self._pending_lock:
+            pending, self._pending = self._pending, defaultdict(float)
+        activity = [[topic_id, category_id, weight] for (topic_id, category_id), weight in pending.items()]
+        for start in range(0, len(activity), TRENDING_BATCH_ENTRIES):
+            hub.publish(TRENDING_CHANNEL,
+                        {"type": "trending", "at": time.time(), "activity": activity[start:start + TRENDING_BATCH_ENTRIES]})
+
+    def warm(self, db: Session) -> None:
+        """
+        Ranks the latest TRENDING_WARM_POSTS posts so a restarted worker doesn't start empty,
+        each decayed from the time it was posted
+        """
+        for topic_id, category_id, created_at in db.query(Post.topic_id, Post.category_id, Post.created_at)\
+                .order_by(Post.id.desc()).limit(TRENDING_WARM_POSTS):
+            self._apply(topic_id, category_id, TRENDING_POST_WEIGHT, created_at.timestamp())
+
+    def _run(self) -> None:
+        while not self._stopping.wait(TRENDING_PUBLISH_INTERVAL):
+            self.publish_pending()
+
+    def start(self) -> None:
+        db = SessionLocal()
+        try:
+            self.warm(db)
+        except Exception:
+            logger.exception("Warming the trending ranking failed, starting empty")
+        finally:
+            db.close()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="trending-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.publish_pending()
+
+
+trending = TrendingRanker()
+hub.add_listener(trending.apply_remote)
+
+# Visible category ids per visibility_key, so serving the ranking needs no query
+visible_categories_cache = TTLCache(maxsize=10000, ttl=TRENDING_VISIBILITY_TTL)
+
+async def visible_category_ids(user: CurrentUser, db: Session) -> set[int] | None:
+    """
+    Returns the ids of the categories the user can see, None for admins who see all
+    """
+    if user.admin:
+        return None
+    key = visibility_key(user)
+    visible = visible_categories_cache.get(key)
+    if visible is None:
+        visible = await run_db(db, lambda session: {category.id for category in resolve_visible_categories(user, session)})
+        visible_categories_cache.set(key, visible)
+    return visible
+
+@router.get("/topics", response_model=List[TrendingTopicSchema])
+async def get_trending_topics(limit: int = Query(20, ge=1, le=MAX_TRENDING),
+                              db: Session = Depends(get_read_db),
+                              user: CurrentUser = Depends(get_current_user)
+) -> list:
+    """
+    Lists the hottest topics the user can see, by recent posts and votes with time decay
+    """
+    visible = await visible_category_ids(user, db)
+    allow = None if visible is None else lambda topic_id: trending.topic_categories.get(topic_id) in visible
+    # A topic dropped by a rebase since top() has no category anymore and is left out
+    return\
+    [
+        {"topic_id": topic_id, "category_id": category_id, "score": score}
+        for topic_id, score in trending.topics.top(limit, allow)
+        if (category_id := trending.topic_categories.get(topic_id)) is not None
+    ]
+
+@router.get("/categories", response_model=List[TrendingCategorySchema])
+async def get_trending_categories(limit: int = Query(20, ge=1, le=MAX_TRENDING),
+                                  db: Session = Depends(get_read_db),
+                                  user: CurrentUser = Depends(get_current_user)
+) -> list:
+    """
+    Lists the hottest categories the user can see
+    """
+    visible = await visible_category_ids(user, db)
+    allow = None if visible is None else visible.__contains__
+    return [{"category_id": category_id, "score": score} for category_id, score in trending.categories.top(limit, allow)]
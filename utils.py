@@ -1,13 +1,17 @@
-import hashlib
+import os
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Type
 
 import jwt
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import and_, event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from db import get_db
+from cache import TTLCache
+from db import get_db, run_db
 from models import Users, Category, CategoryAccessPrivilege, Topic
 from schemas import UserCreate
 
@@ -16,6 +20,9 @@ from schemas import UserCreate
 SECRET_KEY = "test-key"
 ALGORITHM = "HS256"
 
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))  # seconds
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 access_denied = HTTPException \
@@ -30,12 +37,6 @@ not_found = HTTPException \
         detail="The requested resource could not be found."
 )
 
-def hash_password(password: str) -> str:
-    """
-    Hashes a password
-    """
-    return hashlib.sha256(password.encode()).hexdigest()
-
 def create_access_token(data: dict) -> str:
     """
     Creates an access token for the provided user (data)
@@ -46,9 +47,46 @@ def create_access_token(data: dict) -> str:
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme),
-                     db: Session = Depends(get_db)
-) -> Type[Users]:
+@dataclass(frozen=True)
+class CurrentUser:
+    """
+    The verified caller of a request, as cached by get_current_user
+    """
+    id: int
+    username: str
+    admin: bool
+
+# Username -> CurrentUser, so authenticated requests don't need a users lookup
+principal_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
+def invalidate_user(username: str) -> None:
+    """
+    Drops the cached principal of a user, must be called whenever a user is changed or deleted.
+    ORM flushes call it through the events below,
+    bulk query(Users).update()/delete() calls and raw SQL must call it themselves
+    """
+    principal_cache.pop(username)
+
+@event.listens_for(Users, "after_update")
+@event.listens_for(Users, "after_delete")
+def _invalidate_changed_user(mapper, connection, target: Users) -> None:
+    # Covers ORM updates/deletes made by this process, a renamed user is dropped under both names
+    invalidate_user(target.username)
+    for username in inspect(target).attrs.username.history.deleted:
+        invalidate_user(username)
+
+def load_principal(username: str, db: Session) -> CurrentUser | None:
+    """
+    Loads the id/username/admin flag of a user from the database
+    """
+    user = db.query(Users.id, Users.username, Users.admin).filter(Users.username.__eq__(username)).first()
+    if user is None:
+        return None
+    return CurrentUser(id=user.id, username=user.username, admin=user.admin)
+
+async def get_current_user(token: str = Depends(oauth2_scheme),
+                           db: Session | AsyncSession = Depends(get_db)
+) -> CurrentUser:
     """
     Checks if the provided access token is invalid or expired and returns user data if valid
     """
@@ -63,12 +101,18 @@ def get_current_user(token: str = Depends(oauth2_scheme),
     except jwt.InvalidTokenError:
         raise access_denied
 
-    user = db.query(Users).filter(Users.username.__eq__(username)).first()
-    if user is None:
+    principal = principal_cache.get(username)
+    if principal is not None:
+        return principal
+
+    principal = await run_db(db, lambda session: load_principal(username, session))
+    if principal is None:
         raise access_denied
-    return user
 
-def get_admin(current_user: Users = Depends(get_current_user)) -> Users | None:
+    principal_cache.set(username, principal)
+    return principal
+
+def get_admin(current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser | None:
     """
     Checks if user is logged in and if so, verifies that 'admin' is 1/True or raises an error
     """
@@ -79,32 +123,70 @@ def get_admin(current_user: Users = Depends(get_current_user)) -> Users | None:
 
 # CONTENT
 
-def can_user_see_category(user: Users,
+def is_category_visible(user: CurrentUser, visibility: bool, permission_type: str | None) -> bool:
+    """
+    Applies the visibility rules to a category's visibility flag and the user's privilege for it (None if no such)
+    """
+    # Privileges will be 0/1 or False/True and None when general such apply
+    # Admins can see all
+    if user.admin:
+        return True
+    if permission_type is None:
+        return bool(visibility)
+    return bool(visibility and permission_type)
+
+def resolve_visible_categories(user: CurrentUser,
+                               db: Session,
+                               category_ids: list[int] | None = None
+) -> list[Type[Category]]:
+    """
+    Returns the categories (all or only the provided ids) the user can see, resolved with a single query
+    """
+    if user.admin:
+        query = db.query(Category)
+        if category_ids is not None:
+            query = query.filter(Category.id.in_(category_ids))
+        return query.all()
+
+    # The user's privilege (if any) is joined onto each category so no per-category lookup is needed
+    query = db.query(Category, CategoryAccessPrivilege.permission_type).outerjoin\
+    (
+        CategoryAccessPrivilege,
+        and_(
+            CategoryAccessPrivilege.category_id.__eq__(Category.id),
+            CategoryAccessPrivilege.user_id.__eq__(user.id)
+        )
+    )
+    if category_ids is not None:
+        query = query.filter(Category.id.in_(category_ids))
+
+    return\
+    [
+        category for category, permission_type in query.all()
+        if is_category_visible(user, category.visibility, permission_type)
+    ]
+
+def can_user_see_category(user: CurrentUser,
                           category: Type[Category],
                           db: Session
 ) -> bool:
     """
     Checks if user is logged in, if so checks if they have the permission to view the category
     """
-    # Privileges will be 0/1 or False/True and None when general such apply
-    # Admins can see all
     if user.admin:
         return True
 
-    privilege = db.query(CategoryAccessPrivilege).filter\
+    permission_type = db.query(CategoryAccessPrivilege.permission_type).filter\
     (
         CategoryAccessPrivilege.user_id.__eq__(user.id),
         CategoryAccessPrivilege.category_id.__eq__(category.id)
-    ).first()
+    ).scalar()
 
-    if not privilege:
-        return bool(category.visibility)
-    return category.visibility and privilege.permission_type
+    return is_category_visible(user, category.visibility, permission_type)
 
-def can_user_see_topic(user: Users, topic: Type[Topic], db: Session) -> bool:
+def can_user_see_topic(user: CurrentUser, topic: Type[Topic], db: Session) -> bool:
     if topic:
-        category = db.query(Category).filter(Category.id.__eq__(topic.category_id)).first()
-        if not can_user_see_category(user, category, db):
+        if not resolve_visible_categories(user, db, [topic.category_id]):
             raise access_denied
         return True
-    raise not_found
\ No newline at end of file
+    raise not_found
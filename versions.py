@@ -0,0 +1,108 @@
+import hashlib
+import os
+import secrets
+import threading
+from functools import lru_cache
+from typing import Any, Callable
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from cache import TTLCache
+from db import run_db
+from encoding import EncodedBody, dumps, pick_encoding
+from utils import CurrentUser
+
+LISTING_CACHE_SIZE = int(os.getenv("LISTING_CACHE_SIZE", "5000"))
+# Bounds how long another worker's writes can go unnoticed, versions are per process
+LISTING_CACHE_TTL = float(os.getenv("LISTING_CACHE_TTL", "5"))  # seconds
+
+
+class VersionRegistry:
+    """
+    Per-process version counters of cached scopes ("categories", "category" or "topic" + id), bumped on every write
+    """
+
+    def __init__(self):
+        # ETags of different processes/restarts never match each other
+        self.epoch = secrets.token_hex(8)
+        self.generation = 0
+        self._versions: dict[tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, scope_id: int = 0) -> tuple[int, int]:
+        return self.generation, self._versions.get((kind, scope_id), 0)
+
+    def bump(self, kind: str, scope_id: int = 0) -> None:
+        with self._lock:
+            self._versions[(kind, scope_id)] = self._versions.get((kind, scope_id), 0) + 1
+
+    def bump_all(self) -> None:
+        """
+        Invalidates every scope, e.g. after a bulk import
+        """
+        with self._lock:
+            self.generation += 1
+
+
+versions = VersionRegistry()
+listing_cache = TTLCache(maxsize=LISTING_CACHE_SIZE, ttl=LISTING_CACHE_TTL)
+
+@lru_cache
+def _adapter(schema: Any) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+def visibility_key(user: CurrentUser) -> str:
+    """
+    What a listing's visibility depends on: admins see everything, anyone else has their own privileges
+    """
+    return "admin" if user.admin else f"user:{user.id}"
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    return etag in candidates or "*" in candidates
+
+async def cached_listing(request: Request,
+                         user: CurrentUser,
+                         scope: tuple[str, int],
+                         schema: Any,
+                         db: Session | AsyncSession,
+                         build: Callable[[Session], Any]
+) -> Response:
+    """
+    Serves a listing from the version-keyed cache with a strong ETag, 304 when the client's copy is current.
+    build(session) does the access checks and queries, it only runs (through run_db) on a cache miss.
+    Its result is validated and serialized through schema, or with schema None it's plain data (rows' _asdict())
+    encoded as it is. Bodies are compressed as Accept-Encoding allows, once per cache entry
+    """
+    key = (scope, versions.get(*scope), visibility_key(user), tuple(sorted(request.query_params.items())))
+
+    body = listing_cache.get(key)
+    cached = body is not None
+    if body is None:
+        listing = await run_db(db, build)
+        if schema is None:
+            body = EncodedBody(dumps(listing))
+        else:
+            adapter = _adapter(schema)
+            body = EncodedBody(adapter.dump_json(adapter.validate_python(listing, from_attributes=True)))
+        listing_cache.set(key, body)
+
+    content, encoding = body.variant(pick_encoding(request))
+    # Every encoding is a representation of its own, with its own strong ETag
+    digest = hashlib.sha1(f"{versions.epoch}:{key!r}".encode()).hexdigest()
+    etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+
+    # A matching ETag is only trusted while the entry is cached, which bounds staleness to the cache TTL
+    if cached and etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type="application/json", headers=headers)
@@ -0,0 +1,246 @@
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Callable
+
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.orm import Session
+
+from db import SessionLocal, dialect_insert
+from models import Post, PostInteraction
+
+# Opt-in write-behind mode: votes are buffered in memory and written in batches
+VOTE_WRITE_BEHIND = os.getenv("VOTE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+VOTE_FLUSH_INTERVAL = float(os.getenv("VOTE_FLUSH_INTERVAL", "0.5"))  # seconds
+VOTE_FLUSH_SIZE = int(os.getenv("VOTE_FLUSH_SIZE", "1000"))  # buffered votes that trigger an early flush
+
+logger = logging.getLogger(__name__)
+
+def vote_delta(old_vote: bool | None, new_vote: bool | None) -> tuple[int, int]:
+    """
+    Returns the (upvotes, downvotes) change caused by replacing old_vote with new_vote
+    """
+    upvotes = (new_vote is True) - (old_vote is True)
+    downvotes = (new_vote is False) - (old_vote is False)
+    return upvotes, downvotes
+
+def apply_vote_counters(post_id: int, upvotes: int, downvotes: int, db: Session) -> None:
+    """
+    Adds the given deltas to the post's vote counters with a single atomic UPDATE
+    """
+    if not upvotes and not downvotes:
+        return
+    db.query(Post).filter(Post.id.__eq__(post_id)).update\
+    (
+        {
+            Post.upvotes: Post.upvotes + upvotes,
+            Post.downvotes: Post.downvotes + downvotes,
+            Post.score: Post.score + upvotes - downvotes
+        },
+        synchronize_session=False
+    )
+
+def apply_vote(post_id: int, user_id: int, vote: bool | None, db: Session) -> bool | None:
+    """
+    Sets (True/False) or removes (None) the user's vote and updates the post counters in the same transaction.
+    Returns the previous vote. The caller commits.
+    """
+    # Lock the user's vote row so concurrent requests from the same user can't double count
+    interaction = db.query(PostInteraction).filter\
+    (
+        PostInteraction.post_id.__eq__(post_id),
+        PostInteraction.user_id.__eq__(user_id)
+    ).with_for_update().first()
+
+    old_vote = interaction.vote if interaction else None
+
+    if vote is None:
+        if interaction:
+            db.delete(interaction)
+    elif interaction:
+        interaction.vote = vote
+    else:
+        db.add(PostInteraction(vote=vote, post_id=post_id, user_id=user_id))
+    db.flush()
+
+    apply_vote_counters(post_id, *vote_delta(old_vote, vote), db)
+    return old_vote
+
+NO_PENDING_VOTES = (0, 0, False, None)
+
+
+class VoteBuffer:
+    """
+    Collects votes in memory, keeping only the latest vote per (post, user), and writes them in batches
+    with INSERT ... ON CONFLICT (post_id, user_id) plus one counter UPDATE per post
+    """
+
+    def __init__(self,
+                 flush_interval: float = VOTE_FLUSH_INTERVAL,
+                 flush_size: int = VOTE_FLUSH_SIZE,
+                 session_factory: Callable[[], Session] = SessionLocal):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.session_factory = session_factory
+        # post_id -> user_id -> (vote stored in the database when first buffered, latest vote), by post so views
+        # only look at the votes on their posts
+        self._pending: dict[int, dict[int, tuple[bool | None, bool | None]]] = {}
+        self._pending_count = 0
+        # Votes taken by a running flush, still visible to readers until committed
+        self._flushing: dict[int, dict[int, tuple[bool | None, bool | None]]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def add(self, post_id: int, user_id: int, stored_vote: bool | None, vote: bool | None) -> None:
+        """
+        Buffers a vote (None removes it), stored_vote is the user's vote currently in the database
+        """
+        with self._lock:
+            votes = self._pending.setdefault(post_id, {})
+            if user_id in votes:
+                stored_vote = votes[user_id][0]
+            else:
+                self._pending_count += 1
+                if user_id in self._flushing.get(post_id, {}):
+                    stored_vote = self._flushing[post_id][user_id][1]
+            votes[user_id] = (stored_vote, vote)
+            if self._pending_count >= self.flush_size:
+                self._wakeup.set()
+
+    def pending_view(self, post_id: int, user_id: int) -> tuple[int, int, bool, bool | None]:
+        """
+        Returns the not yet written (upvotes, downvotes) change of a post and whether/how the user has a buffered vote
+        """
+        return self.pending_views([post_id], user_id).get(post_id, NO_PENDING_VOTES)
+
+    def pending_views(self, post_ids: list[int], user_id: int) -> dict[int, tuple[int, int, bool, bool | None]]:
+        """
+        pending_view for many posts under one lock, only posts with buffered votes are returned
+        """
+        views: dict[int, list] = {}
+        with self._lock:
+            for post_id in set(post_ids):
+                for buffered in (self._flushing, self._pending):
+                    for voter, (stored_vote, vote) in buffered.get(post_id, {}).items():
+                        view = views.setdefault(post_id, [0, 0, False, None])
+                        if voter == user_id:
+                            view[2], view[3] = True, vote
+                        up, down = vote_delta(stored_vote, vote)
+                        view[0] += up
+                        view[1] += down
+        # A vote in both buffers adds stored -> flushing and flushing -> latest, i.e. its whole change
+        return {post_id: tuple(view) for post_id, view in views.items()}
+
+    def flush(self) -> int:
+        """
+        Writes all buffered votes in one transaction and returns how many were written
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._flushing, self._pending, self._pending_count = self._pending, {}, 0
+                batch = {(post_id, user_id): vote
+                         for post_id, votes in self._flushing.items() for user_id, (_, vote) in votes.items()}
+            if not batch:
+                return 0
+
+            db = self.session_factory()
+            try:
+                write_votes(db, batch)
+                db.commit()
+            except Exception:
+                db.rollback()
+                logger.exception("Writing %d buffered votes failed, retrying on the next flush", len(batch))
+                with self._lock:
+                    # Newer votes for the same key win over the failed ones, the stored vote stays the original
+                    for post_id, votes in self._pending.items():
+                        failed = self._flushing.setdefault(post_id, {})
+                        for user_id, (stored_vote, vote) in votes.items():
+                            if user_id in failed:
+                                stored_vote = failed[user_id][0]
+                            failed[user_id] = (stored_vote, vote)
+                    self._pending, self._flushing = self._flushing, {}
+                    self._pending_count = sum(len(votes) for votes in self._pending.values())
+                return 0
+            finally:
+                db.close()
+
+            with self._lock:
+                self._flushing = {}
+            return len(batch)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="vote-buffer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the flush thread and writes whatever is still buffered
+        """
+        if self._thread is not None:
+            self._stopped.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+def write_votes(db: Session, votes: dict[tuple[int, int], bool | None]) -> None:
+    """
+    Upserts/deletes a batch of (post_id, user_id) -> vote and applies the counter changes, the caller commits
+    """
+    # Posts archived since their votes were buffered are gone, those votes are dropped instead of failing the batch
+    live = set(db.scalars(select(Post.id).where(Post.id.in_({post_id for post_id, _ in votes})).with_for_update()))
+    votes = {key: vote for key, vote in votes.items() if key[0] in live}
+    if not votes:
+        return
+
+    keys = list(votes)
+    # The votes actually stored decide the counter deltas, they're locked until commit
+    stored = dict\
+    (
+        ((post_id, user_id), vote) for post_id, user_id, vote in db.execute
+        (
+            select(PostInteraction.post_id, PostInteraction.user_id, PostInteraction.vote)
+            .where(tuple_(PostInteraction.post_id, PostInteraction.user_id).in_(keys))
+            .with_for_update()
+        )
+    )
+
+    upserts = [{"post_id": post_id, "user_id": user_id, "vote": vote}
+               for (post_id, user_id), vote in votes.items() if vote is not None]
+    removals = [key for key, vote in votes.items() if vote is None and key in stored]
+
+    if upserts:
+        statement = dialect_insert(db, PostInteraction)
+        db.execute\
+        (
+            statement.on_conflict_do_update
+            (
+                index_elements=[PostInteraction.post_id, PostInteraction.user_id],
+                set_={"vote": statement.excluded.vote}
+            ),
+            upserts
+        )
+    if removals:
+        db.execute(delete(PostInteraction).where(tuple_(PostInteraction.post_id, PostInteraction.user_id).in_(removals)))
+
+    deltas: dict[int, list[int]] = defaultdict(lambda: [0, 0])
+    for (post_id, user_id), vote in votes.items():
+        upvotes, downvotes = vote_delta(stored.get((post_id, user_id)), vote)
+        deltas[post_id][0] += upvotes
+        deltas[post_id][1] += downvotes
+    for post_id, (upvotes, downvotes) in deltas.items():
+        apply_vote_counters(post_id, upvotes, downvotes, db)
+
+vote_buffer = VoteBuffer() if VOTE_WRITE_BEHIND else None
@@ -0,0 +1,145 @@
+import logging
+import os
+import time
+
+from fastapi import HTTPException
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session, configure_mappers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from categories import list_topics_in_category
+from db import DB_POOL_SIZE, SessionLocal, AsyncSessionLocal, engine, async_engine
+from models import Post
+from posts import get_visible_post
+from replicas import replica_set
+from topics import list_posts_in_topic
+from utils import CurrentUser, load_principal, resolve_visible_categories
+
+WARMUP = os.getenv("WARMUP", "true").lower() in ("1", "true", "yes")
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", str(DB_POOL_SIZE)))  # connections opened per pool at startup
+
+# The hot statements differ for admins and everyone else, id 0 is no real user
+WARMUP_USERS = (CurrentUser(id=0, username="", admin=False), CurrentUser(id=0, username="", admin=True))
+
+logger = logging.getLogger(__name__)
+
+startup_report: dict = {"warmed": False}
+
+
+def open_connections(pool_engine: Engine, count: int) -> None:
+    """
+    Checks out count connections at once, so the pool opens that many, and returns them to it
+    """
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(pool_engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+async def open_async_connections(pool_engine: AsyncEngine, count: int) -> None:
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(await pool_engine.connect())
+    finally:
+        for connection in connections:
+            await connection.close()
+
+def run_hot_statements(db: Session) -> None:
+    """
+    Runs every hot query shape once, so SQLAlchemy has compiled and cached them (per engine) before the first request.
+    Uses the first existing post, topic and category, only reading them
+    """
+    load_principal("", db)
+    sample = db.query(Post.id, Post.topic_id, Post.category_id).order_by(Post.id).first()
+    post_id, topic_id, category_id = sample or (0, 0, 0)
+
+    for user in WARMUP_USERS:
+        resolve_visible_categories(user, db)
+        for build in\
+        (
+            lambda: list_topics_in_category(category_id, None, 1, db, user),
+            lambda: list_posts_in_topic(topic_id, None, 1, db, user),
+            lambda: get_visible_post(post_id, user, db)
+        ):
+            try:
+                build()
+            except HTTPException:
+                # Hidden from the stand-in user (or an empty database), the statements ran up to the check
+                pass
+    db.rollback()
+
+async def warm_up() -> None:
+    """
+    Startup hook: opens WARMUP_CONNECTIONS connections in every pool, configures the mappers and compiles the hot
+    statements on every engine, recording how long each step took in startup_report
+    """
+    if not WARMUP:
+        return
+    timings = {}
+    try:
+        start = time.perf_counter()
+        open_connections(engine, WARMUP_CONNECTIONS)
+        if async_engine is not None:
+            await open_async_connections(async_engine, WARMUP_CONNECTIONS)
+        for replica in replica_set.replicas:
+            if replica.healthy:
+                open_connections(replica.engine, WARMUP_CONNECTIONS)
+        timings["connections_ms"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        configure_mappers()
+        timings["mappers_ms"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        sessionmakers = [SessionLocal] + [replica.sessionmaker for replica in replica_set.replicas if replica.healthy]
+        for sessionmaker in sessionmakers:
+            with sessionmaker() as db:
+                run_hot_statements(db)
+        if async_engine is not None:
+            async with AsyncSessionLocal() as db:
+                await db.run_sync(run_hot_statements)
+        timings["statements_ms"] = (time.perf_counter() - start) * 1000
+    except Exception:
+        # The steps that finished are still reported, warmed stays false
+        startup_report.update(timings)
+        logger.exception("Warming up failed, the first requests will be slower")
+        return
+
+    startup_report.update(timings, warmed=True)
+    logger.info("Warmed up in %.1f ms (%s)", sum(timings.values()),
+                ", ".join(f"{step} {ms:.1f}" for step, ms in timings.items()))
+
+def record_startup(started: float) -> None:
+    """
+    Records how long the app took from the start of its lifespan (perf_counter started) to serving
+    """
+    startup_report["startup_ms"] = (time.perf_counter() - started) * 1000
+    logger.info("Ready to serve after %.1f ms", startup_report["startup_ms"])
+
+
+class FirstRequestTimer:
+    """
+    Records the latency of the first HTTP request the process serves, the one a cold start would slow down
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.timed = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.timed or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self.timed = True
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            startup_report.update(first_request_ms=elapsed, first_request=f"{scope['method']} {scope['path']}")
+            logger.info("First request %s %s took %.1f ms", scope["method"], scope["path"], elapsed)